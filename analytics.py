@@ -0,0 +1,144 @@
+from typing import Iterable, List
+
+import pandas as pd
+
+from normalize import VALID_GRADES
+from schedule import DAY_NAMES, class_slots
+
+UNKNOWN = 'Unknown'
+UNSPECIFIED_PROGRAM = 'Unspecified'
+
+
+def _frame(rows: Iterable[dict], columns: List[str]) -> pd.DataFrame:
+    """Column-wise construction: several times faster than DataFrame(list_of_dicts) on big tables."""
+    rows = list(rows)
+    return pd.DataFrame({column: [row.get(column) for row in rows] for column in columns}, columns=columns)
+
+
+def _pct(part, whole):
+    return round(100.0 * float(part) / float(whole), 1) if whole else None
+
+
+def _records(frame: pd.DataFrame) -> List[dict]:
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+
+def enrollment_analytics(students: Iterable[dict], classes: Iterable[dict], class_students: Iterable[dict],
+                         teachers: Iterable[dict], classrooms: Iterable[dict]) -> dict:
+    """Dashboard figures from the raw tables: grade counts, enrollment against max_size per class and
+    per term/block, program mix, teacher load and classroom use per day/block.
+
+    Every figure comes from groupbys over two frames: enrollments joined to their class and student,
+    and one row per (class, semester, day, block) the class meets in.
+    """
+    students = _frame(students, ['student_id', 'grade_level'])
+    classes = _frame(classes, ['class_id', 'name', 'days', 'teacher_id', 'max_size', 'term', 'schedule_block',
+                               'classroom_id'])
+    enrollments = _frame(class_students, ['class_id', 'student_id', 'program_type'])
+    teachers = _frame(teachers, ['teacher_id', 'first_name', 'last_name'])
+    classrooms = _frame(classrooms, ['classroom_id', 'building_number', 'room_number'])
+
+    students['grade'] = students['grade_level'].where(students['grade_level'].isin(VALID_GRADES), UNKNOWN)
+    classes['max_size'] = pd.to_numeric(classes['max_size'], errors='coerce')
+    enrollments['program_type'] = enrollments['program_type'].fillna(UNSPECIFIED_PROGRAM).replace('', UNSPECIFIED_PROGRAM)
+    # Lookups by id instead of merges, and integer student codes so distinct counts don't hash strings
+    enrollments = enrollments[enrollments['class_id'].isin(classes['class_id'])].copy()
+    enrollments['grade'] = enrollments['student_id'].map(students.set_index('student_id')['grade']).fillna(UNKNOWN)
+    enrollments['teacher_id'] = enrollments['class_id'].map(classes.set_index('class_id')['teacher_id'])
+    enrollments['student'] = pd.factorize(enrollments['student_id'])[0]
+
+    # One row per slot a class meets in; term 'Both' meets in both semesters
+    slots = pd.DataFrame(
+        [(cls['class_id'], cls['teacher_id'], cls['classroom_id'], semester, day, block)
+         for cls in classes.to_dict('records') for semester, day, block in class_slots(cls)],
+        columns=['class_id', 'teacher_id', 'classroom_id', 'semester', 'day', 'block'])
+
+    # Classes against capacity
+    enrolled = enrollments.groupby('class_id').size().rename('enrolled')
+    class_days = slots.groupby('class_id')['day'].nunique().rename('days_per_week')
+    class_blocks = slots.groupby('class_id')['block'].agg(lambda b: ', '.join(str(v) for v in sorted(set(b)))).rename('blocks')
+    capacity = (classes.set_index('class_id')
+                .join([enrolled, class_days, class_blocks])
+                .fillna({'enrolled': 0, 'days_per_week': 0, 'blocks': ''})
+                .reset_index())
+    capacity['enrolled'] = capacity['enrolled'].astype(int)
+    capacity['days_per_week'] = capacity['days_per_week'].astype(int)
+    capacity['seats_left'] = capacity['max_size'] - capacity['enrolled']
+    capacity['fill_pct'] = (100.0 * capacity['enrolled'] / capacity['max_size'].where(capacity['max_size'] > 0)).round(1)
+    capacity['status'] = 'open'
+    capacity.loc[capacity['seats_left'] == 0, 'status'] = 'full'
+    capacity.loc[capacity['seats_left'] < 0, 'status'] = 'over'
+    capacity.loc[capacity['max_size'].isna(), 'status'] = 'no limit'
+    teacher_names = teachers.set_index('teacher_id').apply(lambda t: f"{t['last_name']}, {t['first_name']}", axis=1)
+    capacity['teacher'] = capacity['teacher_id'].map(teacher_names) if len(teachers) else None
+    capacity = capacity.sort_values(['fill_pct', 'name'], ascending=[False, True], na_position='last')
+
+    term_block = capacity.assign(blocks=capacity['blocks'].replace('', UNKNOWN)).groupby(['term', 'blocks'], dropna=False).agg(
+        classes=('class_id', 'size'), enrolled=('enrolled', 'sum'), seats=('max_size', 'sum'),
+        over_capacity=('status', lambda s: int((s == 'over').sum()))).reset_index()
+    term_block['fill_pct'] = (100.0 * term_block['enrolled'] / term_block['seats'].where(term_block['seats'] > 0)).round(1)
+
+    # Students per grade, with how many of them are enrolled anywhere
+    grade_order = VALID_GRADES + [UNKNOWN]
+    grades = pd.DataFrame({
+        'students': students.groupby('grade').size(),
+        'enrolled_students': enrollments.groupby('grade')['student'].nunique(),
+        'enrollments': enrollments.groupby('grade').size(),
+    }).reindex(grade_order).dropna(how='all').fillna(0).astype(int).rename_axis('grade').reset_index()
+
+    programs = enrollments.groupby('program_type').size().rename('enrollments').reset_index()
+    programs['share_pct'] = programs['enrollments'].map(lambda n: _pct(n, len(enrollments)))
+    programs = programs.sort_values('enrollments', ascending=False)
+
+    # Teacher load: classes, class-days per week (classes x days) and distinct students
+    teacher_load = pd.DataFrame({
+        'classes': classes.groupby('teacher_id').size(),
+        'class_days': capacity.groupby('teacher_id')['days_per_week'].sum(),
+        'weekly_blocks': slots[slots['semester'] == 1].groupby('teacher_id').size(),
+        'students': enrollments.groupby('teacher_id')['student'].nunique(),
+    }).fillna(0).astype(int)
+    teacher_load['teacher'] = teacher_load.index.map(lambda t: teacher_names.get(t, t) if len(teachers) else t)
+    teacher_load = teacher_load.reset_index().sort_values(['class_days', 'teacher'], ascending=[False, True])
+
+    # Classroom use: blocks booked per day (semester 1 view) and share of all day/block slots
+    room_names = classrooms.set_index('classroom_id').apply(
+        lambda r: f"{r['building_number']} {r['room_number']}", axis=1) if len(classrooms) else pd.Series(dtype=object)
+    days = sorted(set(DAY_NAMES) | set(slots['day']))
+    blocks = sorted(set(slots['block']))
+    booked = slots.dropna(subset=['classroom_id']).loc[lambda s: s['classroom_id'] != '']
+    per_day = booked.groupby(['classroom_id', 'semester', 'day'])['block'].nunique()
+    rooms = []
+    for classroom_id, name in room_names.sort_values().items():
+        room_slots = booked[booked['classroom_id'] == classroom_id]
+        occupied = room_slots[['semester', 'day', 'block']].drop_duplicates()
+        rooms.append({
+            'classroom_id': classroom_id, 'classroom': name,
+            'by_day': [int(per_day.get((classroom_id, 1, day), 0)) for day in days],
+            'utilization_pct': _pct(len(occupied), 2 * len(days) * len(blocks)),
+        })
+
+    total_seats = capacity['max_size'].sum()
+    summary = {
+        'students': len(students),
+        'enrolled_students': int(enrollments['student'].nunique()),
+        'classes': len(classes),
+        'enrollments': len(enrollments),
+        'seats': int(total_seats) if pd.notna(total_seats) else 0,
+        'fill_pct': _pct(capacity.loc[capacity['max_size'].notna(), 'enrolled'].sum(), total_seats),
+        'over_capacity': int((capacity['status'] == 'over').sum()),
+        'full': int((capacity['status'] == 'full').sum()),
+        'unscheduled': int((capacity['days_per_week'] == 0).sum()),
+    }
+    return {
+        'summary': summary,
+        'grades': _records(grades),
+        'classes': _records(capacity[['class_id', 'name', 'term', 'blocks', 'teacher', 'enrolled', 'max_size',
+                                      'seats_left', 'fill_pct', 'status']]),
+        'term_blocks': _records(term_block),
+        'programs': _records(programs),
+        'teachers': _records(teacher_load[['teacher_id', 'teacher', 'classes', 'class_days', 'weekly_blocks',
+                                           'students']]),
+        'rooms': rooms,
+        'days': [DAY_NAMES.get(day, f'Day {day}') for day in days],
+        'blocks': blocks,
+    }
@@ -1,6 +1,10 @@
 import logging
 from logging.handlers import RotatingFileHandler
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_file, stream_template, stream_with_context
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import parse_cookie
+from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask_bcrypt import Bcrypt
 from supabase import create_client, Client
@@ -11,7 +15,33 @@ import pandas as pd
 import io
 import uuid
 import re
-from typing import List, Optional
+import hashlib
+import json
+import tempfile
+import threading
+import time
+import zlib
+import itertools
+from analytics import enrollment_analytics
+from auth import LoginOverloaded, PasswordVerifier, hash_cost, window_limiter
+from cascade import CASCADE_DELETES, bulk_delete
+from dedup import DedupIndex, email_key, name_key
+from enrollment import SeatLocks, WAITLIST_TABLE, change_roster, is_missing_table
+from normalize import (clean_string_series, format_phone, format_phone_series, normalize_grade_level,
+                       normalize_grade_series, normalize_term as normalize_csv_term, parse_student_name, parse_student_name_series,
+                       strip_bracket_code)
+from db_functions import FunctionUnavailable, call_function
+from models import Classroom, Parent, Student, Teacher, classes_from_embedded, students_from_embedded
+from pricing import (PROGRAM_TYPES, TUITION_LEDGER_FUNCTION, compute_tuition_ledger, get_pricing_table,
+                     ledger_function_params, load_pricing_table, scope_ledger, sqlite_tuition_ledger)
+from profiler import ProfilerMiddleware, RequestProfiler, route_summaries
+from replica import ReadReplica, students_with_parents
+from rollover import apply_rollover, plan_rollover
+from schedule import DAY_NAMES, TERM_SEMESTERS, ScheduleIndex, describe_conflicts
+from search import SEARCH_ENTITIES, SearchIndex
+from sections import apply_sections, course_sections, load_section_classes, load_waitlists, plan_sections
+from snapshot import SNAPSHOT_TABLES, default_snapshot_dir, iter_table_csv, iter_table_rows, snapshot_file, write_snapshot
+from versions import bump_version, data_version, on_bump
 
 # Configure logging
 logging.basicConfig(
@@ -29,10 +59,56 @@ app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'default-secret-key')
 
 # Initialize Bcrypt and LoginManager
+# Cost for new hashes; existing hashes at another cost are upgraded on the user's next login
+app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', '12'))
 bcrypt = Bcrypt(app)
+# Password checks run on their own small pool; login attempts are throttled before any hashing
+password_verifier = PasswordVerifier(bcrypt.check_password_hash, bcrypt.generate_password_hash,
+                                     workers=int(os.getenv('LOGIN_HASH_WORKERS', '2')),
+                                     max_queue=int(os.getenv('LOGIN_HASH_QUEUE', '32')))
+# Failed logins per email and per client IP, counted in files shared by this host's workers
+LOGIN_WINDOW_SECONDS = int(os.getenv('LOGIN_WINDOW_SECONDS', '300'))
+LOGIN_THROTTLE_FILE = os.getenv('LOGIN_THROTTLE_FILE', os.path.join(tempfile.gettempdir(), 'school-admin-login'))
+login_email_limiter = window_limiter(int(os.getenv('LOGIN_MAX_PER_EMAIL', '5')), LOGIN_WINDOW_SECONDS,
+                                     f"{LOGIN_THROTTLE_FILE}-email")
+login_ip_limiter = window_limiter(int(os.getenv('LOGIN_MAX_PER_IP', '30')), LOGIN_WINDOW_SECONDS,
+                                  f"{LOGIN_THROTTLE_FILE}-ip")
 login_manager = LoginManager(app)
 login_manager.login_view = 'login'
 
+# Sampled request profiling, switched on from /admin/profiles; a clock check per request while off
+request_profiler = RequestProfiler(os.getenv('PROFILE_DIR', 'profiles'),
+                                   ring_size=int(os.getenv('PROFILE_RING_SIZE', '50')))
+
+def profile_route_name(environ):
+    try:
+        return app.url_map.bind_to_environ(environ).match()[0]
+    except HTTPException:
+        return environ.get('PATH_INFO', '')
+
+# ?profile=1 / X-Profile: 1 only count from a browser holding the signed cookie /admin/profiles
+# hands its admins; the middleware runs before the session is loaded, so it checks that cookie
+PROFILE_FORCE_COOKIE = 'profile_force'
+PROFILE_FORCE_SECONDS = int(os.getenv('PROFILE_FORCE_SECONDS', str(8 * 3600)))
+profile_force_signer = URLSafeTimedSerializer(app.secret_key, salt='profile-force')
+
+def profile_force_allowed(environ):
+    token = parse_cookie(environ).get(PROFILE_FORCE_COOKIE)
+    if not token:
+        return False
+    try:
+        profile_force_signer.loads(token, max_age=PROFILE_FORCE_SECONDS)
+    except BadSignature:
+        return False
+    return True
+
+app.wsgi_app = ProfilerMiddleware(app.wsgi_app, request_profiler, profile_route_name, profile_force_allowed)
+# Behind a reverse proxy, set PROXY_FIX_HOPS to the number of proxies so request.remote_addr (the
+# login throttle key) is the client's address from X-Forwarded-For, not the proxy's
+PROXY_FIX_HOPS = int(os.getenv('PROXY_FIX_HOPS', '0'))
+if PROXY_FIX_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_FIX_HOPS, x_proto=PROXY_FIX_HOPS)
+
 load_dotenv()
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_KEY')
@@ -46,7 +122,7 @@ try:
     # Initialize the Supabase client
     supabase: Client = create_client(supabase_url, supabase_key)
     # Force postgrest initialization with a simple query
-    supabase.table("students").select("*").limit(1).execute()  # Use an existing table
+    supabase.table("students").select("student_id").limit(1).execute()  # Use an existing table
     logger.info(f"supabase._postgrest: {supabase._postgrest}")  # Debug output
 
     # Create a custom HTTP client with SSL verification disabled (for debugging)
@@ -59,6 +135,18 @@ except Exception as e:
     logger.error(f"Error initializing Supabase client: {str(e)}")
     raise
 
+# Optional read replica: a SQLite file shared by the workers on this host. Read routes use it while
+# it is within READ_REPLICA_MAX_STALENESS seconds; every bump_version marks the written tables stale
+# so they are re-pulled (and read from Supabase until then). Install sql/replica.sql so unchanged
+# tables are verified by checksum instead of downloaded again.
+READ_REPLICA_PATH = os.getenv('READ_REPLICA_PATH')
+replica = None
+if READ_REPLICA_PATH:
+    replica = ReadReplica(supabase, READ_REPLICA_PATH,
+                          max_staleness=float(os.getenv('READ_REPLICA_MAX_STALENESS', '30')),
+                          full_refresh_interval=float(os.getenv('READ_REPLICA_FULL_REFRESH', '600')))
+    on_bump(replica.mark_dirty)
+
 # User class for Flask-Login
 class User(UserMixin):
     def __init__(self, user_id, email, role, parent_id=None):
@@ -67,209 +155,92 @@ class User(UserMixin):
         self.role = role
         self.parent_id = parent_id
 
+# Session lookups never need the password hash; only login reads it
+USER_COLUMNS = 'user_id, email, role, parent_id'
+
 @login_manager.user_loader
 def load_user(user_id):
-    response = supabase.table('users').select('*').eq('user_id', user_id).execute()
+    response = supabase.table('users').select(USER_COLUMNS).eq('user_id', user_id).execute()
     if response.data:
         user_data = response.data[0]
         return User(user_data['user_id'], user_data['email'], user_data['role'], user_data.get('parent_id'))
     return None
 
 # Utility functions
-def format_phone(phone):
-    if not phone:
-        return ""
-    digits = ''.join(filter(str.isdigit, phone))
-    if len(digits) != 10:
-        return phone
-    return f"({digits[:3]}){digits[3:6]}-{digits[6:]}"
-
 app.jinja_env.filters['format_phone'] = format_phone
 
-def parse_student_name(name):
-    if not name or not isinstance(name, str):
-        return None, None
-    name = name.strip().strip('"')
-    match = re.match(r"([^,]+),\s*([^\(]+)(?:\s*\((.+)\))?", name)
-    if not match:
-        return None, None
-    last_name = match.group(1).strip()
-    first_name = match.group(2).strip()
-    first_name = match.group(3).strip() if match.group(3) else first_name
-    return first_name, last_name
-
-def normalize_grade(grade):
-    if not grade or not isinstance(grade, str):
-        return None
-    grade = grade.strip().lower()
-    if 'kindergarten' in grade:
-        return 'K'
-    match = re.match(r"(\d+)(?:st|nd|rd|th)\s*grade", grade)
-    if match:
-        return match.group(1)
-    if grade.isdigit():
-        return grade
+# Partial responses for mutating routes
+ROW_TEMPLATES = {
+    'student': ('rows/student_row.html', 'student'),
+    'parent': ('rows/parent_row.html', 'parent'),
+    'teacher': ('rows/teacher_row.html', 'teacher'),
+    'class': ('rows/class_row.html', 'cls'),
+    'classroom': ('rows/classroom_row.html', 'classroom'),
+    'user': ('rows/user_row.html', 'user'),
+}
+
+def partial_format():
+    """'json' or 'row' when the caller asked for just the affected record instead of a redirect."""
+    fmt = request.values.get('format')
+    if fmt in ('json', 'row'):
+        return fmt
+    if request.accept_mimetypes.best == 'application/json':
+        return 'json'
     return None
 
-def calculate_student_tuition(grade, assignments):
-    pricing = {
-        'K': {
-            'morning': 1600,  # Per day/week
-            'afternoon': 800   # Add-on per day/week
-        },
-        '1-2': {
-            'full': 2400,     # Per day/week
-            'enrichment': 2400  # Assume same as full
-        },
-        '3-8': {
-            'enrichment': 2300,  # Per day/week
-            'academic': 2800     # Per day/week (Academic + Enrichment)
-        },
-        '9-12': {
-            'enrichment': 2400,  # Per day/week
-            'academic': 2900     # Per day/week (Academic + Enrichment)
-        }
-    }
-    total = 0
-    academic_fee = 500  # Annual fee for academic programs
-    grade_key = 'K' if grade == 'K' else '1-2' if grade in ['1', '2'] else '3-8' if grade in [str(i) for i in range(3, 9)] else '9-12'
-    
-    has_academic = False
-    for assignment in assignments:
-        program_type = assignment.get('program_type', '').lower()
-        class_id = assignment.get('class_id')
-        if not class_id:
-            continue
-        # Fetch class days
-        class_response = supabase.table('classes').select('days').eq('class_id', class_id).execute()
-        if not class_response.data:
-            continue
-        days = class_response.data[0]['days'] or []
-        num_days = len(days) if days else 0
-        
-        if program_type in pricing[grade_key] and num_days > 0:
-            # Tuition is per day/week multiplied by number of days
-            total += pricing[grade_key][program_type] * num_days
-            if program_type == 'academic':
-                has_academic = True
-    
-    # Add academic fee if enrolled in academic program
-    if has_academic:
-        total += academic_fee
-    
-    return total
-
-def apply_sibling_discount(total_amount, parent_id, parent_student_count):
-    if parent_student_count.get(parent_id, 0) > 1:
-        return total_amount * 0.9
-    return total_amount
-
-def format_days(days_array):
-    if not days_array:
-        return ""
-    day_names = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
-    sorted_days = sorted([int(day) for day in days_array if day is not None])
-    return ', '.join(day_names[day] for day in sorted_days if 0 <= day < 7)
-
-def clean_string(s: str) -> str:
-    """Replace non-breaking spaces (\xa0) with regular spaces and normalize hyphens."""
-    if not s:
-        return s
-    # Replace non-breaking spaces with regular spaces
-    s = s.replace('\xa0', ' ')
-    # Replace multiple spaces with single space
-    s = re.sub(r'\s+', ' ', s)
-    # Ensure dashes are standard hyphens
-    s = s.replace('–', '-').replace('—', '-')
-    return s.strip()
-
-
-def normalize_grade_level(grade: str) -> List[str]:
-    """Normalize grade level to a TEXT[] (e.g., '1st, 2nd' -> ['1', '2'], 'K-12' -> ['K', '1', ..., '12'])."""
-    logging.info(f"Processing grade level: {grade}")
-    grade = clean_string(grade).replace('"', '')
-    if not grade:
-        logging.warning("Empty grade level provided")
-        return []
-    
-    # Valid grades per constraint
-    valid_grades = ['K', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
-    
-    # Helper to convert grade to string ('K' or '1', '2', etc.)
-    def grade_to_str(g: str) -> Optional[str]:
-        g = g.strip().lower()
-        if g == 'k':
-            return 'K'
-        match = re.search(r'\d+', g)
-        if match:
-            num = match.group()
-            if num in valid_grades:
-                return num
+def mutation_response(message, category, endpoint, entity=None, record=None, deleted=None, status=None):
+    """Flash and redirect to the list view, or return the affected record as JSON or a rendered table row."""
+    fmt = partial_format()
+    if fmt is None:
+        flash(message, category)
+        return redirect(url_for(endpoint))
+    status = status or (200 if category == 'success' else 400)
+    if fmt == 'row' and entity and record is not None:
+        template, name = ROW_TEMPLATES[entity]
+        return render_template(template, user_role=current_user.role, **{name: record}), status
+    if hasattr(record, 'to_dict'):
+        record = record.to_dict()
+    return {'status': category, 'message': message, 'record': record, 'deleted': deleted}, status
+
+# List views: one embedded select each, projecting only the columns the row templates render
+STUDENT_LIST_COLUMNS = ('student_id, first_name, last_name, grade_level, email, phone, medicines, allergies, '
+                        'medical_conditions, comments, student_parents(parents(parent_id, first_name, last_name))')
+CLASS_LIST_COLUMNS = ('class_id, name, days, teacher_id, grade_level, max_size, term, schedule_block, classroom_id, '
+                      'teachers(first_name, last_name), classrooms(building_number, room_number), '
+                      'class_students(program_type, students(student_id, first_name, last_name, grade_level))')
+
+def load_student_row(student, parent_ids):
+    parents = []
+    if parent_ids:
+        response = supabase.table('parents').select('parent_id, first_name, last_name').in_('parent_id', parent_ids).execute()
+        parents = response.data
+    return Student.from_row(student, parents=[Parent.from_row(parent) for parent in parents])
+
+def load_class_row(class_id):
+    response = supabase.table('classes').select(CLASS_LIST_COLUMNS).eq('class_id', class_id).execute()
+    if not response.data:
         return None
-    
-    # Handle range (e.g., 'K-12', '1st-2nd')
-    if '-' in grade:
-        try:
-            start, end = grade.split('-')
-            start_num = grade_to_str(start)
-            end_num = grade_to_str(end)
-            if start_num is None or end_num is None:
-                logging.warning(f"Invalid grade range format: {grade}")
-                return []
-            start_idx = valid_grades.index(start_num)
-            end_idx = valid_grades.index(end_num)
-            if start_idx > end_idx:
-                logging.warning(f"Invalid grade range: {start_num} > {end_num}")
-                return [start_num] if start_num in valid_grades else []
-            # Generate range of grades
-            grades = valid_grades[start_idx:end_idx + 1]
-            return grades
-        except Exception as e:
-            logging.error(f"Error normalizing grade level {grade}: {str(e)}")
-            return []
-    
-    # Handle comma-separated grades (e.g., '1st, 2nd')
-    if ',' in grade:
-        try:
-            grades = [grade_to_str(g) for g in grade.split(',')]
-            grades = [g for g in grades if g in valid_grades]
-            if not grades:
-                logging.warning(f"No valid grades in comma-separated list: {grade}")
-                return []
-            return sorted(set(grades))  # Remove duplicates and sort
-        except Exception as e:
-            logging.error(f"Error normalizing comma-separated grade level {grade}: {str(e)}")
-            return []
-    
-    # Handle single grade (e.g., 'K', '1st')
-    grade_str = grade_to_str(grade)
-    if grade_str in valid_grades:
-        return [grade_str]
-    logging.warning(f"Invalid grade format: {grade}")
-    return []
-
-def apply_sibling_discount_per_family(parent_student_tuitions):
-    """
-    Apply sibling discount: first student pays full price, others get 10% off.
-    parent_student_tuitions: List of {'student_id', 'student_name', 'grade', 'amount', 'parent_id'}
-    Returns: Updated list with discounted amounts
-    """
-    if len(parent_student_tuitions) <= 1:
-        return parent_student_tuitions
-    
-    # Sort by student_id to ensure consistent "first" student
-    sorted_students = sorted(parent_student_tuitions, key=lambda x: x['student_id'])
-    
-    # First student pays full price
-    result = [sorted_students[0].copy()]  # Copy to avoid modifying original
-    
-    # Apply 10% discount to others
-    for student in sorted_students[1:]:
-        student_copy = student.copy()
-        student_copy['amount'] = student_copy['amount'] * 0.9
-        result.append(student_copy)
-    
-    return result
+    return classes_from_embedded(response.data)[0]
+
+USER_LIST_COLUMNS = f"{USER_COLUMNS}, parents(first_name, last_name)"
+
+def user_row_from_embedded(user):
+    parent = user.pop('parents', None)
+    return {**user, 'parent_name': f"{parent['last_name']}, {parent['first_name']}" if parent else None}
+
+def load_user_row(user):
+    parent_name = None
+    if user.get('parent_id'):
+        response = supabase.table('parents').select('first_name, last_name').eq('parent_id', user['parent_id']).execute()
+        if response.data:
+            parent_name = f"{response.data[0]['last_name']}, {response.data[0]['first_name']}"
+    return {
+        'user_id': user['user_id'],
+        'email': user['email'],
+        'role': user['role'],
+        'parent_id': user.get('parent_id'),
+        'parent_name': parent_name
+    }
 
 # Routes
 @app.route('/login', methods=['GET', 'POST'])
@@ -277,71 +248,113 @@ def login():
     if current_user.is_authenticated:
         return redirect(url_for('students'))
     if request.method == 'POST':
-        email = request.form.get('email')
-        password = request.form.get('password')
-        response = supabase.table('users').select('*').eq('email', email).execute()
-        if response.data and bcrypt.check_password_hash(response.data[0]['password_hash'], password):
-            user = User(response.data[0]['user_id'], response.data[0]['email'], response.data[0]['role'], response.data[0].get('parent_id'))
-            login_user(user)
-            flash('Logged in successfully', 'success')
-            return redirect(request.args.get('next') or url_for('students'))
+        email = (request.form.get('email') or '').strip()
+        password = request.form.get('password') or ''
+        if not email or not password:
+            flash('Enter your email and password', 'danger')
+            return render_template('login.html'), 400
+        client_ip = request.remote_addr or ''
+        retry_after = max(login_ip_limiter.retry_after(client_ip), login_email_limiter.retry_after(email_key(email)))
+        if retry_after:
+            logger.warning(f"Login throttled for {email} from {client_ip}")
+            flash(f"Too many login attempts. Try again in {int(retry_after) + 1} seconds.", 'danger')
+            return render_template('login.html'), 429, {'Retry-After': str(int(retry_after) + 1)}
+        try:
+            response = supabase.table('users').select(f"{USER_COLUMNS}, password_hash").eq('email', email).execute()
+            user_data = response.data[0] if response.data else None
+            if user_data and password_verifier.verify(user_data['password_hash'], password):
+                login_email_limiter.reset(email_key(email))
+                rehash_password(user_data, password)
+                user = User(user_data['user_id'], user_data['email'], user_data['role'], user_data.get('parent_id'))
+                login_user(user)
+                flash('Logged in successfully', 'success')
+                return redirect(request.args.get('next') or url_for('students'))
+        except LoginOverloaded:
+            logger.warning(f"Login rejected, password check queue full: {password_verifier.metrics()}")
+            flash('The server is busy signing people in. Please try again in a few seconds.', 'warning')
+            return render_template('login.html'), 503, {'Retry-After': '5'}
+        # Only failures count, so a school or church NAT full of families signing in isn't throttled
+        login_ip_limiter.record(client_ip)
+        login_email_limiter.record(email_key(email))
         flash('Invalid email or password', 'danger')
     return render_template('login.html')
 
+def rehash_password(user_data, password):
+    """Re-hash at the configured cost after a successful login if the stored hash uses another cost."""
+    if hash_cost(user_data['password_hash']) == app.config['BCRYPT_LOG_ROUNDS']:
+        return
+    try:
+        password_hash = password_verifier.hash_password(password)
+        supabase.table('users').update({'password_hash': password_hash}).eq('user_id', user_data['user_id']).execute()
+        logger.info(f"Rehashed password for user {user_data['user_id']} at cost {app.config['BCRYPT_LOG_ROUNDS']}")
+    except Exception as e:
+        # Never block a successful login on the upgrade; it is retried next time
+        logger.warning(f"Could not rehash password for user {user_data['user_id']}: {str(e)}")
+
+@app.route('/admin/metrics/login', methods=['GET'])
+@login_required
+def login_metrics():
+    """Password check pool depth (this worker) and failed-login throttle settings."""
+    if current_user.role != 'admin':
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    return {'password_checks': password_verifier.metrics(),
+            'throttle': {'email': login_email_limiter.metrics(), 'ip': login_ip_limiter.metrics()}}, 200
+
+@app.route('/admin/metrics/replica', methods=['GET'])
+@login_required
+def replica_metrics():
+    """Age, size and dirty state of each table in the local read replica."""
+    if current_user.role != 'admin':
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    if replica is None:
+        return {'enabled': False}, 200
+    return {'enabled': True, 'path': READ_REPLICA_PATH, 'max_staleness_seconds': replica.max_staleness,
+            'pulls_by_this_worker': replica.pulls, 'tables': replica.status()}, 200
+
 @app.route('/logout')
 @login_required
 def logout():
     logout_user()
     flash('Logged out successfully', 'success')
-    return redirect(url_for('login'))
+    response = redirect(url_for('login'))
+    response.delete_cookie(PROFILE_FORCE_COOKIE)
+    return response
 
 @app.route('/', methods=['GET'])
 @app.route('/students', methods=['GET'])
 @login_required
 def students():
     try:
-        students_response = supabase.table('students').select('*').execute()
-        parents_response = supabase.table('parents').select('parent_id, first_name, last_name').execute()
-        student_parents_response = supabase.table('student_parents').select('student_id, parent_id').execute()
-
-        students_data = sorted(students_response.data, key=lambda x: x['last_name'].lower() if x['last_name'] else '')
-        parents_data = parents_response.data
-        student_parents_data = student_parents_response.data
-
-        parent_map = {p['parent_id']: p for p in parents_data}
-        student_parents_map = {}
-        for sp in student_parents_data:
-            student_id = sp['student_id']
-            parent_id = sp['parent_id']
-            if student_id not in student_parents_map:
-                student_parents_map[student_id] = []
-            if parent_id in parent_map:
-                student_parents_map[student_id].append(parent_map[parent_id])
-
-        processed_students = []
-        for student in students_data:
-            parents = student_parents_map.get(student['student_id'], [])
-            if current_user.role == 'parent' and current_user.parent_id not in [p['parent_id'] for p in parents]:
-                continue
-            student_copy = student.copy()
-            student_copy['parents'] = parents
-            processed_students.append(student_copy)
-        return render_template('index.html', 
+        conn = replica.connection('students', 'student_parents', 'parents') if replica else None
+        if conn is not None:
+            student_ids = None
+            if current_user.role == 'parent':
+                student_ids = [row[0] for row in conn.execute(
+                    'SELECT student_id FROM student_parents WHERE parent_id = ?', (current_user.parent_id,))]
+            rows = students_with_parents(conn, student_ids)
+        else:
+            query = supabase.table('students').select(STUDENT_LIST_COLUMNS)
+            if current_user.role == 'parent':
+                # Only the parent's own children go over the wire
+                links = supabase.table('student_parents').select('student_id').eq('parent_id', current_user.parent_id).execute()
+                query = query.in_('student_id', [link['student_id'] for link in links.data])
+            rows = query.execute().data
+        processed_students = sorted(students_from_embedded(rows),
+                                    key=lambda x: x.last_name.lower() if x.last_name else '')
+        return render_template('tabs/students.html', 
                              active_tab='students', 
                              students=processed_students, 
-                             parents=parents_data,
                              user_role=current_user.role)
     except Exception as e:
         logger.error(f"Error fetching students: {str(e)}")
         flash(f"Error fetching students: {str(e)}", 'danger')
-        return render_template('index.html', active_tab='students', students=[], parents=[], user_role=current_user.role)
+        return render_template('tabs/students.html', active_tab='students', students=[], user_role=current_user.role)
 
 @app.route('/add_student', methods=['POST'])
 @login_required
 def add_student():
     if current_user.role not in ['admin', 'teacher']:
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('students'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'students', status=403)
     try:
         student_id = str(uuid.uuid4())
         data = {
@@ -357,25 +370,24 @@ def add_student():
             'comments': request.form.get('comments') or None
         }
         supabase.table('students').insert(data).execute()
-        parent_ids = request.form.getlist('parent_ids')
-        for parent_id in parent_ids:
-            if parent_id:
-                supabase.table('student_parents').insert({
-                    'student_id': student_id,
-                    'parent_id': parent_id
-                }).execute()
-        flash('Student added successfully', 'success')
+        parent_ids = [parent_id for parent_id in request.form.getlist('parent_ids') if parent_id]
+        if parent_ids:
+            supabase.table('student_parents').insert([
+                {'student_id': student_id, 'parent_id': parent_id} for parent_id in parent_ids
+            ]).execute()
+        record = load_student_row(data, parent_ids) if partial_format() else None
+        return mutation_response('Student added successfully', 'success', 'students', 'student', record)
     except Exception as e:
         logger.error(f"Error adding student: {str(e)}")
-        flash(f"Error adding student: {str(e)}", 'danger')
-    return redirect(url_for('students'))
+        return mutation_response(f"Error adding student: {str(e)}", 'danger', 'students', status=500)
+    finally:
+        bump_version('students', 'student_parents')
 
 @app.route('/edit_student', methods=['POST'])
 @login_required
 def edit_student():
     if current_user.role not in ['admin', 'teacher']:
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('students'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'students', status=403)
     try:
         student_id = request.form.get('student_id')
         data = {
@@ -391,34 +403,32 @@ def edit_student():
         }
         supabase.table('students').update(data).eq('student_id', student_id).execute()
         supabase.table('student_parents').delete().eq('student_id', student_id).execute()
-        parent_ids = request.form.getlist('parent_ids')
-        for parent_id in parent_ids:
-            if parent_id:
-                supabase.table('student_parents').insert({
-                    'student_id': student_id,
-                    'parent_id': parent_id
-                }).execute()
-        flash('Student updated successfully', 'success')
+        parent_ids = [parent_id for parent_id in request.form.getlist('parent_ids') if parent_id]
+        if parent_ids:
+            supabase.table('student_parents').insert([
+                {'student_id': student_id, 'parent_id': parent_id} for parent_id in parent_ids
+            ]).execute()
+        record = load_student_row({'student_id': student_id, **data}, parent_ids) if partial_format() else None
+        return mutation_response('Student updated successfully', 'success', 'students', 'student', record)
     except Exception as e:
         logger.error(f"Error editing student: {str(e)}")
-        flash(f"Error editing student: {str(e)}", 'danger')
-    return redirect(url_for('students'))
+        return mutation_response(f"Error editing student: {str(e)}", 'danger', 'students', status=500)
+    finally:
+        bump_version('students', 'student_parents')
 
 @app.route('/delete_student/<student_id>', methods=['POST'])
 @login_required
 def delete_student(student_id):
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('students'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'students', status=403)
     try:
-        supabase.table('student_parents').delete().eq('student_id', student_id).execute()
-        supabase.table('class_students').delete().eq('student_id', student_id).execute()
-        supabase.table('students').delete().eq('student_id', student_id).execute()
-        flash('Student deleted successfully', 'success')
+        bulk_delete(supabase, 'students', [student_id])
+        return mutation_response('Student deleted successfully', 'success', 'students', deleted=student_id)
     except Exception as e:
         logger.error(f"Error deleting student: {str(e)}")
-        flash(f"Error deleting student: {str(e)}", 'danger')
-    return redirect(url_for('students'))
+        return mutation_response(f"Error deleting student: {str(e)}", 'danger', 'students', status=500)
+    finally:
+        bump_version('students', 'student_parents', 'class_students', 'class_waitlist')
 
 @app.route('/parents', methods=['GET'])
 @login_required
@@ -427,20 +437,20 @@ def parents():
         flash('Access denied: Insufficient permissions', 'danger')
         return redirect(url_for('students'))
     try:
-        response = supabase.table('parents').select('*').execute()
-        parents_data = sorted(response.data, key=lambda x: x['last_name'].lower() if x['last_name'] else '')
-        return render_template('index.html', active_tab='parents', parents=parents_data, user_role=current_user.role)
+        response = supabase.table('parents').select('parent_id, first_name, last_name, email, phone, is_staff').execute()
+        parents_data = [Parent.from_row(row) for row in
+                        sorted(response.data, key=lambda x: x['last_name'].lower() if x['last_name'] else '')]
+        return render_template('tabs/parents.html', active_tab='parents', parents=parents_data, user_role=current_user.role)
     except Exception as e:
         logger.error(f"Error fetching parents: {str(e)}")
         flash(f"Error fetching parents: {str(e)}", 'danger')
-        return render_template('index.html', active_tab='parents', parents=[], user_role=current_user.role)
+        return render_template('tabs/parents.html', active_tab='parents', parents=[], user_role=current_user.role)
 
 @app.route('/add_parent', methods=['POST'])
 @login_required
 def add_parent():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('parents'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'parents', status=403)
     try:
         parent_id = str(uuid.uuid4())
         data = {
@@ -452,18 +462,18 @@ def add_parent():
             'is_staff': request.form.get('is_staff') == 'on'
         }
         supabase.table('parents').insert(data).execute()
-        flash('Parent added successfully', 'success')
+        return mutation_response('Parent added successfully', 'success', 'parents', 'parent', data)
     except Exception as e:
         logger.error(f"Error adding parent: {str(e)}")
-        flash(f"Error adding parent: {str(e)}", 'danger')
-    return redirect(url_for('parents'))
+        return mutation_response(f"Error adding parent: {str(e)}", 'danger', 'parents', status=500)
+    finally:
+        bump_version('parents')
 
 @app.route('/edit_parent', methods=['POST'])
 @login_required
 def edit_parent():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('parents'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'parents', status=403)
     try:
         parent_id = request.form.get('parent_id')
         data = {
@@ -473,27 +483,28 @@ def edit_parent():
             'phone': format_phone(request.form.get('phone')) or None,
             'is_staff': request.form.get('is_staff') == 'on'
         }
-        supabase.table('parents').update(data).eq('parent_id', parent_id).execute()
-        flash('Parent updated successfully', 'success')
+        response = supabase.table('parents').update(data).eq('parent_id', parent_id).execute()
+        record = response.data[0] if response.data else None
+        return mutation_response('Parent updated successfully', 'success', 'parents', 'parent', record)
     except Exception as e:
         logger.error(f"Error editing parent: {str(e)}")
-        flash(f"Error editing parent: {str(e)}", 'danger')
-    return redirect(url_for('parents'))
+        return mutation_response(f"Error editing parent: {str(e)}", 'danger', 'parents', status=500)
+    finally:
+        bump_version('parents')
 
 @app.route('/delete_parent/<parent_id>', methods=['POST'])
 @login_required
 def delete_parent(parent_id):
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('parents'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'parents', status=403)
     try:
-        supabase.table('student_parents').delete().eq('parent_id', parent_id).execute()
-        supabase.table('parents').delete().eq('parent_id', parent_id).execute()
-        flash('Parent deleted successfully', 'success')
+        bulk_delete(supabase, 'parents', [parent_id])
+        return mutation_response('Parent deleted successfully', 'success', 'parents', deleted=parent_id)
     except Exception as e:
         logger.error(f"Error deleting parent: {str(e)}")
-        flash(f"Error deleting parent: {str(e)}", 'danger')
-    return redirect(url_for('parents'))
+        return mutation_response(f"Error deleting parent: {str(e)}", 'danger', 'parents', status=500)
+    finally:
+        bump_version('parents', 'student_parents', 'users')
 
 @app.route('/teachers', methods=['GET'])
 @login_required
@@ -502,20 +513,20 @@ def teachers():
         flash('Access denied: Insufficient permissions', 'danger')
         return redirect(url_for('students'))
     try:
-        response = supabase.table('teachers').select('*').execute()
-        teachers_data = sorted(response.data, key=lambda x: x['last_name'].lower() if x['last_name'] else '')
-        return render_template('index.html', active_tab='teachers', teachers=teachers_data, user_role=current_user.role)
+        response = supabase.table('teachers').select('teacher_id, first_name, last_name, email, phone').execute()
+        teachers_data = [Teacher.from_row(row) for row in
+                         sorted(response.data, key=lambda x: x['last_name'].lower() if x['last_name'] else '')]
+        return render_template('tabs/teachers.html', active_tab='teachers', teachers=teachers_data, user_role=current_user.role)
     except Exception as e:
         logger.error(f"Error fetching teachers: {str(e)}")
         flash(f"Error fetching teachers: {str(e)}", 'danger')
-        return render_template('index.html', active_tab='teachers', teachers=[], user_role=current_user.role)
+        return render_template('tabs/teachers.html', active_tab='teachers', teachers=[], user_role=current_user.role)
 
 @app.route('/add_teacher', methods=['POST'])
 @login_required
 def add_teacher():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('teachers'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'teachers', status=403)
     try:
         teacher_id = str(uuid.uuid4())
         data = {
@@ -526,18 +537,18 @@ def add_teacher():
             'phone': format_phone(request.form.get('phone')) or None
         }
         supabase.table('teachers').insert(data).execute()
-        flash('Teacher added successfully', 'success')
+        return mutation_response('Teacher added successfully', 'success', 'teachers', 'teacher', data)
     except Exception as e:
         logger.error(f"Error adding teacher: {str(e)}")
-        flash(f"Error adding teacher: {str(e)}", 'danger')
-    return redirect(url_for('teachers'))
+        return mutation_response(f"Error adding teacher: {str(e)}", 'danger', 'teachers', status=500)
+    finally:
+        bump_version('teachers')
 
 @app.route('/edit_teacher', methods=['POST'])
 @login_required
 def edit_teacher():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('teachers'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'teachers', status=403)
     try:
         teacher_id = request.form.get('teacher_id')
         data = {
@@ -546,26 +557,28 @@ def edit_teacher():
             'email': request.form.get('email') or None,
             'phone': format_phone(request.form.get('phone')) or None
         }
-        supabase.table('teachers').update(data).eq('teacher_id', teacher_id).execute()
-        flash('Teacher updated successfully', 'success')
+        response = supabase.table('teachers').update(data).eq('teacher_id', teacher_id).execute()
+        record = response.data[0] if response.data else None
+        return mutation_response('Teacher updated successfully', 'success', 'teachers', 'teacher', record)
     except Exception as e:
         logger.error(f"Error editing teacher: {str(e)}")
-        flash(f"Error editing teacher: {str(e)}", 'danger')
-    return redirect(url_for('teachers'))
+        return mutation_response(f"Error editing teacher: {str(e)}", 'danger', 'teachers', status=500)
+    finally:
+        bump_version('teachers')
 
 @app.route('/delete_teacher/<teacher_id>', methods=['POST'])
 @login_required
 def delete_teacher(teacher_id):
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('teachers'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'teachers', status=403)
     try:
         supabase.table('teachers').delete().eq('teacher_id', teacher_id).execute()
-        flash('Teacher deleted successfully', 'success')
+        return mutation_response('Teacher deleted successfully', 'success', 'teachers', deleted=teacher_id)
     except Exception as e:
         logger.error(f"Error deleting teacher: {str(e)}")
-        flash(f"Error deleting teacher: {str(e)}", 'danger')
-    return redirect(url_for('teachers'))
+        return mutation_response(f"Error deleting teacher: {str(e)}", 'danger', 'teachers', status=500)
+    finally:
+        bump_version('teachers')
 
 @app.route('/classes', methods=['GET'])
 @login_required
@@ -574,78 +587,21 @@ def classes():
         flash('Access denied: Insufficient permissions', 'danger')
         return redirect(url_for('students'))
     try:
-        # Test a simple query without joins
-        simple_classes_response = supabase.table('classes').select('class_id, name').execute()
-        logger.info(f"Simple classes query result: {simple_classes_response.data}")
-
-        # Original query with joins
-        classes_response = supabase.table('classes').select('*, teachers(*), classrooms(*)').execute()
-        logger.info(f"Classes query result: {classes_response.data}")
-
-        # Fetch class-student relationships
-        class_students_response = supabase.table('class_students').select('class_id, student_id, program_type').execute()
-        logger.info(f"Class students query result: {class_students_response.data}")
-
-        # Fetch student details
-        students_response = supabase.table('students').select('student_id, first_name, last_name, grade_level').execute()
-        logger.info(f"Students query result: {students_response.data}")
-
-        # Fetch teachers and classrooms for modals
-        teachers_response = supabase.table('teachers').select('teacher_id, first_name, last_name').execute()
-        logger.info(f"Teachers query result: {teachers_response.data}")
-
-        classrooms_response = supabase.table('classrooms').select('classroom_id, building_number, room_number').execute()
-        logger.info(f"Classrooms query result: {classrooms_response.data}")
-
-        classes_data = classes_response.data
-        class_students_data = class_students_response.data
-        students_data = students_response.data
-        teachers_data = teachers_response.data
-        classrooms_data = classrooms_response.data
+        classes_data = supabase.table('classes').select(CLASS_LIST_COLUMNS).execute().data
 
         if not classes_data:
             logger.warning("No classes data returned from query")
             flash("No classes found in the database", 'warning')
 
-        # Build class-student mapping
-        class_student_map = {}
-        for cs in class_students_data:
-            class_id = cs['class_id']
-            if class_id not in class_student_map:
-                class_student_map[class_id] = []
-            class_student_map[class_id].append({
-                'student_id': cs['student_id'],
-                'program_type': cs['program_type']
-            })
-
-        processed_classes = []
-        for cls in classes_data:
-            cls_copy = cls.copy()
-            cls_copy['days_array'] = cls['days'] or []
-            cls_copy['days'] = format_days(cls['days'])
-            cls_copy['teachers'] = cls.get('teachers', None)
-            cls_copy['classrooms'] = cls.get('classrooms', None)
-            student_assignments = class_student_map.get(cls['class_id'], [])
-            cls_copy['students'] = [
-                {**s, 'program_type': sa['program_type']}
-                for s in students_data
-                for sa in student_assignments
-                if s['student_id'] == sa['student_id']
-            ]
-            processed_classes.append(cls_copy)
-
-        processed_classes = sorted(processed_classes, key=lambda x: x['name'].lower() if x['name'] else '')
-        return render_template('index.html', 
+        processed_classes = sorted(classes_from_embedded(classes_data), key=lambda x: x.name.lower() if x.name else '')
+        return render_template('tabs/classes.html', 
                              active_tab='classes', 
                              classes=processed_classes,
-                             teachers=teachers_data,
-                             classrooms=classrooms_data,
-                             students=students_data,
                              user_role=current_user.role)
     except Exception as e:
         logger.error(f"Error fetching classes: {str(e)}")
         flash(f"Error fetching classes: {str(e)}", 'danger')
-        return render_template('index.html', active_tab='classes', classes=[], teachers=[], classrooms=[], students=[], user_role=current_user.role)
+        return render_template('tabs/classes.html', active_tab='classes', classes=[], user_role=current_user.role)
 
 def normalize_term(term):
     if not term:
@@ -659,18 +615,77 @@ def normalize_term(term):
         return 'Summer'
     return term
 
+SCHEDULE_CLASS_COLUMNS = 'class_id, name, days, term, schedule_block, teacher_id, classroom_id'
+_schedule_cache = {'version': None, 'index': None}
+# _schedule_lock guards reads and writes of the cached index; _schedule_reload_lock lets one thread
+# at a time rebuild it, without holding up checks against the current index while it fetches
+_schedule_lock = threading.Lock()
+_schedule_reload_lock = threading.Lock()
+
+def get_schedule_index():
+    """Schedule index over classes and class_students, rebuilt only when either table changes.
+
+    The index is shared and changed in place by commit_schedule_change: read it under
+    _schedule_lock (see check_schedule).
+    """
+    with _schedule_lock:
+        if _schedule_cache['version'] == data_version('classes', 'class_students'):
+            return _schedule_cache['index']
+    with _schedule_reload_lock:
+        with _schedule_lock:
+            version = data_version('classes', 'class_students')
+            if _schedule_cache['version'] == version:
+                return _schedule_cache['index']
+        classes_response = supabase.table('classes').select(SCHEDULE_CLASS_COLUMNS).execute()
+        class_students_response = supabase.table('class_students').select('class_id, student_id').execute()
+        index = ScheduleIndex(classes_response.data, class_students_response.data)
+        with _schedule_lock:
+            # Tagged with the version read before the fetch, so a change committed meanwhile
+            # leaves it stale and the next call reloads
+            _schedule_cache.update(index=index, version=version)
+            return index
+
+def check_schedule(check):
+    """(index, check(index)) with the check run under the index lock, so no commit changes it midway."""
+    index = get_schedule_index()
+    with _schedule_lock:
+        return index, check(index)
+
+def commit_schedule_change(change, *tables):
+    """Bump the written tables and apply the committed change to the cached index instead of rebuilding it."""
+    with _schedule_lock:
+        current = _schedule_cache['version'] == data_version('classes', 'class_students')
+        bump_version(*tables)
+        if current:
+            change(_schedule_cache['index'])
+            _schedule_cache['version'] = data_version('classes', 'class_students')
+
+def schedule_conflict_message(conflicts, index):
+    """Flash text naming the students/teachers/classrooms and classes involved in conflicts."""
+    ids = {kind: {c['entity_id'] for c in conflicts if c['kind'] == kind} for kind in ['student', 'teacher', 'classroom']}
+    with _schedule_lock:
+        names = {class_id: cls.get('name') or class_id for class_id, cls in index.classes.items()}
+    if ids['student']:
+        rows = supabase.table('students').select('student_id, first_name, last_name').in_('student_id', list(ids['student'])).execute().data
+        names.update({r['student_id']: f"{r['last_name']}, {r['first_name']}" for r in rows})
+    if ids['teacher']:
+        rows = supabase.table('teachers').select('teacher_id, first_name, last_name').in_('teacher_id', list(ids['teacher'])).execute().data
+        names.update({r['teacher_id']: f"{r['last_name']}, {r['first_name']}" for r in rows})
+    if ids['classroom']:
+        rows = supabase.table('classrooms').select('classroom_id, building_number, room_number').in_('classroom_id', list(ids['classroom'])).execute().data
+        names.update({r['classroom_id']: f"{r['building_number']} {r['room_number']}" for r in rows})
+    return f"Schedule conflict: {describe_conflicts(conflicts, names)}"
+
 @app.route('/add_class', methods=['POST'])
 @login_required
 def add_class():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('classes'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classes', status=403)
     try:
         valid_terms = ['Semester 1', 'Semester 2', 'Both']
         term = request.form.get('term')
         if term not in valid_terms:
-            flash(f"Invalid term: {term}. Must be one of {', '.join(valid_terms)}", 'danger')
-            return redirect(url_for('classes'))
+            return mutation_response(f"Invalid term: {term}. Must be one of {', '.join(valid_terms)}", 'danger', 'classes')
         
         class_id = str(uuid.uuid4())
         days = request.form.getlist('days')
@@ -685,31 +700,33 @@ def add_class():
             'schedule_block': int(request.form.get('schedule_block')) if request.form.get('schedule_block') else None,
             'classroom_id': request.form.get('classroom_id') or None
         }
+        index, conflicts = check_schedule(lambda index: index.check_class(data))
+        if conflicts:
+            return mutation_response(schedule_conflict_message(conflicts, index), 'danger', 'classes', status=409)
         supabase.table('classes').insert(data).execute()
-        flash('Class added successfully', 'success')
+        commit_schedule_change(lambda index: index.set_class(data), 'classes')
+        record = load_class_row(class_id) if partial_format() else None
+        return mutation_response('Class added successfully', 'success', 'classes', 'class', record)
     except Exception as e:
+        bump_version('classes')
         logger.error(f"Error adding class: {str(e)}")
-        flash(f"Error adding class: {str(e)}", 'danger')
-    return redirect(url_for('classes'))
+        return mutation_response(f"Error adding class: {str(e)}", 'danger', 'classes', status=500)
 
 @app.route('/edit_class', methods=['POST'])
 @login_required
 def edit_class():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('classes'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classes', status=403)
     
+    class_id = request.form.get('class_id')
     try:
         valid_terms = ['Semester 1', 'Semester 2', 'Both']
         term = request.form.get('term')
         if term not in valid_terms:
-            flash(f"Invalid term: {term}. Must be one of {', '.join(valid_terms)}", 'danger')
-            return redirect(url_for('classes'))
+            return mutation_response(f"Invalid term: {term}. Must be one of {', '.join(valid_terms)}", 'danger', 'classes')
         
-        class_id = request.form.get('class_id')
         if not class_id:
-            flash('Class ID is required', 'danger')
-            return redirect(url_for('classes'))
+            return mutation_response('Class ID is required', 'danger', 'classes')
         
         # Normalize days (INTEGER[])
         days = request.form.getlist('days')
@@ -736,61 +753,318 @@ def edit_class():
         
         logger.info(f"Updating class {class_id} with data: {data}")
         
+        index, conflicts = check_schedule(lambda index: index.check_class({'class_id': class_id, **data}))
+        if conflicts:
+            return mutation_response(schedule_conflict_message(conflicts, index), 'danger', 'classes', status=409)
+
         # Perform the update
         response = supabase.table('classes').update(data).eq('class_id', class_id).execute()
         
-        if response.data:
-            flash('Class updated successfully', 'success')
-        else:
-            flash('Class not found or no changes made', 'warning')
+        if not response.data:
+            return mutation_response('Class not found or no changes made', 'warning', 'classes', status=404)
+        commit_schedule_change(lambda index: index.set_class({'class_id': class_id, **data}), 'classes')
+        record = load_class_row(class_id) if partial_format() else None
+        return mutation_response('Class updated successfully', 'success', 'classes', 'class', record)
             
     except Exception as e:
+        bump_version('classes')
         logger.error(f"Error editing class {class_id}: {str(e)}")
-        flash(f"Error editing class: {str(e)}", 'danger')
-    
-    return redirect(url_for('classes'))
-
+        return mutation_response(f"Error editing class: {str(e)}", 'danger', 'classes', status=500)
 
 @app.route('/delete_class/<class_id>', methods=['POST'])
 @login_required
 def delete_class(class_id):
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('classes'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classes', status=403)
     try:
-        supabase.table('class_students').delete().eq('class_id', class_id).execute()
-        supabase.table('classes').delete().eq('class_id', class_id).execute()
-        flash('Class deleted successfully', 'success')
+        bulk_delete(supabase, 'classes', [class_id])
+        commit_schedule_change(lambda index: index.remove_class(class_id), 'classes', 'class_students', 'class_waitlist')
+        return mutation_response('Class deleted successfully', 'success', 'classes', deleted=class_id)
     except Exception as e:
+        bump_version('classes', 'class_students', 'class_waitlist')
         logger.error(f"Error deleting class: {str(e)}")
-        flash(f"Error deleting class: {str(e)}", 'danger')
-    return redirect(url_for('classes'))
+        return mutation_response(f"Error deleting class: {str(e)}", 'danger', 'classes', status=500)
+
+# Bulk delete: list endpoint and the version tables each entity's cascade touches
+DELETE_SELECTED_TABLES = {
+    'students': ('students', 'student_parents', 'class_students', 'class_waitlist'),
+    'parents': ('parents', 'student_parents', 'users'),
+    'classes': ('classes', 'class_students', 'class_waitlist'),
+}
+
+@app.route('/delete_selected/<entity>', methods=['POST'])
+@login_required
+def delete_selected(entity):
+    """Delete the checked rows (form field ids, repeated) and their link rows in a handful of requests."""
+    endpoint = entity if entity in CASCADE_DELETES else 'students'
+    if current_user.role != 'admin':
+        return mutation_response('Access denied: Insufficient permissions', 'danger', endpoint, status=403)
+    if entity not in CASCADE_DELETES:
+        return mutation_response(f"Bulk delete is not supported for {entity}", 'danger', endpoint, status=404)
+    try:
+        deleted = bulk_delete(supabase, entity, request.form.getlist('ids'))
+        if not deleted:
+            return mutation_response('Nothing selected', 'warning', endpoint)
+
+        def remove_classes(index):
+            for class_id in deleted:
+                index.remove_class(class_id)
+
+        if entity == 'classes':
+            commit_schedule_change(remove_classes, *DELETE_SELECTED_TABLES[entity])
+        else:
+            bump_version(*DELETE_SELECTED_TABLES[entity])
+        logger.info(f"Bulk deleted {len(deleted)} {entity} by {current_user.email}")
+        return mutation_response(f"Deleted {len(deleted)} {entity}", 'success', endpoint, deleted=deleted)
+    except Exception as e:
+        bump_version(*DELETE_SELECTED_TABLES[entity])
+        logger.error(f"Error bulk deleting {entity}: {str(e)}")
+        return mutation_response(f"Error deleting {entity}: {str(e)}", 'danger', endpoint, status=500)
 
 @app.route('/assign_students_to_class', methods=['POST'])
 @login_required
 def assign_students_to_class():
     if current_user.role not in ['admin', 'teacher']:
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('classes'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classes', status=403)
     try:
         class_id = request.form.get('class_id')
         student_ids = request.form.getlist('student_ids')
         program_types = request.form.getlist('program_types')  # Expect one program_type per student
-        # Clear existing student assignments
-        supabase.table('class_students').delete().eq('class_id', class_id).execute()
-        # Assign new students with program_type
-        for student_id, program_type in zip(student_ids, program_types):
-            if student_id and program_type:
-                supabase.table('class_students').insert({
-                    'class_id': class_id,
-                    'student_id': student_id,
-                    'program_type': program_type or None
-                }).execute()
-        flash('Students assigned successfully', 'success')
+        rows = [
+            {'class_id': class_id, 'student_id': student_id, 'program_type': program_type or None}
+            for student_id, program_type in zip(student_ids, program_types)
+            if student_id and program_type
+        ]
+        roster = [row['student_id'] for row in rows]
+        index, conflicts = check_schedule(lambda index: index.check_roster(class_id, roster))
+        if conflicts:
+            return mutation_response(schedule_conflict_message(conflicts, index), 'danger', 'classes', status=409)
+        # Seats are checked and taken atomically; students beyond max_size go onto the waitlist
+        result = change_roster(supabase, class_id, rows, replace=True, locks=seat_locks,
+                               clashes=schedule_clashes(class_id))
+        commit_schedule_change(lambda index: index.set_roster(class_id, result['roster']), 'class_students', 'class_waitlist')
+        record = load_class_row(class_id) if partial_format() else None
+        return mutation_response(f"Students assigned successfully{roster_change_note(result)}", 'success',
+                                 'classes', 'class', record)
     except Exception as e:
+        bump_version('class_students', 'class_waitlist')
         logger.error(f"Error assigning students to class: {str(e)}")
-        flash(f"Error assigning students: {str(e)}", 'danger')
-    return redirect(url_for('classes'))
+        return mutation_response(f"Error assigning students: {str(e)}", 'danger', 'classes', status=500)
+
+seat_locks = SeatLocks()
+
+def schedule_clashes(class_id):
+    """change_roster's clashes callback: which waitlisted students are booked elsewhere at the class's time."""
+    def clashes(student_ids):
+        _, found = check_schedule(lambda index: index.check_roster(class_id, student_ids))
+        return {conflict['entity_id'] for conflict in found}
+    return clashes
+
+def roster_change_note(result):
+    """'; 2 waitlisted (positions 3, 4)' style suffix for roster change messages."""
+    notes = []
+    if result.get('waitlisted'):
+        positions = ', '.join(str(entry['position']) for entry in result['waitlisted'])
+        notes.append(f"{len(result['waitlisted'])} waitlisted (position {positions})")
+    if result.get('promoted'):
+        notes.append(f"{len(result['promoted'])} promoted from the waitlist")
+    if result.get('rejected'):
+        notes.append(f"{len(result['rejected'])} not enrolled: the class is full")
+    return f"; {', '.join(notes)}" if notes else ''
+
+def roster_endpoint():
+    """Where enroll/withdraw return to: parents can't open the class list, so their dashboard."""
+    return 'students' if current_user.role == 'parent' else 'classes'
+
+def own_student_ids(student_ids):
+    """The subset of student_ids the current user may enroll or withdraw (parents: their own children)."""
+    if current_user.role in ['admin', 'teacher']:
+        return list(student_ids)
+    links = supabase.table('student_parents').select('student_id').eq('parent_id', current_user.parent_id).execute()
+    own = {link['student_id'] for link in links.data}
+    return [student_id for student_id in student_ids if student_id in own]
+
+@app.route('/classes/<class_id>/enroll', methods=['POST'])
+@login_required
+def enroll_in_class(class_id):
+    """Add students to a class while seats last, waitlisting the rest (registration-day path)."""
+    if current_user.role not in ['admin', 'teacher', 'parent']:
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classes', status=403)
+    try:
+        student_ids = [student_id for student_id in request.form.getlist('student_ids') if student_id]
+        program_types = request.form.getlist('program_types')
+        allowed = own_student_ids(student_ids)
+        if len(allowed) != len(student_ids):
+            return mutation_response('Access denied: You can only enroll your own children', 'danger', roster_endpoint(), status=403)
+        entries = [{'student_id': student_id, 'program_type': (program_types[i] if i < len(program_types) else None) or None}
+                   for i, student_id in enumerate(student_ids)]
+        index, conflicts = check_schedule(lambda index: index.check_roster(
+            class_id, [student_id for student_id in student_ids if student_id not in index.rosters.get(class_id, set())]))
+        if conflicts:
+            return mutation_response(schedule_conflict_message(conflicts, index), 'danger', roster_endpoint(), status=409)
+        result = change_roster(supabase, class_id, entries, locks=seat_locks, clashes=schedule_clashes(class_id))
+        commit_schedule_change(lambda index: index.set_roster(class_id, result['roster']), 'class_students', 'class_waitlist')
+        if partial_format() == 'json':
+            return result, 200
+        return mutation_response(f"{len(result['enrolled'])} enrolled{roster_change_note(result)}", 'success', roster_endpoint())
+    except Exception as e:
+        bump_version('class_students', 'class_waitlist')
+        logger.error(f"Error enrolling in class {class_id}: {str(e)}")
+        return mutation_response(f"Error enrolling: {str(e)}", 'danger', roster_endpoint(), status=500)
+
+@app.route('/classes/<class_id>/withdraw', methods=['POST'])
+@login_required
+def withdraw_from_class(class_id):
+    """Remove students from a class or its waitlist; freed seats go to the head of the waitlist."""
+    if current_user.role not in ['admin', 'teacher', 'parent']:
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classes', status=403)
+    try:
+        student_ids = [student_id for student_id in request.form.getlist('student_ids') if student_id]
+        if len(own_student_ids(student_ids)) != len(student_ids):
+            return mutation_response('Access denied: You can only withdraw your own children', 'danger', roster_endpoint(), status=403)
+        result = change_roster(supabase, class_id, [], removals=student_ids, locks=seat_locks,
+                               clashes=schedule_clashes(class_id))
+        commit_schedule_change(lambda index: index.set_roster(class_id, result['roster']), 'class_students', 'class_waitlist')
+        if partial_format() == 'json':
+            return result, 200
+        return mutation_response(f"{len(result['removed'])} withdrawn{roster_change_note(result)}", 'success', roster_endpoint())
+    except Exception as e:
+        bump_version('class_students', 'class_waitlist')
+        logger.error(f"Error withdrawing from class {class_id}: {str(e)}")
+        return mutation_response(f"Error withdrawing: {str(e)}", 'danger', roster_endpoint(), status=500)
+
+@app.route('/classes/<class_id>/waitlist', methods=['GET'])
+@login_required
+def class_waitlist(class_id):
+    """The class's waitlist in order, with the seats left."""
+    if current_user.role not in ['admin', 'teacher']:
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    try:
+        cls = supabase.table('classes').select('class_id, name, max_size').eq('class_id', class_id).execute().data
+        if not cls:
+            return {"error": "Class not found"}, 404
+        waiting = supabase.table(WAITLIST_TABLE).select('student_id, program_type, created_at, students(first_name, last_name)') \
+            .eq('class_id', class_id).order('position').execute().data
+        _, enrolled = check_schedule(lambda index: len(index.rosters.get(class_id, ())))
+        max_size = cls[0].get('max_size')
+        return {
+            'class_id': class_id,
+            'name': cls[0].get('name'),
+            'max_size': max_size,
+            'enrolled': enrolled,
+            'seats_left': None if max_size is None else max_size - enrolled,
+            'waitlist': [{'position': place, 'student_id': row['student_id'], 'program_type': row.get('program_type'),
+                          'name': f"{row['students']['last_name']}, {row['students']['first_name']}" if row.get('students') else None,
+                          'since': row.get('created_at')}
+                         for place, row in enumerate(waiting, start=1)],
+        }, 200
+    except Exception as e:
+        logger.error(f"Error fetching waitlist for class {class_id}: {str(e)}")
+        return {"error": str(e)}, 500
+
+@app.route('/schedule/conflicts', methods=['GET'])
+@login_required
+def schedule_conflicts():
+    """School-wide double bookings of students, teachers and classrooms."""
+    if current_user.role not in ['admin', 'teacher']:
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    try:
+        _, conflicts = check_schedule(lambda index: index.conflicts())
+        return {'conflicts': conflicts, 'count': len(conflicts)}, 200
+    except Exception as e:
+        logger.error(f"Error building schedule conflict report: {str(e)}")
+        return {"error": str(e)}, 500
+
+_schedule_labels = {'version': None, 'labels': None}
+
+def get_schedule_labels():
+    """Display names for teacher and classroom ids shown in timetable cells."""
+    version = data_version('teachers', 'classrooms')
+    if _schedule_labels['version'] != version:
+        teachers_response = supabase.table('teachers').select('teacher_id, first_name, last_name').execute()
+        classrooms_response = supabase.table('classrooms').select('classroom_id, building_number, room_number').execute()
+        labels = {t['teacher_id']: f"{t['last_name']}, {t['first_name']}" for t in teachers_response.data}
+        labels.update({c['classroom_id']: f"{c['building_number']} {c['room_number']}" for c in classrooms_response.data})
+        _schedule_labels.update(version=version, labels=labels)
+    return _schedule_labels['labels']
+
+def build_timetables(kind, entity_ids):
+    """Grid axes and one timetable per id, read from the shared index under its lock."""
+    index = get_schedule_index()
+    with _schedule_lock:
+        return index.axes(), [index.timetable(kind, entity_id) for entity_id in entity_ids]
+
+def render_timetable(title, subtitle, kind, entity_id):
+    (days, blocks), (timetable,) = build_timetables(kind, [entity_id])
+    return render_template('timetable/view.html', active_tab=None, title=title, subtitle=subtitle,
+                           timetable=timetable, days=days, blocks=blocks,
+                           labels=get_schedule_labels(), day_names=DAY_NAMES, user_role=current_user.role)
+
+@app.route('/timetable/student/<student_id>', methods=['GET'])
+@login_required
+def student_timetable(student_id):
+    try:
+        if current_user.role == 'parent':
+            link = supabase.table('student_parents').select('student_id').eq('student_id', student_id).eq('parent_id', current_user.parent_id).execute()
+            if not link.data:
+                flash('Access denied: Insufficient permissions', 'danger')
+                return redirect(url_for('students'))
+        elif current_user.role not in ['admin', 'teacher']:
+            flash('Access denied: Insufficient permissions', 'danger')
+            return redirect(url_for('students'))
+        response = supabase.table('students').select('first_name, last_name, grade_level').eq('student_id', student_id).execute()
+        if not response.data:
+            flash('Student not found', 'danger')
+            return redirect(url_for('students'))
+        student = response.data[0]
+        return render_timetable(f"{student['last_name']}, {student['first_name']}", f"Grade {student['grade_level']}",
+                                'student', student_id)
+    except Exception as e:
+        logger.error(f"Error building timetable for student {student_id}: {str(e)}")
+        flash(f"Error building timetable: {str(e)}", 'danger')
+        return redirect(url_for('students'))
+
+@app.route('/timetable/teacher/<teacher_id>', methods=['GET'])
+@login_required
+def teacher_timetable(teacher_id):
+    if current_user.role not in ['admin', 'teacher']:
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('students'))
+    try:
+        response = supabase.table('teachers').select('first_name, last_name').eq('teacher_id', teacher_id).execute()
+        if not response.data:
+            flash('Teacher not found', 'danger')
+            return redirect(url_for('teachers'))
+        teacher = response.data[0]
+        return render_timetable(f"{teacher['last_name']}, {teacher['first_name']}", None, 'teacher', teacher_id)
+    except Exception as e:
+        logger.error(f"Error building timetable for teacher {teacher_id}: {str(e)}")
+        flash(f"Error building timetable: {str(e)}", 'danger')
+        return redirect(url_for('teachers'))
+
+@app.route('/timetable/students/export', methods=['GET'])
+@login_required
+def export_student_timetables():
+    """Printable timetables for every student (optionally ?grade=), streamed one page per student."""
+    if current_user.role not in ['admin', 'teacher']:
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('students'))
+    try:
+        query = supabase.table('students').select('student_id, first_name, last_name, grade_level')
+        if request.args.get('grade'):
+            query = query.eq('grade_level', request.args['grade'])
+        students_data = query.order('last_name').order('first_name').execute().data
+        (days, blocks), timetables = build_timetables('student', [s['student_id'] for s in students_data])
+        sheets = (
+            {'title': f"{s['last_name']}, {s['first_name']}", 'subtitle': f"Grade {s['grade_level']}", 'timetable': timetable}
+            for s, timetable in zip(students_data, timetables)
+        )
+        return stream_template('timetable/print.html', sheets=sheets, days=days, blocks=blocks,
+                               labels=get_schedule_labels(), day_names=DAY_NAMES)
+    except Exception as e:
+        logger.error(f"Error exporting timetables: {str(e)}")
+        flash(f"Error exporting timetables: {str(e)}", 'danger')
+        return redirect(url_for('students'))
 
 @app.route('/classrooms', methods=['GET'])
 @login_required
@@ -799,20 +1073,20 @@ def classrooms():
         flash('Access denied: Insufficient permissions', 'danger')
         return redirect(url_for('students'))
     try:
-        response = supabase.table('classrooms').select('*').execute()
-        classrooms_data = sorted(response.data, key=lambda x: (x['building_number'].lower(), x['room_number'].lower()) if x['building_number'] and x['room_number'] else ('', ''))
-        return render_template('index.html', active_tab='classrooms', classrooms=classrooms_data, user_role=current_user.role)
+        response = supabase.table('classrooms').select('classroom_id, building_number, room_number').execute()
+        classrooms_data = [Classroom.from_row(row) for row in
+                           sorted(response.data, key=lambda x: (x['building_number'].lower(), x['room_number'].lower()) if x['building_number'] and x['room_number'] else ('', ''))]
+        return render_template('tabs/classrooms.html', active_tab='classrooms', classrooms=classrooms_data, user_role=current_user.role)
     except Exception as e:
         logger.error(f"Error fetching classrooms: {str(e)}")
         flash(f"Error fetching classrooms: {str(e)}", 'danger')
-        return render_template('index.html', active_tab='classrooms', classrooms=[], user_role=current_user.role)
+        return render_template('tabs/classrooms.html', active_tab='classrooms', classrooms=[], user_role=current_user.role)
 
 @app.route('/add_classroom', methods=['POST'])
 @login_required
 def add_classroom():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('classrooms'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classrooms', status=403)
     try:
         classroom_id = str(uuid.uuid4())
         data = {
@@ -821,44 +1095,46 @@ def add_classroom():
             'room_number': request.form.get('room_number')
         }
         supabase.table('classrooms').insert(data).execute()
-        flash('Classroom added successfully', 'success')
+        return mutation_response('Classroom added successfully', 'success', 'classrooms', 'classroom', data)
     except Exception as e:
         logger.error(f"Error adding classroom: {str(e)}")
-        flash(f"Error adding classroom: {str(e)}", 'danger')
-    return redirect(url_for('classrooms'))
+        return mutation_response(f"Error adding classroom: {str(e)}", 'danger', 'classrooms', status=500)
+    finally:
+        bump_version('classrooms')
 
 @app.route('/edit_classroom', methods=['POST'])
 @login_required
 def edit_classroom():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('classrooms'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classrooms', status=403)
     try:
         classroom_id = request.form.get('classroom_id')
         data = {
             'building_number': request.form.get('building_number'),
             'room_number': request.form.get('room_number')
         }
-        supabase.table('classrooms').update(data).eq('classroom_id', classroom_id).execute()
-        flash('Classroom updated successfully', 'success')
+        response = supabase.table('classrooms').update(data).eq('classroom_id', classroom_id).execute()
+        record = response.data[0] if response.data else None
+        return mutation_response('Classroom updated successfully', 'success', 'classrooms', 'classroom', record)
     except Exception as e:
         logger.error(f"Error editing classroom: {str(e)}")
-        flash(f"Error editing classroom: {str(e)}", 'danger')
-    return redirect(url_for('classrooms'))
+        return mutation_response(f"Error editing classroom: {str(e)}", 'danger', 'classrooms', status=500)
+    finally:
+        bump_version('classrooms')
 
 @app.route('/delete_classroom/<classroom_id>', methods=['POST'])
 @login_required
 def delete_classroom(classroom_id):
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('classrooms'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classrooms', status=403)
     try:
         supabase.table('classrooms').delete().eq('classroom_id', classroom_id).execute()
-        flash('Classroom deleted successfully', 'success')
+        return mutation_response('Classroom deleted successfully', 'success', 'classrooms', deleted=classroom_id)
     except Exception as e:
         logger.error(f"Error deleting classroom: {str(e)}")
-        flash(f"Error deleting classroom: {str(e)}", 'danger')
-    return redirect(url_for('classrooms'))
+        return mutation_response(f"Error deleting classroom: {str(e)}", 'danger', 'classrooms', status=500)
+    finally:
+        bump_version('classrooms')
 
 @app.route('/users', methods=['GET'])
 @login_required
@@ -867,26 +1143,19 @@ def users():
         flash('Access denied: Insufficient permissions', 'danger')
         return redirect(url_for('students'))
     try:
-        users_response = supabase.table('users').select('user_id, email, role, parent_id').execute()
-        parents_response = supabase.table('parents').select('parent_id, first_name, last_name').execute()
-        users_data = users_response.data
-        parents_data = parents_response.data
-        parent_map = {p['parent_id']: f"{p['last_name']}, {p['first_name']}" for p in parents_data}
-        for user in users_data:
-            user['parent_name'] = parent_map.get(user['parent_id'], None)
-        users_data = sorted(users_data, key=lambda x: x['email'].lower() if x['email'] else '')
-        return render_template('index.html', active_tab='users', users=users_data, parents=parents_data, user_role=current_user.role)
+        users_response = supabase.table('users').select(USER_LIST_COLUMNS).execute()
+        users_data = sorted(map(user_row_from_embedded, users_response.data), key=lambda x: x['email'].lower() if x['email'] else '')
+        return render_template('tabs/users.html', active_tab='users', users=users_data, user_role=current_user.role)
     except Exception as e:
         logger.error(f"Error fetching users: {str(e)}")
         flash(f"Error fetching users: {str(e)}", 'danger')
-        return render_template('index.html', active_tab='users', users=[], parents=[], user_role=current_user.role)
+        return render_template('tabs/users.html', active_tab='users', users=[], user_role=current_user.role)
 
 @app.route('/add_user', methods=['POST'])
 @login_required
 def add_user():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('users'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'users', status=403)
     try:
         user_id = str(uuid.uuid4())
         email = request.form.get('email')
@@ -894,28 +1163,28 @@ def add_user():
         role = request.form.get('role')
         parent_id = request.form.get('parent_id') or None
         if role == 'parent' and not parent_id:
-            flash('Parent ID is required for parent role', 'danger')
-            return redirect(url_for('users'))
+            return mutation_response('Parent ID is required for parent role', 'danger', 'users')
         data = {
             'user_id': user_id,
             'email': email,
-            'password_hash': bcrypt.generate_password_hash(password).decode('utf-8'),
+            'password_hash': password_verifier.hash_password(password),
             'role': role,
             'parent_id': parent_id
         }
         supabase.table('users').insert(data).execute()
-        flash('User added successfully', 'success')
+        record = load_user_row(data) if partial_format() else None
+        return mutation_response('User added successfully', 'success', 'users', 'user', record)
     except Exception as e:
         logger.error(f"Error adding user: {str(e)}")
-        flash(f"Error adding user: {str(e)}", 'danger')
-    return redirect(url_for('users'))
+        return mutation_response(f"Error adding user: {str(e)}", 'danger', 'users', status=500)
+    finally:
+        bump_version('users')
 
 @app.route('/edit_user', methods=['POST'])
 @login_required
 def edit_user():
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('users'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'users', status=403)
     try:
         user_id = request.form.get('user_id')
         data = {
@@ -924,109 +1193,127 @@ def edit_user():
             'parent_id': request.form.get('parent_id') or None
         }
         if data['role'] == 'parent' and not data['parent_id']:
-            flash('Parent ID is required for parent role', 'danger')
-            return redirect(url_for('users'))
+            return mutation_response('Parent ID is required for parent role', 'danger', 'users')
         password = request.form.get('password')
         if password:
-            data['password_hash'] = bcrypt.generate_password_hash(password).decode('utf-8')
+            data['password_hash'] = password_verifier.hash_password(password)
         supabase.table('users').update(data).eq('user_id', user_id).execute()
-        flash('User updated successfully', 'success')
+        record = load_user_row({'user_id': user_id, **data}) if partial_format() else None
+        return mutation_response('User updated successfully', 'success', 'users', 'user', record)
     except Exception as e:
         logger.error(f"Error editing user: {str(e)}")
-        flash(f"Error editing user: {str(e)}", 'danger')
-    return redirect(url_for('users'))
+        return mutation_response(f"Error editing user: {str(e)}", 'danger', 'users', status=500)
+    finally:
+        bump_version('users')
 
 @app.route('/delete_user/<user_id>', methods=['POST'])
 @login_required
 def delete_user(user_id):
     if current_user.role != 'admin':
-        flash('Access denied: Insufficient permissions', 'danger')
-        return redirect(url_for('users'))
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'users', status=403)
     try:
         supabase.table('users').delete().eq('user_id', user_id).execute()
-        flash('User deleted successfully', 'success')
+        return mutation_response('User deleted successfully', 'success', 'users', deleted=user_id)
     except Exception as e:
         logger.error(f"Error deleting user: {str(e)}")
-        flash(f"Error deleting user: {str(e)}", 'danger')
-    return redirect(url_for('users'))
+        return mutation_response(f"Error deleting user: {str(e)}", 'danger', 'users', status=500)
+    finally:
+        bump_version('users')
+
+def fetch_tuition_inputs():
+    students_response = supabase.table('students').select('student_id, first_name, last_name, grade_level').execute()
+    student_parents_response = supabase.table('student_parents').select('student_id, parent_id').execute()
+    class_students_response = supabase.table('class_students').select('class_id, student_id, program_type').execute()
+    classes_response = supabase.table('classes').select('class_id, days').execute()
+    return students_response.data, student_parents_response.data, class_students_response.data, classes_response.data
+
+def tuition_scope():
+    """(parent_id, all_students) for the current user's ledger: admins see the whole school, a
+    parent only their own students, anyone else (including a parent login whose parent record was
+    deleted) nothing."""
+    if current_user.role == 'admin':
+        return None, True
+    return (current_user.parent_id if current_user.role == 'parent' else None), False
+
+def fetch_tuition_ledger(pricing_table, parent_id=None, all_students=False):
+    """Final ledger rows (see compute_tuition_ledger): every student with all_students, else only
+    parent_id's students (none without a parent_id).
+
+    Priced from the local read replica when it is fresh, else by the tuition_ledger database
+    function when installed, so only one row per student crosses the wire; otherwise every input
+    table is fetched and priced here.
+    """
+    conn = replica.connection('students', 'student_parents', 'class_students', 'classes') if replica else None
+    if conn is not None:
+        return sqlite_tuition_ledger(conn, pricing_table, parent_id, all_students)
+    try:
+        return call_function(supabase, TUITION_LEDGER_FUNCTION,
+                             ledger_function_params(pricing_table, parent_id, all_students))
+    except FunctionUnavailable:
+        students_data, student_parents_data, class_students_data, classes_data = fetch_tuition_inputs()
+        ledger = compute_tuition_ledger(pricing_table, students_data, student_parents_data,
+                                        class_students_data, classes_data)
+        return scope_ledger(ledger, student_parents_data, parent_id, all_students).to_dict('records')
 
 @app.route('/tuition', methods=['GET'])
 @login_required
 def tuition():
     try:
-        students_response = supabase.table('students').select('student_id, first_name, last_name, grade_level').execute()
-        student_parents_response = supabase.table('student_parents').select('student_id, parent_id').execute()
-        class_students_response = supabase.table('class_students').select('class_id, student_id, program_type').execute()
-        classes_response = supabase.table('classes').select('class_id, name, days').execute()
-
-        students_data = students_response.data
-        student_parents_data = student_parents_response.data
-        class_students_data = class_students_response.data
-        classes_data = classes_response.data
-
-        # Build class-student mapping
-        student_classes_map = {}
-        for cs in class_students_data:
-            student_id = cs['student_id']
-            if student_id not in student_classes_map:
-                student_classes_map[student_id] = []
-            student_classes_map[student_id].append({
-                'class_id': cs['class_id'],
-                'program_type': cs['program_type']
-            })
-
-        # Build parent-student mapping
-        parent_student_map = {}
-        for sp in student_parents_data:
-            parent_id = sp['parent_id']
-            student_id = sp['student_id']
-            if parent_id not in parent_student_map:
-                parent_student_map[parent_id] = []
-            parent_student_map[parent_id].append(student_id)
-
-        # Calculate base tuition for each student
-        tuition_records_by_parent = {}
-        for student in students_data:
-            student_id = student['student_id']
-            if current_user.role == 'parent':
-                parent_students = parent_student_map.get(current_user.parent_id, [])
-                if student_id not in parent_students:
-                    continue
-            assignments = student_classes_map.get(student_id, [])
-            amount = calculate_student_tuition(student['grade_level'], assignments)
-            parent_id = next((sp['parent_id'] for sp in student_parents_data if sp['student_id'] == student_id), None)
-            
-            if parent_id not in tuition_records_by_parent:
-                tuition_records_by_parent[parent_id] = []
-            
-            tuition_records_by_parent[parent_id].append({
-                'student_id': student_id,
-                'student_name': f"{student['last_name']}, {student['first_name']}",
-                'grade': student['grade_level'],
-                'amount': amount,
-                'parent_id': parent_id
-            })
-
-        # Apply sibling discount per family
-        tuition_records = []
-        for parent_id, records in tuition_records_by_parent.items():
-            discounted_records = apply_sibling_discount_per_family(records)
-            for record in discounted_records:
-                status = 'Pending' if record['amount'] > 0 else 'No Charge'
-                tuition_records.append({
-                    'student_name': record['student_name'],
-                    'grade': record['grade'],
-                    'amount': f"${record['amount']:.2f}",
-                    'status': status
-                })
+        parent_id, all_students = tuition_scope()
+        ledger = fetch_tuition_ledger(get_pricing_table(request.args.get('school_year')), parent_id, all_students)
+        tuition_records = [
+            {
+                'student_name': record['student_name'],
+                'grade': record['grade'],
+                'amount': f"${float(record['amount']):.2f}",
+                'status': 'Pending' if float(record['amount']) > 0 else 'No Charge'
+            }
+            for record in ledger
+        ]
 
         tuition_records = sorted(tuition_records, key=lambda x: x['student_name'].lower())
-        return render_template('index.html', active_tab='tuition', tuition=tuition_records, user_role=current_user.role)
+        return render_template('tabs/tuition.html', active_tab='tuition', tuition=tuition_records, user_role=current_user.role)
     except Exception as e:
         logger.error(f"Error fetching tuition: {str(e)}")
         flash(f"Error fetching tuition: {str(e)}", 'danger')
-        return render_template('index.html', active_tab='tuition', tuition=[], user_role=current_user.role)
+        return render_template('tabs/tuition.html', active_tab='tuition', tuition=[], user_role=current_user.role)
+
+@app.route('/tuition/what_if', methods=['POST'])
+@login_required
+def tuition_what_if():
+    """Re-price the whole school under an alternate pricing table without writing anything."""
+    if current_user.role != 'admin':
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    try:
+        live_table = get_pricing_table(request.form.get('school_year'))
+        file = request.files.get('file')
+        if file and file.filename.endswith('.xlsx'):
+            proposed_table = load_pricing_table(file, request.form.get('proposed_school_year') or live_table.school_year)
+        elif request.form.get('proposed_school_year'):
+            proposed_table = get_pricing_table(request.form.get('proposed_school_year'))
+        else:
+            return {"error": "Upload a pricing workbook (.xlsx) or choose a proposed_school_year"}, 400
+
+        inputs = fetch_tuition_inputs()
+        live = compute_tuition_ledger(live_table, *inputs)
+        proposed = compute_tuition_ledger(proposed_table, *inputs)
+        comparison = live[['student_id', 'student_name', 'grade', 'amount']].merge(
+            proposed[['student_id', 'amount']], on='student_id', suffixes=('_live', '_proposed'))
+        comparison['difference'] = comparison['amount_proposed'] - comparison['amount_live']
+        comparison = comparison.sort_values('student_name', key=lambda names: names.str.lower())
+        return {
+            'live': {**live_table.to_dict(), 'total': round(float(live['amount'].sum()), 2)},
+            'proposed': {**proposed_table.to_dict(), 'total': round(float(proposed['amount'].sum()), 2)},
+            'difference': round(float(comparison['difference'].sum()), 2),
+            'students': comparison.round(2).to_dict('records')
+        }, 200
+    except Exception as e:
+        logger.error(f"Error computing what-if tuition: {str(e)}")
+        return {"error": str(e)}, 500
     
+# Rows per insert request for bulk imports
+IMPORT_CHUNK_SIZE = 500
+
 @app.route('/import_from_csv', methods=['POST'])
 @login_required
 def import_from_csv():
@@ -1038,17 +1325,19 @@ def import_from_csv():
         if not file or not file.filename.endswith('.csv'):
             flash('Please upload a valid CSV file', 'danger')
             return redirect(url_for('students'))
-        df = pd.read_csv(io.StringIO(file.read().decode('utf-8')))
-        for _, row in df.iterrows():
-            first_name, last_name = parse_student_name(row.get('StudentName'))
-            if not first_name or not last_name:
+        df = pd.read_csv(io.StringIO(file.read().decode('utf-8-sig')), dtype=str)
+        df.columns = df.columns.str.strip()
+        names = parse_student_name_series(df['StudentName'])
+        grades = normalize_grade_series(df['Grade'])
+
+        existing = supabase.table('students').select('student_id, first_name, last_name, grade_level, email').execute()
+        index = DedupIndex('student', existing.data)
+        rows, exact, probable = [], 0, []
+        for first_name, last_name, grade_level in zip(names['first_name'], names['last_name'], grades):
+            if not first_name or not last_name or not grade_level:
                 continue
-            grade_level = normalize_grade(row.get('Grade'))
-            if not grade_level:
-                continue
-            student_id = str(uuid.uuid4())
             data = {
-                'student_id': student_id,
+                'student_id': str(uuid.uuid4()),
                 'first_name': first_name,
                 'last_name': last_name,
                 'grade_level': grade_level,
@@ -1059,18 +1348,527 @@ def import_from_csv():
                 'medical_conditions': None,
                 'comments': None
             }
-            supabase.table('students').insert(data).execute()
-        flash('Students imported successfully', 'success')
+            match = index.classify(data)
+            if match.status == 'exact':
+                exact += 1
+                continue
+            if match.status == 'probable':
+                probable.append(f"{last_name}, {first_name} ({grade_level})")
+                continue
+            index.add(data)
+            rows.append(data)
+        for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+            supabase.table('students').insert(rows[start:start + IMPORT_CHUNK_SIZE]).execute()
+        flash(f"Imported {len(rows)} new students; skipped {exact} already on file", 'success')
+        if probable:
+            flash(f"{len(probable)} rows look like existing students and were not imported, please review: "
+                  f"{'; '.join(probable[:20])}{' ...' if len(probable) > 20 else ''}", 'warning')
     except Exception as e:
         logger.error(f"Error importing CSV: {str(e)}")
         flash(f"Error importing CSV: {str(e)}", 'danger')
+    finally:
+        bump_version('students')
     return redirect(url_for('students'))
 
+def import_report_response(report, summary, endpoint):
+    """Per-row import report as JSON, or flashed (summary plus the rows that need attention) with a redirect."""
+    if partial_format():
+        return {'summary': summary, 'rows': report}, 200
+    flash(summary, 'success')
+    problems = [f"row {r['row']}: {r['message']}" for r in report if r['status'] not in ('created', 'linked')]
+    if problems:
+        flash(f"{len(problems)} rows need attention: {'; '.join(problems[:20])}{' ...' if len(problems) > 20 else ''}", 'warning')
+    return redirect(url_for(endpoint))
+
+def student_name_index():
+    """(last, first) name keys -> student_ids, for resolving names typed in import files."""
+    students_response = supabase.table('students').select('student_id, first_name, last_name').execute()
+    index = {}
+    for student in students_response.data:
+        index.setdefault((name_key(student['last_name']), name_key(student['first_name'])), []).append(student['student_id'])
+    return index
+
+@app.route('/import_parents', methods=['POST'])
+@login_required
+def import_parents():
+    """Bulk parent import (First Name, Last Name, Email, Phone, Is Staff, optional Students).
+
+    Students is a ';' separated list of 'Last, First' names that are linked to the parent.
+    """
+    if current_user.role != 'admin':
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('parents'))
+    try:
+        file = request.files.get('file')
+        if not file or not file.filename.endswith('.csv'):
+            flash('Please upload a valid CSV file', 'danger')
+            return redirect(url_for('parents'))
+        df = pd.read_csv(io.StringIO(file.read().decode('utf-8-sig')), dtype=str).fillna('')
+        df.columns = df.columns.str.strip()
+        first_names = clean_string_series(df['First Name'])
+        last_names = clean_string_series(df['Last Name'])
+        emails = df['Email'].str.strip()
+        phones = format_phone_series(df['Phone'].str.strip())
+        staff = df['Is Staff'].str.strip().str.lower().isin(['yes', 'y', 'true', '1']) if 'Is Staff' in df else [False] * len(df)
+        student_names = df['Students'] if 'Students' in df else [''] * len(df)
+
+        existing_parents = supabase.table('parents').select('parent_id, first_name, last_name, email, phone').execute().data
+        parents_index = DedupIndex('parent', existing_parents)
+        parent_names = {p['parent_id']: f"{(p['last_name'] or '').strip()}, {(p['first_name'] or '').strip()}" for p in existing_parents}
+        students_index = student_name_index()
+        existing_links = {(l['student_id'], l['parent_id']) for l in supabase.table('student_parents').select('student_id, parent_id').execute().data}
+
+        parent_rows, link_rows, report = [], [], []
+        for row_number, (first_name, last_name, email, phone, is_staff, names) in enumerate(
+                zip(first_names, last_names, emails, phones, staff, student_names), start=2):
+            if not first_name or not last_name:
+                report.append({'row': row_number, 'status': 'skipped', 'message': 'First and last name are required'})
+                continue
+            data = {
+                'parent_id': str(uuid.uuid4()),
+                'first_name': first_name,
+                'last_name': last_name,
+                'email': email or None,
+                'phone': phone or None,
+                'is_staff': bool(is_staff)
+            }
+            match = parents_index.classify(data)
+            if match.status == 'probable':
+                report.append({'row': row_number, 'status': 'review', 'parent_id': match.record_id,
+                               'message': f"{last_name}, {first_name} may already exist (same {match.rule}); not imported"})
+                continue
+            if match.status == 'exact':
+                parent_id, status = match.record_id, 'linked'
+            else:
+                parent_id, status = data['parent_id'], 'created'
+                parents_index.add(data)
+                parent_names[data['parent_id']] = f"{last_name}, {first_name}"
+                parent_rows.append(data)
+
+            messages, linked = [], 0
+            for name in [n for n in names.split(';') if n.strip()]:
+                student_first, student_last = parse_student_name(name)
+                student_ids = students_index.get((name_key(student_last), name_key(student_first)), [])
+                if len(student_ids) != 1:
+                    messages.append(f"student '{name.strip()}' {'is ambiguous' if student_ids else 'not found'}")
+                    continue
+                if (student_ids[0], parent_id) not in existing_links:
+                    existing_links.add((student_ids[0], parent_id))
+                    link_rows.append({'student_id': student_ids[0], 'parent_id': parent_id})
+                    linked += 1
+            if messages:
+                status = 'partial'
+            if match.status == 'note':
+                messages.append(f"same {match.rule} as {parent_names.get(match.record_id, match.record_id)}")
+            prefix = 'Created' if parent_id == data['parent_id'] else 'Already on file'
+            report.append({'row': row_number, 'status': status, 'parent_id': parent_id,
+                           'message': '; '.join([f"{prefix}: {last_name}, {first_name}, {linked} student link(s)"] + messages)})
+
+        for start in range(0, len(parent_rows), IMPORT_CHUNK_SIZE):
+            supabase.table('parents').insert(parent_rows[start:start + IMPORT_CHUNK_SIZE]).execute()
+        for start in range(0, len(link_rows), IMPORT_CHUNK_SIZE):
+            supabase.table('student_parents').insert(link_rows[start:start + IMPORT_CHUNK_SIZE]).execute()
+        summary = f"Imported {len(parent_rows)} new parents and {len(link_rows)} student links from {len(df)} rows"
+        return import_report_response(report, summary, 'parents')
+    except Exception as e:
+        logger.error(f"Error importing parents: {str(e)}")
+        flash(f"Error importing parents: {str(e)}", 'danger')
+        return redirect(url_for('parents'))
+    finally:
+        bump_version('parents', 'student_parents')
+
+def import_term(term):
+    """'S1', 'S1, S2', 'Semester 1', 'Both' -> the classes.term value, or None when blank."""
+    if not term:
+        return None
+    normalized = normalize_csv_term(term)
+    if normalized not in TERM_SEMESTERS:
+        normalized = normalize_csv_term(term.replace(' ', ''))
+    return normalized
+
+@app.route('/import_enrollments', methods=['POST'])
+@login_required
+def import_enrollments():
+    """Bulk roster import (Class Name, Term, Student, Program Type) added to the existing class_students.
+
+    Classes are resolved by name (section code in brackets ignored) and term, students by 'Last, First'.
+    Rows that would double-book the student are rejected. Seats are taken through change_roster, one
+    call per class, so rows beyond a class's max_size join its waitlist in file order.
+    """
+    if current_user.role != 'admin':
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('classes'))
+    try:
+        file = request.files.get('file')
+        if not file or not file.filename.endswith('.csv'):
+            flash('Please upload a valid CSV file', 'danger')
+            return redirect(url_for('classes'))
+        df = pd.read_csv(io.StringIO(file.read().decode('utf-8-sig')), dtype=str).fillna('')
+        df.columns = df.columns.str.strip()
+        class_names = clean_string_series(df['Class Name'])
+        terms = df['Term'] if 'Term' in df else [''] * len(df)
+        program_types = df['Program Type'].str.strip().str.lower()
+
+        classes_data = supabase.table('classes').select('class_id, name, term, max_size').execute().data
+        classes_by_key, classes_by_name = {}, {}
+        for cls in classes_data:
+            key = name_key(strip_bracket_code(cls['name'] or ''))
+            classes_by_key.setdefault((key, cls['term']), []).append(cls)
+            classes_by_name.setdefault(key, []).append(cls)
+        students_index = student_name_index()
+        enrolled = {}
+        for row in supabase.table('class_students').select('class_id, student_id').execute().data:
+            enrolled.setdefault(row['class_id'], set()).add(row['student_id'])
+        schedule = get_schedule_index()
+        with _schedule_lock:
+            class_slots = dict(schedule.slots)
+            student_slots = {}
+
+        rows, report = [], []
+        for row_number, (class_name, term, student_name, program_type) in enumerate(
+                zip(class_names, terms, df['Student'], program_types), start=2):
+            term = import_term(term)
+            key = name_key(strip_bracket_code(class_name))
+            candidates = classes_by_key.get((key, term), []) if term else classes_by_name.get(key, [])
+            if len(candidates) != 1:
+                report.append({'row': row_number, 'status': 'skipped',
+                               'message': f"class '{class_name}' ({term or 'any term'}) {'is ambiguous' if candidates else 'not found'}"})
+                continue
+            cls = candidates[0]
+            first_name, last_name = parse_student_name(student_name)
+            student_ids = students_index.get((name_key(last_name), name_key(first_name)), [])
+            if len(student_ids) != 1:
+                report.append({'row': row_number, 'status': 'skipped',
+                               'message': f"student '{student_name.strip()}' {'is ambiguous' if student_ids else 'not found'}"})
+                continue
+            student_id = student_ids[0]
+            if program_type not in PROGRAM_TYPES:
+                report.append({'row': row_number, 'status': 'skipped',
+                               'message': f"invalid program type '{program_type}' (one of {', '.join(PROGRAM_TYPES)})"})
+                continue
+            roster = enrolled.setdefault(cls['class_id'], set())
+            if student_id in roster:
+                report.append({'row': row_number, 'status': 'exists', 'message': f"{student_name.strip()} already in {cls['name']}"})
+                continue
+            # Existing enrollments are checked through the schedule index, rows earlier in this file locally
+            slots = class_slots.get(cls['class_id'], frozenset())
+            with _schedule_lock:
+                clashes = schedule.check_roster(cls['class_id'], [student_id])
+            if clashes or slots & student_slots.get(student_id, set()):
+                report.append({'row': row_number, 'status': 'conflict',
+                               'message': f"{student_name.strip()} is already booked at that time ({cls['name']})"})
+                continue
+            student_slots.setdefault(student_id, set()).update(slots)
+            roster.add(student_id)
+            entry = {'row': row_number, 'status': 'created', 'message': f"{student_name.strip()} -> {cls['name']}"}
+            rows.append((cls, {'student_id': student_id, 'program_type': program_type}, entry))
+            report.append(entry)
+
+        by_class, created, rosters = {}, 0, {}
+        for cls, row, entry in rows:
+            by_class.setdefault(cls['class_id'], (cls, []))[1].append((row, entry))
+        for class_id, (cls, class_rows) in by_class.items():
+            result = change_roster(supabase, class_id, [row for row, _ in class_rows], locks=seat_locks,
+                                   clashes=schedule_clashes(class_id), chunk_size=IMPORT_CHUNK_SIZE)
+            rosters[class_id] = result['roster']
+            positions = {entry['student_id']: entry['position'] for entry in result['waitlisted']}
+            rejected = set(result.get('rejected', ()))
+            for row, entry in class_rows:
+                if row['student_id'] in positions:
+                    entry.update(status='waitlisted', message=f"{entry['message']}: full, waitlisted at position {positions[row['student_id']]}")
+                elif row['student_id'] in rejected:
+                    entry.update(status='full', message=f"{cls['name']} is full ({cls['max_size']})")
+                else:
+                    created += 1
+
+        def apply_rosters(index):
+            for class_id, roster in rosters.items():
+                index.set_roster(class_id, roster)
+
+        commit_schedule_change(apply_rosters, 'class_students', 'class_waitlist')
+        summary = f"Imported {created} enrollments into {len(rosters)} classes from {len(df)} rows"
+        return import_report_response(report, summary, 'classes')
+    except Exception as e:
+        bump_version('class_students', 'class_waitlist')
+        logger.error(f"Error importing enrollments: {str(e)}")
+        flash(f"Error importing enrollments: {str(e)}", 'danger')
+        return redirect(url_for('classes'))
+
+@app.route('/admin/snapshot', methods=['POST'])
+@login_required
+def create_snapshot():
+    """Write a full snapshot (backups/ CSV layout plus manifest.json) under backups/snapshots/."""
+    if current_user.role != 'admin':
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    try:
+        directory = default_snapshot_dir()
+        manifest = write_snapshot(supabase, directory, compress=request.values.get('gzip') == '1')
+        logger.info(f"Snapshot written to {directory} by {current_user.email}")
+        return {'directory': directory, **manifest}, 200
+    except Exception as e:
+        logger.error(f"Error writing snapshot: {str(e)}")
+        return {"error": str(e)}, 500
+
+@app.route('/admin/snapshot/<table>', methods=['GET'])
+@login_required
+def download_snapshot_table(table):
+    """Stream one table as <table>_rows.csv (?gzip=1 for .csv.gz) without loading it into memory."""
+    if current_user.role != 'admin':
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    if table not in SNAPSHOT_TABLES:
+        return {"error": f"Unknown table: {table}"}, 404
+    compress = request.args.get('gzip') == '1'
+    chunks = iter_table_csv(supabase, table)
+    try:
+        # First page before the response starts, so a table that isn't installed is a 404, not a cut-off file
+        first = next(chunks)
+    except Exception as e:
+        if not is_missing_table(e):
+            raise
+        return {"error": f"Table not installed: {table}"}, 404
+
+    def generate():
+        compressor = zlib.compressobj(wbits=31) if compress else None  # wbits=31: gzip container
+        for text in itertools.chain([first], chunks):
+            data = text.encode('utf-8')
+            yield compressor.compress(data) if compressor else data
+        if compressor:
+            yield compressor.flush()
+
+    headers = {'Content-Disposition': f'attachment; filename={snapshot_file(table, compress)}'}
+    return app.response_class(stream_with_context(generate()), headers=headers,
+                              mimetype='application/gzip' if compress else 'text/csv')
+
+def load_rollover_plan():
+    """Current students, enrollments and classes -> (rollover plan, class_ids that have enrollments)."""
+    students_data = supabase.table('students').select('student_id, first_name, last_name, grade_level').execute().data
+    class_students_data = supabase.table('class_students').select('class_id, student_id').execute().data
+    classes_data = supabase.table('classes').select('class_id, name, term').execute().data
+    plan = plan_rollover(students_data, class_students_data, classes_data)
+    return plan, [row['class_id'] for row in class_students_data]
+
+@app.route('/admin/profiles', methods=['GET'])
+@login_required
+def profiles():
+    if current_user.role != 'admin':
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('students'))
+    request_profiler.active()
+    saved = request_profiler.profiles()
+    response = app.make_response(render_template('profiles.html', profiler=request_profiler, profiles=saved,
+                                                 routes=route_summaries(saved), user_role=current_user.role))
+    # Lets this admin's browser force a profile with ?profile=1 (see profile_force_allowed)
+    response.set_cookie(PROFILE_FORCE_COOKIE, profile_force_signer.dumps(current_user.id), max_age=PROFILE_FORCE_SECONDS,
+                        httponly=True, samesite='Lax', secure=request.is_secure)
+    return response
+
+@app.route('/admin/profiles', methods=['POST'])
+@login_required
+def configure_profiles():
+    if current_user.role != 'admin':
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'students', status=403)
+    try:
+        sample_rate = float(request.form.get('sample_rate') or 0) / 100
+        enabled = request.form.get('enabled') == 'on'
+        request_profiler.configure(enabled, sample_rate)
+        message = f"Profiling on for {sample_rate:.0%} of requests plus ?profile=1" if enabled else 'Profiling off'
+        return mutation_response(message, 'success', 'profiles')
+    except Exception as e:
+        logger.error(f"Error configuring profiler: {str(e)}")
+        return mutation_response(f"Error configuring profiler: {str(e)}", 'danger', 'profiles')
+
+@app.route('/admin/profiles/<profile_id>', methods=['GET'])
+@login_required
+def profile_detail(profile_id):
+    """One saved profile: its summary as JSON, or the raw pstats file with ?download=1."""
+    if current_user.role != 'admin':
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    if request.args.get('download'):
+        path = request_profiler.stats_path(profile_id)
+        if path is None:
+            return {"error": "Profile not found"}, 404
+        return send_file(os.path.abspath(path), as_attachment=True, download_name=f"{profile_id}.prof")
+    summary = request_profiler.load(profile_id)
+    if summary is None:
+        return {"error": "Profile not found"}, 404
+    return summary, 200
+
+ANALYTICS_TABLES = ('students', 'classes', 'class_students', 'teachers', 'classrooms')
+_analytics_cache = {'version': None, 'data': None}
+_analytics_lock = threading.Lock()
+
+def get_enrollment_analytics():
+    """Dashboard figures (see enrollment_analytics), recomputed only after one of their tables changes."""
+    with _analytics_lock:
+        version = data_version(*ANALYTICS_TABLES)
+        if _analytics_cache['version'] != version:
+            _analytics_cache['data'] = enrollment_analytics(*(iter_table_rows(supabase, table) for table in ANALYTICS_TABLES))
+            _analytics_cache['version'] = version
+        return _analytics_cache['data']
+
+@app.route('/analytics', methods=['GET'])
+@login_required
+def analytics():
+    if current_user.role != 'admin':
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('students'))
+    try:
+        data = get_enrollment_analytics()
+    except Exception as e:
+        logger.error(f"Error computing analytics: {str(e)}")
+        if request.args.get('format') == 'json':
+            return {"error": str(e)}, 500
+        flash(f"Error computing analytics: {str(e)}", 'danger')
+        return redirect(url_for('classes'))
+    if request.args.get('format') == 'json':
+        return data, 200
+    return render_template('analytics.html', active_tab='analytics', data=data, user_role=current_user.role)
+
+@app.route('/admin/rollover', methods=['GET'])
+@login_required
+def rollover_preview():
+    """Preview of the end-of-year rollover (JSON with format=json)."""
+    if current_user.role != 'admin':
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('students'))
+    try:
+        plan, _ = load_rollover_plan()
+        if partial_format():
+            return plan, 200
+        return render_template('rollover.html', plan=plan, user_role=current_user.role)
+    except Exception as e:
+        logger.error(f"Error previewing rollover: {str(e)}")
+        flash(f"Error previewing rollover: {str(e)}", 'danger')
+        return redirect(url_for('students'))
+
+@app.route('/admin/rollover', methods=['POST'])
+@login_required
+def rollover_apply():
+    """Archive a snapshot, then apply the previewed rollover in bulk.
+
+    The form must echo the preview's fingerprint; if the data changed since, nothing is written.
+    """
+    if current_user.role != 'admin':
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'students', status=403)
+    try:
+        plan, enrollment_class_ids = load_rollover_plan()
+        if request.form.get('fingerprint') != plan['fingerprint']:
+            return mutation_response('The data changed since the rollover preview was generated; review the new preview',
+                                     'warning', 'rollover_preview', status=409)
+        directory = default_snapshot_dir() + '-rollover'
+        write_snapshot(supabase, directory)
+        with open(os.path.join(directory, 'rollover.json'), 'w') as f:
+            json.dump(plan, f, indent=2)
+        counts = apply_rollover(supabase, plan, enrollment_class_ids)
+
+        def clear_rosters(index):
+            for class_id in list(index.rosters):
+                index.set_roster(class_id, ())
+
+        commit_schedule_change(clear_rosters, 'students', 'student_parents', 'class_students', 'class_waitlist')
+        logger.info(f"Rollover applied by {current_user.email}, archive {directory}")
+        message = (f"Rollover complete: {counts['promoted']} students promoted, {counts['graduated']} graduated, "
+                   f"{counts['enrollments_cleared']} enrollments cleared. Archive: {directory}")
+        if partial_format():
+            return {'message': message, 'archive': directory, **counts}, 200
+        flash(message, 'success')
+        return redirect(url_for('students'))
+    except Exception as e:
+        bump_version('students', 'student_parents', 'class_students', 'class_waitlist')
+        logger.error(f"Error applying rollover: {str(e)}")
+        return mutation_response(f"Error applying rollover: {str(e)}", 'danger', 'rollover_preview', status=500)
+
+def load_section_plan(course=None, additions=(), program_type=None, students_data=None, classes_data=None):
+    """Section balancing plan (see plan_sections) over the current classes, rosters and waitlists."""
+    if students_data is None:
+        students_data = iter_table_rows(supabase, 'students')
+    if classes_data is None:
+        classes_data = load_section_classes(supabase)
+    return plan_sections(classes_data, iter_table_rows(supabase, 'class_students'),
+                         students_data, load_waitlists(supabase),
+                         course=course or None, additions=additions, program_type=program_type)
+
+def section_plan_args():
+    """(course, student_ids to add, program_type) from the query string or the apply form."""
+    additions = [student_id for student_id in request.values.getlist('student_ids') if student_id]
+    return request.values.get('course') or None, additions, request.values.get('program_type') or None
+
+@app.route('/admin/sections', methods=['GET'])
+@login_required
+def sections_preview():
+    """Preview of balanced section assignments for every multi-section course, or one with ?course=
+    (JSON with format=json). student_ids/program_type add students to that course."""
+    if current_user.role != 'admin':
+        flash('Access denied: Insufficient permissions', 'danger')
+        return redirect(url_for('classes'))
+    try:
+        course, additions, program_type = section_plan_args()
+        if additions and (not course or program_type not in PROGRAM_TYPES):
+            flash(f"Adding students needs a course and a program type (one of {', '.join(PROGRAM_TYPES)})", 'danger')
+            return redirect(url_for('sections_preview', course=course) if course else url_for('sections_preview'))
+        started = time.perf_counter()
+        students_data = list(iter_table_rows(supabase, 'students'))
+        plan = load_section_plan(course, additions, program_type, students_data)
+        logger.info(f"Section plan for {course or 'all courses'} in {time.perf_counter() - started:.2f}s: {plan['summary']}")
+        if partial_format():
+            return plan, 200
+        choices = sorted(({'student_id': student['student_id'], 'name': f"{student['last_name']}, {student['first_name']}",
+                           'grade_level': student.get('grade_level')} for student in students_data),
+                         key=lambda student: student['name'].casefold()) if course else []
+        return render_template('sections.html', plan=plan, course=course, additions=additions, students=choices,
+                               program_type=program_type, program_types=PROGRAM_TYPES, user_role=current_user.role)
+    except Exception as e:
+        logger.error(f"Error planning sections: {str(e)}")
+        flash(f"Error planning sections: {str(e)}", 'danger')
+        return redirect(url_for('classes'))
+
+@app.route('/admin/sections', methods=['POST'])
+@login_required
+def sections_apply():
+    """Apply the previewed section plan; the form echoes the preview's fingerprint and arguments.
+
+    The plan is rebuilt and written while holding the seat locks of every section involved, so no
+    enrollment through this host can land between the fingerprint check and the writes.
+    """
+    if current_user.role != 'admin':
+        return mutation_response('Access denied: Insufficient permissions', 'danger', 'classes', status=403)
+    try:
+        course, additions, program_type = section_plan_args()
+        classes_data = load_section_classes(supabase)
+        section_ids = [cls['class_id'] for sections in course_sections(classes_data, course).values() for cls in sections]
+        with seat_locks.hold_all(section_ids):
+            plan = load_section_plan(course, additions, program_type, classes_data=classes_data)
+            if request.form.get('fingerprint') != plan['fingerprint']:
+                return mutation_response('Enrollments changed since the section preview was generated; review the new preview',
+                                         'warning', 'sections_preview', status=409)
+            result = apply_sections(supabase, plan, locks=seat_locks)
+        rosters = result.pop('rosters')
+
+        def rebalance(index):
+            for class_id, roster in rosters.items():
+                index.set_roster(class_id, roster)
+
+        commit_schedule_change(rebalance, 'class_students', 'class_waitlist')
+        logger.info(f"Section plan applied by {current_user.email}: {result}")
+        message = f"Sections balanced: {result['moved']} students moved, {result['added']} added"
+        if plan['summary']['unplaced']:
+            message += f", {plan['summary']['unplaced']} could not be placed"
+        if result['waitlisted']:
+            message += f", {result['waitlisted']} waitlisted because their section filled up meanwhile"
+        if partial_format():
+            return {'message': message, **result}, 200
+        flash(message, 'success')
+        return redirect(url_for('classes'))
+    except Exception as e:
+        bump_version('class_students', 'class_waitlist')
+        logger.error(f"Error applying section plan: {str(e)}")
+        return mutation_response(f"Error applying section plan: {str(e)}", 'danger', 'sections_preview', status=500)
+
 @app.route('/api/class/<class_id>')
 @login_required
 def get_class(class_id):
     try:
-        response = supabase.table('classes').select('*').eq('class_id', class_id).execute()
+        response = supabase.table('classes').select(', '.join(API_ENTITIES['classes'][2])).eq('class_id', class_id).execute()
         if response.data:
             return response.data[0], 200
         return {"error": "Class not found"}, 404
@@ -1078,5 +1876,182 @@ def get_class(class_id):
         logger.error(f"Error fetching class {class_id}: {str(e)}")
         return {"error": str(e)}, 500
 
+# Picker sources: id column, searchable columns (prefix match) and label format
+OPTION_SOURCES = {
+    'parents': ('parent_id', ['last_name', 'first_name'], lambda r: f"{r['last_name']}, {r['first_name']}"),
+    'students': ('student_id', ['last_name', 'first_name'], lambda r: f"{r['last_name']}, {r['first_name']} ({r['grade_level']})"),
+    'teachers': ('teacher_id', ['last_name', 'first_name'], lambda r: f"{r['last_name']}, {r['first_name']}"),
+    'classrooms': ('classroom_id', ['building_number', 'room_number'], lambda r: f"{r['building_number']} {r['room_number']}"),
+}
+OPTION_COLUMNS = {
+    'parents': 'parent_id, first_name, last_name',
+    'students': 'student_id, first_name, last_name, grade_level',
+    'teachers': 'teacher_id, first_name, last_name',
+    'classrooms': 'classroom_id, building_number, room_number',
+}
+
+@app.route('/api/options/<entity>')
+@login_required
+def get_options(entity):
+    """Type-ahead source for modal pickers: ?q= prefix search, or ?ids= to resolve selected records."""
+    if current_user.role not in ['admin', 'teacher']:
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    if entity not in OPTION_SOURCES:
+        return {"error": f"Unknown option list: {entity}"}, 404
+    id_column, search_columns, label = OPTION_SOURCES[entity]
+    try:
+        query = supabase.table(entity).select(OPTION_COLUMNS[entity])
+        ids = [i for i in request.args.get('ids', '').split(',') if i]
+        # Characters that are syntax in PostgREST filter strings are dropped from the search term
+        term = re.sub(r'[,()*%\\]', '', request.args.get('q', '')).strip()
+        if ids:
+            query = query.in_(id_column, ids)
+        else:
+            if term:
+                query = query.or_(','.join(f"{column}.ilike.{term}%" for column in search_columns))
+            limit = request.args.get('limit', '')
+            query = query.order(search_columns[0]).order(search_columns[1]).limit(min(int(limit), 100) if limit.isdigit() else 20)
+        response = query.execute()
+        return {'results': [{'id': row[id_column], 'label': label(row)} for row in response.data]}, 200
+    except Exception as e:
+        logger.error(f"Error fetching {entity} options: {str(e)}")
+        return {"error": str(e)}, 500
+
+# Server-side search across entities. Each worker keeps its own index and re-syncs an entity when
+# its data version moves (any worker's write, or the TTL epoch); a sync only re-tokenizes changed rows.
+search_index = SearchIndex()
+SEARCH_PRIVATE_ROLES = ['admin', 'teacher']  # may search allergies, medicines and medical conditions
+SEARCH_MAX_LIMIT = 1000
+
+def sync_search_index(entities):
+    for entity in entities:
+        table = SEARCH_ENTITIES[entity][0]
+        version = data_version(table)
+        if search_index.synced.get(entity) != version:
+            changed = search_index.sync(entity, iter_table_rows(supabase, table), version)
+            logger.info(f"Search index synced {entity}: {changed} changed")
+
+@app.route('/api/search')
+@login_required
+def api_search():
+    """Type-ahead search: ?q= matched by prefix (or, for 3+ characters, anywhere) against names,
+    emails, phones and class names; ?types= limits the entities; ?limit= caps the results."""
+    if current_user.role not in ['admin', 'teacher']:
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    entities = [e for e in request.args.get('types', '').split(',') if e] or list(SEARCH_ENTITIES)
+    unknown = [e for e in entities if e not in SEARCH_ENTITIES]
+    if unknown:
+        return {"error": f"Unknown search types: {', '.join(unknown)}"}, 400
+    limit = request.args.get('limit', '')
+    limit = min(int(limit), SEARCH_MAX_LIMIT) if limit.isdigit() else 20
+    try:
+        sync_search_index(entities)
+        started = time.perf_counter()
+        results = search_index.search(request.args.get('q', ''), entities,
+                                      include_private=current_user.role in SEARCH_PRIVATE_ROLES, limit=limit)
+        return {'results': results, 'took_ms': round((time.perf_counter() - started) * 1000, 2)}, 200
+    except Exception as e:
+        logger.error(f"Error searching: {str(e)}")
+        return {"error": str(e)}, 500
+
+# Read API: entity -> (table, ordering key columns, selectable columns)
+API_ENTITIES = {
+    'students': ('students', ['student_id'], ['student_id', 'first_name', 'last_name', 'grade_level', 'email', 'phone',
+                                              'medicines', 'allergies', 'medical_conditions', 'comments']),
+    'parents': ('parents', ['parent_id'], ['parent_id', 'first_name', 'last_name', 'email', 'phone', 'is_staff', 'created_at']),
+    'teachers': ('teachers', ['teacher_id'], ['teacher_id', 'first_name', 'last_name', 'email', 'phone']),
+    'classes': ('classes', ['class_id'], ['class_id', 'name', 'days', 'teacher_id', 'grade_level', 'max_size', 'term',
+                                          'schedule_block', 'classroom_id']),
+    'classrooms': ('classrooms', ['classroom_id'], ['classroom_id', 'building_number', 'room_number']),
+    'rosters': ('class_students', ['class_id', 'student_id'], ['class_id', 'student_id', 'program_type']),
+}
+TUITION_API_COLUMNS = ['student_id', 'student_name', 'grade', 'parent_id', 'base_amount', 'amount']
+API_DEFAULT_LIMIT = 100
+API_MAX_LIMIT = 1000
+
+def api_page_params(columns):
+    """Validate ?fields=, ?limit= and ?offset=; returns (fields, limit, offset) or raises ValueError."""
+    fields = [f.strip() for f in request.args.get('fields', '').split(',') if f.strip()] or list(columns)
+    unknown = [f for f in fields if f not in columns]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    limit = request.args.get('limit', str(API_DEFAULT_LIMIT))
+    offset = request.args.get('offset', '0')
+    if not limit.isdigit() or not offset.isdigit() or int(limit) == 0:
+        raise ValueError("limit and offset must be non-negative integers (limit > 0)")
+    return fields, min(int(limit), API_MAX_LIMIT), int(offset)
+
+def api_etag(entity, version):
+    """Strong ETag for this entity, the data version it was read at and the request's query/viewer."""
+    key = repr((entity, version, sorted(request.args.items(multi=True)), current_user.role, current_user.parent_id))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def api_response(etag, build):
+    """304 when the client already has this ETag, otherwise build and serialize the payload once."""
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/<entity>')
+@login_required
+def api_list(entity):
+    """Paginated JSON read of an entity: ?fields=a,b, ?limit=, ?offset= and ?<field>=value filters."""
+    if entity == 'tuition':
+        return api_tuition()
+    if current_user.role not in ['admin', 'teacher']:
+        return {"error": "Access denied: Insufficient permissions"}, 403
+    if entity not in API_ENTITIES:
+        return {"error": f"Unknown entity: {entity}"}, 404
+    table, order_columns, columns = API_ENTITIES[entity]
+    try:
+        fields, limit, offset = api_page_params(columns)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    filters = {column: request.args[column] for column in columns if column in request.args}
+
+    def build():
+        query = supabase.table(table).select(', '.join(fields), count='exact')
+        for column, value in filters.items():
+            query = query.eq(column, value)
+        for column in order_columns:
+            query = query.order(column)
+        response = query.range(offset, offset + limit - 1).execute()
+        return {'data': response.data, 'total': response.count, 'limit': limit, 'offset': offset}
+
+    try:
+        return api_response(api_etag(entity, data_version(table)), build)
+    except Exception as e:
+        logger.error(f"Error reading {entity} via API: {str(e)}")
+        return {"error": str(e)}, 500
+
+def api_tuition():
+    """Tuition ledger as JSON; parents only see their own students."""
+    try:
+        fields, limit, offset = api_page_params(TUITION_API_COLUMNS)
+    except ValueError as e:
+        return {"error": str(e)}, 400
+    try:
+        pricing_table = get_pricing_table(request.args.get('school_year'))
+        version = data_version('students', 'student_parents', 'class_students', 'classes') + (pricing_table.version,)
+
+        def build():
+            ledger = fetch_tuition_ledger(pricing_table, *tuition_scope())
+            page = [
+                {field: round(float(record[field]), 2) if field in ('base_amount', 'amount') else record[field]
+                 for field in fields}
+                for record in ledger[offset:offset + limit]
+            ]
+            return {'data': page, 'total': len(ledger), 'limit': limit, 'offset': offset,
+                    'school_year': pricing_table.school_year}
+
+        return api_response(api_etag('tuition', version), build)
+    except Exception as e:
+        logger.error(f"Error reading tuition via API: {str(e)}")
+        return {"error": str(e)}, 500
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,220 @@
+import logging
+import re
+import threading
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: throttle counts stay per process
+    fcntl = None
+
+from versions import SharedSlots
+
+logger = logging.getLogger(__name__)
+
+_BCRYPT_COST_RE = re.compile(r'^\$2[abxy]?\$(\d{2})\$')
+
+
+class LoginOverloaded(Exception):
+    """Too many password checks already queued; the caller should answer 503 and not wait."""
+
+
+def hash_cost(password_hash: str) -> Optional[int]:
+    """'$2b$12$...' -> 12, or None if it isn't a bcrypt hash."""
+    match = _BCRYPT_COST_RE.match(password_hash or '')
+    return int(match.group(1)) if match else None
+
+
+class PasswordVerifier:
+    """Runs bcrypt on a small dedicated pool so a login storm can't take every request thread's CPU.
+
+    At most `workers` hashes run at once (bcrypt releases the GIL, so these really are parallel and
+    the cap is what protects the other pages). At most `max_queue` more may wait; beyond that
+    verify() raises LoginOverloaded immediately instead of queueing unboundedly.
+    """
+
+    def __init__(self, check: Callable[[str, str], bool], generate: Callable[[str], bytes],
+                 workers: int = 2, max_queue: int = 32):
+        self.check = check
+        self.generate = generate
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stats = {'completed': 0, 'rejected': 0, 'max_depth': 0, 'wait_ms_total': 0.0, 'hash_ms_total': 0.0}
+
+    def _submit(self, func, *args):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                self._stats['rejected'] += 1
+                raise LoginOverloaded()
+            self._pending += 1
+            self._stats['max_depth'] = max(self._stats['max_depth'], self._pending)
+        submitted = time.perf_counter()
+
+        def run():
+            started = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    self._pending -= 1
+                    self._stats['completed'] += 1
+                    self._stats['wait_ms_total'] += (started - submitted) * 1000
+                    self._stats['hash_ms_total'] += (finished - started) * 1000
+
+        return self._executor.submit(run).result()
+
+    def verify(self, password_hash: str, password: str) -> bool:
+        return self._submit(self.check, password_hash, password)
+
+    def hash_password(self, password: str) -> str:
+        return self._submit(self.generate, password).decode('utf-8')
+
+    def metrics(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            pending = self._pending
+        completed = stats['completed'] or 1
+        return {
+            'workers': self.workers,
+            'max_queue': self.max_queue,
+            'in_flight': min(pending, self.workers),
+            'queued': max(0, pending - self.workers),
+            'max_depth': stats['max_depth'],
+            'completed': stats['completed'],
+            'rejected': stats['rejected'],
+            'avg_wait_ms': round(stats['wait_ms_total'] / completed, 2),
+            'avg_hash_ms': round(stats['hash_ms_total'] / completed, 2),
+        }
+
+
+class SlidingWindowLimiter:
+    """At most `limit` recorded failures per key in any `window` seconds, in memory for this worker.
+
+    The fallback for SharedWindowLimiter where no shared file can be used. retry_after() only
+    checks; record() counts one failure, so successful attempts never use up the budget.
+    """
+
+    def __init__(self, limit: int, window: float, max_keys: int = 100000):
+        self.limit = limit
+        self.window = window
+        self.max_keys = max_keys
+        self._hits: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        cutoff = now - self.window
+        for key in [k for k, hits in self._hits.items() if not hits or hits[-1] <= cutoff]:
+            del self._hits[key]
+
+    def retry_after(self, key: str) -> float:
+        """0 if the key may try again, else seconds until its oldest failure expires."""
+        now = time.monotonic()
+        with self._lock:
+            hits = self._hits.get(key)
+            if not hits:
+                return 0.0
+            while hits and hits[0] <= now - self.window:
+                hits.popleft()
+            if len(hits) < self.limit:
+                return 0.0
+            self.rejected += 1
+            return hits[0] + self.window - now
+
+    def record(self, key: str) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if len(self._hits) >= self.max_keys:
+                self._prune(now)
+            self._hits.setdefault(key, deque()).append(now)
+
+    def reset(self, key: str) -> None:
+        with self._lock:
+            self._hits.pop(key, None)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {'limit': self.limit, 'window_seconds': self.window, 'shared': False,
+                    'tracked_keys': len(self._hits), 'rejected': self.rejected}
+
+
+class SharedWindowLimiter:
+    """SlidingWindowLimiter counted in a memory-mapped file (versions.SharedSlots), so the limit
+    holds across every worker on the host.
+
+    Keys hash onto `buckets` buckets (a collision only makes two keys share one budget) and each
+    bucket counts failures per step of window / steps seconds, so the window slides in steps.
+    """
+
+    def __init__(self, limit: int, window: float, path: str, buckets: int = 16384, steps: int = 10):
+        self.limit = limit
+        self.window = window
+        self.buckets = buckets
+        self.steps = steps
+        self.step = window / steps
+        self._store = SharedSlots(path, buckets * steps * 2)  # per step: (step number, count)
+        self.rejected = 0  # by this worker
+
+    def _base(self, key: str) -> int:
+        return (zlib.crc32(key.encode('utf-8')) % self.buckets) * self.steps * 2
+
+    def _live(self, base: int, now: float) -> List[Tuple[int, int]]:
+        """(step number, failures) of the steps still inside the window, oldest first."""
+        current = int(now // self.step)
+        live = []
+        for offset in range(self.steps):
+            number, count = self._store.get(base + 2 * offset), self._store.get(base + 2 * offset + 1)
+            if count and current - self.steps < number <= current:
+                live.append((number, count))
+        return sorted(live)
+
+    def retry_after(self, key: str) -> float:
+        now = time.time()
+        live = self._live(self._base(key), now)
+        total = sum(count for _, count in live)
+        if total < self.limit:
+            return 0.0
+        self.rejected += 1
+        for number, count in live:
+            total -= count
+            if total < self.limit:
+                return max(0.0, (number + self.steps) * self.step - now)
+        return self.window
+
+    def record(self, key: str) -> None:
+        current = int(time.time() // self.step)
+        index = self._base(key) + 2 * (current % self.steps)
+        with self._store.locked():
+            if self._store.get(index) != current:
+                self._store.set(index, current)
+                self._store.set(index + 1, 1)
+            else:
+                self._store.set(index + 1, self._store.get(index + 1) + 1)
+
+    def reset(self, key: str) -> None:
+        base = self._base(key)
+        with self._store.locked():
+            for offset in range(self.steps):
+                self._store.set(base + 2 * offset + 1, 0)
+
+    def metrics(self) -> dict:
+        return {'limit': self.limit, 'window_seconds': self.window, 'shared': True, 'buckets': self.buckets,
+                'rejected': self.rejected}
+
+
+def window_limiter(limit: int, window: float, path: str):
+    """SharedWindowLimiter on path, or a per-worker SlidingWindowLimiter where that isn't possible."""
+    if fcntl is not None:
+        try:
+            return SharedWindowLimiter(limit, window, path)
+        except OSError as e:
+            logger.warning(f"Login throttle not shared across workers ({path}): {str(e)}")
+    return SlidingWindowLimiter(limit, window)
@@ -0,0 +1,56 @@
+from typing import Dict, Iterable, List, Tuple
+
+from db_functions import FunctionUnavailable, call_function
+from enrollment import WAITLIST_TABLE, is_missing_table
+
+# Entity table -> (key column, link tables holding that key). Link rows go first so no
+# foreign key is left dangling. Mirrors public.bulk_delete in sql/bulk_delete.sql.
+# Waitlist rows go before class_students: deleting roster rows fires the promote trigger
+# (sql/enrollment.sql), which would otherwise seat a waitlisted student of a class or student
+# being deleted and leave a class_students row the final delete trips over.
+CASCADE_DELETES: Dict[str, Tuple[str, List[str]]] = {
+    'students': ('student_id', ['student_parents', WAITLIST_TABLE, 'class_students']),
+    'parents': ('parent_id', ['student_parents']),
+    'classes': ('class_id', [WAITLIST_TABLE, 'class_students']),
+}
+# Entity table -> tables whose reference to it is set to NULL rather than deleted (a parent's login
+# outlives the parent record; it just no longer sees any students)
+CASCADE_DETACH: Dict[str, List[str]] = {
+    'parents': ['users'],
+}
+BULK_DELETE_RPC = 'bulk_delete'
+DEFAULT_CHUNK_SIZE = 500  # ids per in_() filter, keeps request URLs well under proxy limits
+
+
+def _delete_in_chunks(client, table: str, ids: List[str], chunk_size: int) -> None:
+    key, links = CASCADE_DELETES[table]
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start:start + chunk_size]
+        for link in links:
+            try:
+                client.table(link).delete().in_(key, chunk).execute()
+            except Exception as e:
+                # sql/enrollment.sql not installed: no waitlist, and no trigger to race
+                if link != WAITLIST_TABLE or not is_missing_table(e):
+                    raise
+        for referrer in CASCADE_DETACH.get(table, []):
+            client.table(referrer).update({key: None}).in_(key, chunk).execute()
+        client.table(table).delete().in_(key, chunk).execute()
+
+
+def bulk_delete(client, table: str, ids: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> List[str]:
+    """Delete rows of `table` and every link row that references them; returns the ids requested.
+
+    Uses the bulk_delete database function (one round trip, one transaction) when it is installed,
+    otherwise one in_() filtered delete per table per chunk.
+    """
+    if table not in CASCADE_DELETES:
+        raise ValueError(f"Bulk delete is not supported for {table}")
+    ids = list(dict.fromkeys(record_id for record_id in ids if record_id))
+    if not ids:
+        return []
+    try:
+        call_function(client, BULK_DELETE_RPC, {'entity': table, 'ids': ids})
+    except FunctionUnavailable:
+        _delete_in_chunks(client, table, ids, chunk_size)
+    return ids
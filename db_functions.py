@@ -0,0 +1,31 @@
+import logging
+from typing import Set
+
+logger = logging.getLogger(__name__)
+
+# PostgREST error code for "function not found in the schema cache"
+MISSING_FUNCTION_CODE = 'PGRST202'
+
+_missing: Set[str] = set()
+
+
+class FunctionUnavailable(Exception):
+    """The database function isn't installed (see sql/); callers fall back to their client-side path."""
+
+
+def call_function(client, name: str, params: dict):
+    """Run a database function through PostgREST and return its rows.
+
+    A function that turns out not to be installed is remembered for the life of the process, so
+    callers pay for the failed round trip once and then go straight to their fallback.
+    """
+    if name in _missing:
+        raise FunctionUnavailable(name)
+    try:
+        return client.rpc(name, params).execute().data
+    except Exception as e:
+        if getattr(e, 'code', None) != MISSING_FUNCTION_CODE:
+            raise
+        logger.warning(f"Database function {name} is not installed; using the client-side fallback")
+        _missing.add(name)
+        raise FunctionUnavailable(name) from e
@@ -0,0 +1,103 @@
+import re
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from normalize import clean_string, normalize_grade
+
+NEW = 'new'
+EXACT = 'exact'
+PROBABLE = 'probable'
+# Worth mentioning, not enough to hold a row back: the row is imported as new
+NOTE = 'note'
+
+DedupMatch = namedtuple('DedupMatch', ['status', 'record_id', 'rule'])
+
+_NON_WORD_RE = re.compile(r"[^\w ]+")
+
+
+def name_key(value) -> str:
+    """'  O'Neil ', 'ONEIL' -> 'oneil' (case, spacing, nbsp and punctuation insensitive)."""
+    if not value or not isinstance(value, str):
+        return ''
+    return _NON_WORD_RE.sub('', clean_string(value).casefold()).replace(' ', '')
+
+
+def email_key(value) -> str:
+    if not value or not isinstance(value, str):
+        return ''
+    return value.strip().casefold()
+
+
+def phone_key(value) -> str:
+    """Last 10 digits, so ' (256) 714-1891', '256.714.1891' and '+1 256 714 1891' agree."""
+    if value is None:
+        return ''
+    digits = ''.join(ch for ch in str(value) if ch.isdigit())
+    return digits[-10:] if len(digits) >= 7 else ''
+
+
+def grade_key(value) -> str:
+    if not value or not isinstance(value, str):
+        return ''
+    value = value.strip()
+    return 'K' if value.upper() == 'K' else (normalize_grade(value) or value)
+
+
+def _full_name(row: dict) -> Tuple[str, str]:
+    return name_key(row.get('last_name')), name_key(row.get('first_name'))
+
+
+# Rules per entity, strongest first: (status, rule name, key function). A key with any empty
+# part is never indexed or looked up.
+DEDUP_RULES: Dict[str, List[Tuple[str, str, Callable[[dict], tuple]]]] = {
+    'student': [
+        (EXACT, 'name+grade', lambda r: _full_name(r) + (grade_key(r.get('grade_level')),)),
+        (PROBABLE, 'name', _full_name),
+        (PROBABLE, 'email', lambda r: (email_key(r.get('email')),)),
+    ],
+    'parent': [
+        (EXACT, 'email', lambda r: (email_key(r.get('email')),)),
+        (EXACT, 'name+phone', lambda r: _full_name(r) + (phone_key(r.get('phone')),)),
+        (PROBABLE, 'first name+phone', lambda r: (name_key(r.get('first_name')), phone_key(r.get('phone')))),
+        (PROBABLE, 'name', _full_name),
+        # Spouses and co-parents share a household phone
+        (NOTE, 'phone', lambda r: (phone_key(r.get('phone')),)),
+    ],
+    'teacher': [
+        (EXACT, 'name', _full_name),
+        (PROBABLE, 'email', lambda r: (email_key(r.get('email')),)),
+        (PROBABLE, 'last name+initial', lambda r: (name_key(r.get('last_name')), name_key(r.get('first_name'))[:1])),
+    ],
+}
+ID_COLUMNS = {'student': 'student_id', 'parent': 'parent_id', 'teacher': 'teacher_id'}
+
+
+class DedupIndex:
+    """Hash index over existing rows of one entity; classify() is a handful of dict lookups per row.
+
+    Build it once per import from the existing table, then classify each incoming row and add()
+    the rows you insert so duplicates within the same file are caught too.
+    """
+
+    def __init__(self, entity: str, rows: Iterable[dict] = ()):
+        self.entity = entity
+        self.rules = DEDUP_RULES[entity]
+        self.id_column = ID_COLUMNS[entity]
+        self.keys: List[Dict[tuple, str]] = [{} for _ in self.rules]
+        for row in rows:
+            self.add(row)
+
+    def add(self, row: dict, record_id: Optional[str] = None) -> None:
+        record_id = record_id or row.get(self.id_column)
+        for (_, _, key_func), keys in zip(self.rules, self.keys):
+            key = key_func(row)
+            if all(key):
+                keys.setdefault(key, record_id)
+
+    def classify(self, row: dict) -> DedupMatch:
+        """DedupMatch('new'|'exact'|'probable'|'note', matched record id, rule that matched)."""
+        for (status, rule, key_func), keys in zip(self.rules, self.keys):
+            key = key_func(row)
+            if all(key) and key in keys:
+                return DedupMatch(status, keys[key], rule)
+        return DedupMatch(NEW, None, None)
@@ -0,0 +1,246 @@
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: the lock only covers this process
+    fcntl = None
+
+from db_functions import FunctionUnavailable, call_function
+
+logger = logging.getLogger(__name__)
+
+CHANGE_ROSTER_RPC = 'change_roster'
+WAITLIST_TABLE = 'class_waitlist'
+# PostgREST / Postgres codes for a table that doesn't exist (sql/enrollment.sql not installed)
+MISSING_TABLE_CODES = {'PGRST205', '42P01'}
+SEAT_LOCK_FILE = os.getenv('SEAT_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'school-admin-seats.lock'))
+LOCK_STRIPES = 1024
+DEFAULT_CHUNK_SIZE = 500
+
+
+def is_missing_table(error: Exception) -> bool:
+    return getattr(error, 'code', None) in MISSING_TABLE_CODES
+
+
+class SeatLocks:
+    """Per-class mutual exclusion across every thread and worker process on this host.
+
+    Class ids hash onto LOCK_STRIPES stripes; each stripe is a thread lock plus an fcntl record
+    lock on one byte of a shared file (record locks are per process, hence both). A thread that
+    already holds a class's stripe (hold_all) passes straight through hold() for it.
+    """
+
+    def __init__(self, path: str = SEAT_LOCK_FILE, stripes: int = LOCK_STRIPES):
+        self.stripes = stripes
+        self._threads = [threading.Lock() for _ in range(stripes)]
+        self._held = threading.local()
+        self._fd = None
+        if fcntl is not None:
+            try:
+                self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            except OSError as e:
+                logger.warning(f"Seat locks not shared across workers ({path}): {str(e)}")
+
+    @contextmanager
+    def hold(self, class_id: str):
+        with self.hold_all([class_id]):
+            yield
+
+    @contextmanager
+    def hold_all(self, class_ids: Iterable[str]):
+        """Hold the locks of several classes at once. Stripes are taken in ascending order, so two
+        callers holding overlapping sets can't deadlock."""
+        held = self._held.__dict__.setdefault('stripes', set())
+        wanted = sorted({zlib.crc32(str(class_id).encode('utf-8')) % self.stripes for class_id in class_ids} - held)
+        taken = []
+        try:
+            for stripe in wanted:
+                self._threads[stripe].acquire()
+                try:
+                    if self._fd is not None:
+                        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+                except BaseException:
+                    self._threads[stripe].release()
+                    raise
+                taken.append(stripe)
+                held.add(stripe)
+            yield
+        finally:
+            for stripe in reversed(taken):
+                held.discard(stripe)
+                if self._fd is not None:
+                    fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+                self._threads[stripe].release()
+
+
+def _unique_entries(entries: Iterable[dict]) -> List[dict]:
+    seen = {}
+    for entry in entries:
+        if entry.get('student_id') and entry['student_id'] not in seen:
+            seen[entry['student_id']] = {'student_id': entry['student_id'], 'program_type': entry.get('program_type')}
+    return list(seen.values())
+
+
+def plan_roster_change(max_size: Optional[int], roster: Dict[str, Optional[str]],
+                       waitlist: List[Tuple[str, Optional[str]]], entries: List[dict],
+                       removals: Iterable[str] = (), replace: bool = False, promote: bool = True,
+                       passed_over: Iterable[str] = ()) -> dict:
+    """The writes for one roster change, by the rules of public.change_roster (sql/enrollment.sql).
+
+    roster maps enrolled student_id -> program_type; waitlist is (student_id, program_type) in
+    waitlist order. Removals leave the roster and the waitlist; with replace, enrolled students not
+    in entries leave too. Waitlisted students then fill free seats in order (unless promote is off),
+    skipping those in passed_over (booked elsewhere at that time), who keep their place in line.
+    Each new entry then takes a seat while any are left or else joins the end of the waitlist.
+    """
+    removals = set(removals)
+    passed_over = set(passed_over)
+    wanted = {entry['student_id'] for entry in entries}
+    roster = dict(roster)
+    removed = [sid for sid in roster if sid in removals or (replace and sid not in wanted)]
+    for sid in removed:
+        del roster[sid]
+    waiting = [(sid, program) for sid, program in waitlist if sid not in removals]
+    leaving_waitlist = [sid for sid, _ in waitlist if sid in removals]
+
+    updates = {entry['student_id']: entry['program_type'] for entry in entries
+               if entry['student_id'] in roster and roster[entry['student_id']] != entry['program_type']}
+    roster.update(updates)
+
+    inserts, promoted = [], []
+    if promote:
+        still_waiting = []
+        for sid, program in waiting:
+            if sid in passed_over or (max_size is not None and len(roster) >= max_size):
+                still_waiting.append((sid, program))
+                continue
+            roster[sid] = program
+            inserts.append({'student_id': sid, 'program_type': program})
+            leaving_waitlist.append(sid)
+            promoted.append(sid)
+        waiting = still_waiting
+
+    enrolled, waitlist_adds, waitlisted = [], [], []
+    waiting_ids = {sid for sid, _ in waiting}
+    for entry in entries:
+        sid = entry['student_id']
+        if sid in roster:
+            continue
+        if max_size is None or len(roster) < max_size:
+            roster[sid] = entry['program_type']
+            inserts.append(dict(entry))
+            enrolled.append(sid)
+            if sid in waiting_ids:
+                leaving_waitlist.append(sid)
+                waiting = [(w, p) for w, p in waiting if w != sid]
+                waiting_ids.discard(sid)
+        else:
+            if sid not in waiting_ids:
+                waiting.append((sid, entry['program_type']))
+                waiting_ids.add(sid)
+                waitlist_adds.append(dict(entry))
+            waitlisted.append(sid)
+
+    positions = {sid: place for place, (sid, _) in enumerate(waiting, start=1)}
+    return {
+        'delete': removed,
+        'update': updates,
+        'insert': inserts,
+        'waitlist_add': waitlist_adds,
+        'waitlist_remove': leaving_waitlist,
+        'result': {
+            'enrolled': enrolled,
+            'promoted': promoted,
+            'removed': removed,
+            'waitlisted': [{'student_id': sid, 'position': positions[sid]} for sid in waitlisted],
+            'roster': list(roster),
+            'seats_left': None if max_size is None else max_size - len(roster),
+        },
+    }
+
+
+def _chunks(ids: List[str], size: int) -> Iterable[List[str]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _change_roster_locally(client, class_id: str, entries: List[dict], removals: List[str], replace: bool,
+                           promote: bool, clashes: Optional[Callable[[List[str]], Set[str]]], chunk_size: int) -> dict:
+    response = client.table('classes').select('max_size').eq('class_id', class_id).execute()
+    if not response.data:
+        raise ValueError(f"Class {class_id} not found")
+    max_size = response.data[0].get('max_size')
+    roster = {row['student_id']: row.get('program_type') for row in
+              client.table('class_students').select('student_id, program_type').eq('class_id', class_id).execute().data}
+    try:
+        waitlist = [(row['student_id'], row.get('program_type')) for row in
+                    client.table(WAITLIST_TABLE).select('student_id, program_type')
+                    .eq('class_id', class_id).order('position').execute().data]
+        has_waitlist = True
+    except Exception as e:
+        if not is_missing_table(e):
+            raise
+        logger.warning(f"{WAITLIST_TABLE} is not installed (sql/enrollment.sql); overflow is rejected")
+        waitlist, has_waitlist = [], False
+
+    passed_over = clashes([sid for sid, _ in waitlist]) if clashes and promote and waitlist else ()
+    plan = plan_roster_change(max_size, roster, waitlist, entries, removals, replace, promote, passed_over)
+    for chunk in _chunks(plan['delete'], chunk_size):
+        client.table('class_students').delete().eq('class_id', class_id).in_('student_id', chunk).execute()
+    for student_id, program_type in plan['update'].items():
+        client.table('class_students').update({'program_type': program_type}) \
+            .eq('class_id', class_id).eq('student_id', student_id).execute()
+    if plan['insert']:
+        client.table('class_students').insert([{'class_id': class_id, **row} for row in plan['insert']]).execute()
+    result = plan['result']
+    if has_waitlist:
+        for chunk in _chunks(plan['waitlist_remove'], chunk_size):
+            client.table(WAITLIST_TABLE).delete().eq('class_id', class_id).in_('student_id', chunk).execute()
+        if plan['waitlist_add']:
+            client.table(WAITLIST_TABLE).insert([{'class_id': class_id, **row} for row in plan['waitlist_add']]).execute()
+    else:
+        result = dict(result, rejected=[entry['student_id'] for entry in result['waitlisted']], waitlisted=[])
+    return result
+
+
+def change_roster(client, class_id: str, entries: Iterable[dict], removals: Iterable[str] = (),
+                  replace: bool = False, locks: Optional[SeatLocks] = None, promote: bool = True,
+                  clashes: Optional[Callable[[List[str]], Set[str]]] = None,
+                  chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """Apply one roster change with capacity enforcement; see plan_roster_change for the rules.
+
+    Returns {enrolled, promoted, removed, waitlisted: [{student_id, position}], roster, seats_left}
+    (plus rejected, when there is no waitlist table to hold the overflow). Runs as the change_roster
+    database function when installed: one transaction holding the class row lock, so concurrent
+    submissions from any host are serialized. Otherwise the same plan runs here under `locks`.
+    promote=False leaves the waitlist alone, for callers that already gave the free seats away.
+    clashes(waitlisted student_ids) returns those booked elsewhere at the class's time, who are
+    passed over for promotion; the database function runs the same check on the tables itself.
+    """
+    entries = _unique_entries(entries)
+    removals = [student_id for student_id in dict.fromkeys(removals) if student_id]
+    try:
+        return call_function(client, CHANGE_ROSTER_RPC, {'target_class': class_id, 'entries': entries,
+                                                         'removals': removals, 'replace': replace,
+                                                         'promote': promote})
+    except FunctionUnavailable:
+        locks = locks or SeatLocks()
+        with locks.hold(class_id):
+            return _change_roster_locally(client, class_id, entries, removals, replace, promote, clashes, chunk_size)
+
+
+def clear_waitlists(client, class_ids: Iterable[str], chunk_size: int = DEFAULT_CHUNK_SIZE) -> None:
+    """Drop the waitlists of these classes (before their rosters are cleared, so nobody is promoted)."""
+    class_ids = sorted(set(class_ids))
+    try:
+        for chunk in _chunks(class_ids, chunk_size):
+            client.table(WAITLIST_TABLE).delete().in_('class_id', chunk).execute()
+    except Exception as e:
+        if not is_missing_table(e):
+            raise
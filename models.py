@@ -0,0 +1,224 @@
+import sys
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Type
+
+# Columns whose values repeat across rows (ids, grades, terms, program types): interned so every
+# row holding the same value points at one string object.
+INTERNED_COLUMNS: FrozenSet[str] = frozenset({
+    'student_id', 'parent_id', 'teacher_id', 'classroom_id', 'class_id',
+    'grade_level', 'term', 'program_type', 'building_number',
+})
+DAY_LABELS = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def format_days(days_array) -> str:
+    if not days_array:
+        return ""
+    sorted_days = sorted([int(day) for day in days_array if day is not None])
+    return ', '.join(DAY_LABELS[day] for day in sorted_days if 0 <= day < 7)
+
+
+class Row:
+    """Base for the __slots__ row models: attribute access for Jinja, to_dict() for JSON.
+
+    COLUMNS are copied from the PostgREST row; the remaining slots hold related rows, which are
+    shared objects from a RowRegistry rather than per-row copies.
+    """
+    __slots__ = ()
+    COLUMNS: Tuple[str, ...] = ()
+    KEY: str = ''
+
+    @classmethod
+    def from_row(cls, row: dict, **related) -> 'Row':
+        obj = cls.__new__(cls)
+        for column in cls.COLUMNS:
+            value = row.get(column)
+            setattr(obj, column, _intern(value) if column in INTERNED_COLUMNS else value)
+        for name in cls.__slots__:
+            if name not in cls.COLUMNS:
+                setattr(obj, name, related.get(name))
+        return obj
+
+    def get(self, name: str, default=None):
+        """dict-style access for code that still treats rows as dicts."""
+        return getattr(self, name, default)
+
+    def to_dict(self) -> dict:
+        def plain(value):
+            if isinstance(value, Row):
+                return value.to_dict()
+            if isinstance(value, list):
+                return [plain(item) for item in value]
+            return value
+        return {name: plain(getattr(self, name)) for name in self.__slots__}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({getattr(self, self.KEY, None)!r})"
+
+
+class Parent(Row):
+    __slots__ = ('parent_id', 'first_name', 'last_name', 'email', 'phone', 'is_staff')
+    COLUMNS = __slots__
+    KEY = 'parent_id'
+
+
+class Teacher(Row):
+    __slots__ = ('teacher_id', 'first_name', 'last_name', 'email', 'phone')
+    COLUMNS = __slots__
+    KEY = 'teacher_id'
+
+
+class Classroom(Row):
+    __slots__ = ('classroom_id', 'building_number', 'room_number')
+    COLUMNS = __slots__
+    KEY = 'classroom_id'
+
+
+class Student(Row):
+    __slots__ = ('student_id', 'first_name', 'last_name', 'grade_level', 'email', 'phone', 'medicines',
+                 'allergies', 'medical_conditions', 'comments', 'parents')
+    COLUMNS = __slots__[:-1]
+    KEY = 'student_id'
+
+
+class Enrollment(Row):
+    """A class_students row: the shared Student plus its program_type; reads like the student in templates."""
+    __slots__ = ('program_type', 'student')
+    COLUMNS = ('program_type',)
+    KEY = 'student_id'
+
+    student_id = property(lambda self: self.student.student_id)
+    first_name = property(lambda self: self.student.first_name)
+    last_name = property(lambda self: self.student.last_name)
+    grade_level = property(lambda self: self.student.grade_level)
+
+    def to_dict(self) -> dict:
+        return {**self.student.to_dict(), 'program_type': self.program_type}
+
+
+class Class(Row):
+    __slots__ = ('class_id', 'name', 'days_array', 'teacher_id', 'grade_level', 'max_size', 'term',
+                 'schedule_block', 'classroom_id', 'teachers', 'classrooms', 'students')
+    COLUMNS = ('class_id', 'name', 'teacher_id', 'grade_level', 'max_size', 'term', 'schedule_block', 'classroom_id')
+    KEY = 'class_id'
+
+    @classmethod
+    def from_row(cls, row: dict, **related) -> 'Class':
+        obj = super().from_row(row, **related)
+        obj.days_array = row.get('days') or []
+        if isinstance(obj.grade_level, list):
+            obj.grade_level = [_intern(grade) for grade in obj.grade_level]
+        obj.students = obj.students or []
+        return obj
+
+    @property
+    def days(self) -> str:
+        """'Mon, Wed' for display; the INTEGER[] column itself is days_array."""
+        return format_days(self.days_array)
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), 'days': self.days}
+
+
+class RowRegistry:
+    """Identity map for one page build: each id becomes one model object, shared by every row that
+    references it (a parent linked to three siblings, a student enrolled in six classes)."""
+
+    def __init__(self):
+        self._rows: Dict[Tuple[type, str], Row] = {}
+
+    def get(self, model: Type[Row], row: Optional[dict], **related) -> Optional[Row]:
+        if not row:
+            return None
+        key = (model, row.get(model.KEY))
+        if key[1] is None:
+            return model.from_row(row, **related)
+        obj = self._rows.get(key)
+        if obj is None:
+            obj = self._rows[key] = model.from_row(row, **related)
+        return obj
+
+
+def students_from_embedded(rows: Iterable[dict], registry: Optional[RowRegistry] = None) -> List[Student]:
+    """students with student_parents(parents(...)) embedded -> Student models sharing Parent objects."""
+    registry = registry or RowRegistry()
+    return [
+        registry.get(Student, row, parents=[registry.get(Parent, link['parents'])
+                                            for link in row.get('student_parents') or [] if link.get('parents')])
+        for row in rows
+    ]
+
+
+def classes_from_embedded(rows: Iterable[dict], registry: Optional[RowRegistry] = None) -> List[Class]:
+    """classes with teachers, classrooms and class_students(students(...)) embedded -> Class models."""
+    registry = registry or RowRegistry()
+    return [
+        Class.from_row(
+            row,
+            teachers=registry.get(Teacher, row.get('teachers')),
+            classrooms=registry.get(Classroom, row.get('classrooms')),
+            students=[Enrollment.from_row(enrollment, student=registry.get(Student, enrollment['students']))
+                      for enrollment in row.get('class_students') or [] if enrollment.get('students')],
+        )
+        for row in rows
+    ]
+
+
+if __name__ == '__main__':
+    # Memory benchmark: python models.py [students=10000]
+    import csv
+    import gc
+    import json
+    import tracemalloc
+    import uuid
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+
+    def read(table):
+        with open(f'backups/{table}_rows.csv', encoding='utf-8-sig', newline='') as f:
+            return list(csv.DictReader(f))
+
+    students, parents, links = read('students'), read('parents'), read('student_parents')
+    parents_by_id = {p['parent_id']: {c: p[c] for c in Parent.COLUMNS} for p in parents}
+    links_by_student = {}
+    for link in links:
+        links_by_student.setdefault(link['student_id'], []).append(link['parent_id'])
+    # Embedded PostgREST payload for `count` students, round-tripped through JSON like the real response
+    payload = []
+    for i in range(count):
+        base = students[i % len(students)]
+        row = {c: base[c] or None for c in Student.COLUMNS}
+        row['student_id'] = str(uuid.UUID(int=i))
+        row['student_parents'] = [{'parents': parents_by_id[p]} for p in links_by_student.get(base['student_id'], [])
+                                  if p in parents_by_id]
+        payload.append(row)
+    text = json.dumps(payload)
+
+    def measure(build):
+        # Everything the page keeps alive: parsed strings plus whatever the build wraps them in
+        gc.collect()
+        tracemalloc.start()
+        data = json.loads(text)
+        result = build(data)
+        del data
+        gc.collect()
+        current = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return result, current
+
+    def dict_rows(data):
+        # The previous shape: a copied dict per student with its parent dicts grafted on
+        return [{**{k: v for k, v in row.items() if k != 'student_parents'},
+                 'parents': [link['parents'] for link in row['student_parents']]} for row in data]
+
+    rows, dict_bytes = measure(dict_rows)
+    del rows
+    models, model_bytes = measure(students_from_embedded)
+    print(f"{count} students with parents")
+    print(f"  dict rows:   {dict_bytes / 1024:8.0f} KiB  {dict_bytes / count:6.0f} B/student")
+    print(f"  slot models: {model_bytes / 1024:8.0f} KiB  {model_bytes / count:6.0f} B/student")
+    print(f"  one student: dict {sys.getsizeof(dict_rows(json.loads(text)[:1])[0])} B, "
+          f"Student {sys.getsizeof(models[0])} B (shallow)")
@@ -0,0 +1,274 @@
+import logging
+import re
+from functools import lru_cache
+from typing import List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Valid grades per the grade_level constraint
+VALID_GRADES = ['K', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
+
+WHITESPACE_RE = re.compile(r'\s+')
+NON_DIGIT_RE = re.compile(r'\D')
+DIGITS_RE = re.compile(r'\d+')
+ORDINAL_GRADE_RE = re.compile(r'(\d+)(?:st|nd|rd|th)\s*grade')
+# 'Last, First' or 'Last, First (Nickname)'
+PERSON_NAME_RE = re.compile(r'([^,]+),\s*([^\(]+)(?:\s*\((.+)\))?')
+SCHEDULE_DAY_RES = [
+    (1, 0, re.compile(r'B\d')),  # Monday
+    (2, 1, re.compile(r'-\s*B\d')),  # Tuesday
+    (3, 2, re.compile(r'--\s*B\d')),  # Wednesday
+    (4, 3, re.compile(r'---\s*B\d')),  # Thursday
+]
+SCHEDULE_BLOCK_RE = re.compile(r'B(\d)')
+UNSCHEDULED = {'* not scheduled', 'MM', '- MM'}
+COUNT_MAX_RE = re.compile(r'(\d+)\s*/\s*(\d+)')
+# Section code in VLA class names, e.g. 'History [1-2His]'
+BRACKET_CODE_RE = re.compile(r'\s*\[.*\]')
+SECTION_CODE_RE = re.compile(r'\[(.*)\]')
+
+
+# Scalar normalizers. Results are memoized: import files repeat the same grade, term, schedule
+# and name strings many times over.
+
+@lru_cache(maxsize=65536)
+def clean_string(s: str) -> str:
+    """Replace non-breaking spaces (\xa0) with regular spaces and normalize hyphens."""
+    if not s:
+        return s
+    s = WHITESPACE_RE.sub(' ', s.replace('\xa0', ' '))
+    # Ensure dashes are standard hyphens
+    s = s.replace('–', '-').replace('—', '-')
+    return s.strip()
+
+
+@lru_cache(maxsize=65536)
+def format_phone(phone):
+    """'2567141891' / ' (256) 714-1891' -> '(256)714-1891'; anything that is not 10 digits is left as is."""
+    if not phone:
+        return ""
+    digits = NON_DIGIT_RE.sub('', phone)
+    if len(digits) != 10:
+        return phone
+    return f"({digits[:3]}){digits[3:6]}-{digits[6:]}"
+
+
+def _grade_to_str(g: str) -> Optional[str]:
+    g = g.strip().lower()
+    if g == 'k':
+        return 'K'
+    match = DIGITS_RE.search(g)
+    if match and match.group() in VALID_GRADES:
+        return match.group()
+    return None
+
+
+@lru_cache(maxsize=None)
+def _grade_level(grade: str) -> Tuple[str, ...]:
+    logger.debug(f"Processing grade level: {grade}")
+    grade = clean_string(grade).replace('"', '')
+    if not grade:
+        logger.warning("Empty grade level provided")
+        return ()
+
+    # Handle range (e.g., 'K-12', '1st-2nd')
+    if '-' in grade:
+        parts = grade.split('-')
+        if len(parts) != 2:
+            logger.error(f"Error normalizing grade level {grade}: expected a single range")
+            return ()
+        start_num, end_num = _grade_to_str(parts[0]), _grade_to_str(parts[1])
+        if start_num is None or end_num is None:
+            logger.warning(f"Invalid grade range format: {grade}")
+            return ()
+        start_idx, end_idx = VALID_GRADES.index(start_num), VALID_GRADES.index(end_num)
+        if start_idx > end_idx:
+            logger.warning(f"Invalid grade range: {start_num} > {end_num}")
+            return (start_num,)
+        return tuple(VALID_GRADES[start_idx:end_idx + 1])
+
+    # Handle comma-separated grades (e.g., '1st, 2nd')
+    if ',' in grade:
+        grades = {g for g in map(_grade_to_str, grade.split(',')) if g in VALID_GRADES}
+        if not grades:
+            logger.warning(f"No valid grades in comma-separated list: {grade}")
+        return tuple(sorted(grades))  # Sorted as strings, as before
+
+    # Handle single grade (e.g., 'K', '1st')
+    grade_str = _grade_to_str(grade)
+    if grade_str in VALID_GRADES:
+        return (grade_str,)
+    logger.warning(f"Invalid grade format: {grade}")
+    return ()
+
+
+def normalize_grade_level(grade: str) -> List[str]:
+    """Normalize grade level to a TEXT[] (e.g., '1st, 2nd' -> ['1', '2'], 'K-12' -> ['K', '1', ..., '12'])."""
+    return list(_grade_level(grade))
+
+
+@lru_cache(maxsize=None)
+def normalize_grade(grade):
+    """Student CSV grade ('Kindergarten', '3rd Grade', '7') -> 'K' / '3' / '7', or None."""
+    if not grade or not isinstance(grade, str):
+        return None
+    grade = grade.strip().lower()
+    if 'kindergarten' in grade:
+        return 'K'
+    match = ORDINAL_GRADE_RE.match(grade)
+    if match:
+        return match.group(1)
+    if grade.isdigit():
+        return grade
+    return None
+
+
+@lru_cache(maxsize=None)
+def normalize_term(term: str) -> str:
+    """Map CSV term to database term (e.g., 'S1, S2' -> 'Both')."""
+    term = clean_string(term).strip()
+    if term == 'S1,S2':
+        return 'Both'
+    elif term == 'S1':
+        return 'Semester 1'
+    elif term == 'S2':
+        return 'Semester 2'
+    return term  # Invalid terms are reported by the caller
+
+
+@lru_cache(maxsize=None)
+def _schedule(schedule: str) -> Tuple[Optional[Tuple[int, ...]], Optional[Tuple[int, ...]]]:
+    schedule = clean_string(schedule)
+    logger.debug(f"Processing schedule: {schedule}")
+    if not schedule or schedule in UNSCHEDULED:
+        return None, None
+    days = []
+    blocks = []
+    # Multiple schedules are comma separated (e.g., 'B1, B2' or '- B5, B6');
+    # the number of leading dashes is the day
+    for entry in (s.strip() for s in schedule.split(',')):
+        dash_count = entry.count('-')
+        for day, dashes, pattern in SCHEDULE_DAY_RES:
+            if dash_count == dashes and pattern.match(entry):
+                if day not in days:
+                    days.append(day)
+                break
+        block_match = SCHEDULE_BLOCK_RE.search(entry)
+        if block_match:
+            block = int(block_match.group(1))
+            if block not in blocks:
+                blocks.append(block)
+    return tuple(sorted(days)) if days else None, tuple(blocks)
+
+
+def parse_schedule(schedule: str) -> Tuple[Optional[List[int]], Optional[List[int]]]:
+    """Parse Schedule to extract days and blocks (e.g., '- B1' -> ([2], [1]))."""
+    days, blocks = _schedule(schedule)
+    return (list(days) if days is not None else None), (list(blocks) if blocks is not None else None)
+
+
+@lru_cache(maxsize=65536)
+def parse_teacher_name(teacher: str) -> Tuple[Optional[str], Optional[str]]:
+    """Parse teacher name (e.g., 'Pfeil, Teandra' -> ('Teandra', 'Pfeil'))."""
+    teacher = clean_string(teacher).strip()
+    if not teacher:
+        return None, None
+    match = PERSON_NAME_RE.match(teacher)
+    if not match:
+        logger.warning(f"Invalid teacher name format: {teacher}")
+        return None, None
+    last_name, first_name, _ = match.groups()
+    return first_name.strip(), last_name.strip()
+
+
+@lru_cache(maxsize=65536)
+def parse_student_name(name):
+    """'Last, First' -> (first, last); 'Last, First (Nickname)' uses the nickname as the first name."""
+    if not name or not isinstance(name, str):
+        return None, None
+    match = PERSON_NAME_RE.match(name.strip().strip('"'))
+    if not match:
+        return None, None
+    first_name = match.group(3) or match.group(2)
+    return first_name.strip(), match.group(1).strip()
+
+
+@lru_cache(maxsize=None)
+def parse_student_count_max(count_max: str) -> Tuple[Optional[int], Optional[int]]:
+    """Parse '10 / 15' or '* no students' -> (student_count, max_size)."""
+    count_max = clean_string(count_max).strip()
+    if count_max == '* no students':
+        return 0, None
+    match = COUNT_MAX_RE.match(count_max)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None, None
+
+
+def strip_bracket_code(name: str) -> str:
+    """'History [1-2His]' -> 'History'."""
+    return BRACKET_CODE_RE.sub('', name).strip()
+
+
+def bracket_code(name: str) -> Optional[str]:
+    """'History (M) [1-2His]' -> '1-2His'; None when the name has no code. Sections of one course share it."""
+    match = SECTION_CODE_RE.search(name or '')
+    if not match:
+        return None
+    return match.group(1).strip() or None
+
+
+# Column variants: parse a whole CSV column at once. Each distinct value is parsed once and the
+# result broadcast back over the column, which beats per-row pandas string ops on repetitive imports.
+
+def _per_unique(series: pd.Series, func) -> pd.Series:
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    parsed = [func(value) for value in uniques]
+    return pd.Series([parsed[code] if code >= 0 else func(None) for code in codes], index=series.index, dtype=object)
+
+
+def clean_string_series(series: pd.Series) -> pd.Series:
+    return _per_unique(series, clean_string)
+
+
+def format_phone_series(series: pd.Series) -> pd.Series:
+    return _per_unique(series, format_phone)
+
+
+def parse_student_name_series(series: pd.Series) -> pd.DataFrame:
+    """Columns first_name, last_name (None where the name does not parse)."""
+    parsed = _per_unique(series, parse_student_name)
+    return pd.DataFrame(parsed.tolist(), columns=['first_name', 'last_name'], index=series.index)
+
+
+def normalize_grade_series(series: pd.Series) -> pd.Series:
+    return _per_unique(series, normalize_grade)
+
+
+def normalize_grade_level_series(series: pd.Series) -> pd.Series:
+    return _per_unique(series.fillna(''), normalize_grade_level)
+
+
+def normalize_term_series(series: pd.Series) -> pd.Series:
+    return _per_unique(series.fillna(''), normalize_term)
+
+
+def parse_schedule_series(series: pd.Series) -> pd.DataFrame:
+    """Columns days, schedule_block."""
+    parsed = _per_unique(series.fillna(''), parse_schedule)
+    return pd.DataFrame(parsed.tolist(), columns=['days', 'schedule_block'], index=series.index)
+
+
+def parse_teacher_name_series(series: pd.Series) -> pd.DataFrame:
+    """Columns first_name, last_name."""
+    parsed = _per_unique(series.fillna(''), parse_teacher_name)
+    return pd.DataFrame(parsed.tolist(), columns=['first_name', 'last_name'], index=series.index)
+
+
+def parse_student_count_max_series(series: pd.Series) -> pd.DataFrame:
+    """Columns student_count, max_size (nullable integers)."""
+    parsed = _per_unique(series.fillna(''), parse_student_count_max)
+    return pd.DataFrame(parsed.tolist(), columns=['student_count', 'max_size'], index=series.index).astype('Int64')
+
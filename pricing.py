@@ -0,0 +1,343 @@
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Grade rows and program columns of the compiled price array
+GRADES = ['K', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
+PROGRAM_TYPES = ['morning', 'afternoon', 'full', 'enrichment', 'academic']
+
+# Workbook grade bands -> grades they cover
+GRADE_BANDS = {
+    'K': ['K'],
+    '1-2': ['1', '2'],
+    '3-8': ['3', '4', '5', '6', '7', '8'],
+    '9-12': ['9', '10', '11', '12'],
+}
+
+# Grades outside K-12 (or missing) are priced as high school, as before
+FALLBACK_GRADE = '12'
+
+DEFAULT_PRICING_FILE = 'VLA_Tuition.xlsx'
+
+GRADE_INDEX = {g: i for i, g in enumerate(GRADES)}
+PROGRAM_INDEX = {p: i for i, p in enumerate(PROGRAM_TYPES)}
+
+_PERCENT_RE = re.compile(r'(\d+(?:\.\d+)?)\s*%')
+_SCHOOL_YEAR_RE = re.compile(r'\d{4}-\d{4}')
+
+
+class PricingTable:
+    """Daily tuition per grade x program_type, plus the annual academic fee and sibling rate."""
+
+    def __init__(self, prices: np.ndarray, academic_fee: float, sibling_rate: float,
+                 school_year: str, version: str):
+        # prices[grade_idx, program_idx] is the per day/week price, NaN where a program is not offered
+        self.prices = prices
+        self.academic_fee = academic_fee
+        self.sibling_rate = sibling_rate
+        self.school_year = school_year
+        self.version = version
+
+    @classmethod
+    def from_bands(cls, band_prices: Dict[str, Dict[str, float]], academic_fee: float,
+                   sibling_rate: float, school_year: str, version: str) -> 'PricingTable':
+        """Compile {'3-8': {'enrichment': 2300, ...}, ...} into the dense grade x program array."""
+        prices = np.full((len(GRADES), len(PROGRAM_TYPES)), np.nan)
+        for band, programs in band_prices.items():
+            for grade in GRADE_BANDS[band]:
+                for program_type, price in programs.items():
+                    prices[GRADE_INDEX[grade], PROGRAM_INDEX[program_type]] = price
+        return cls(prices, academic_fee, sibling_rate, school_year, version)
+
+    def price(self, grade: Optional[str], program_type: Optional[str]) -> Optional[float]:
+        """Daily price for a single grade/program_type, or None if not offered."""
+        program_idx = PROGRAM_INDEX.get((program_type or '').lower())
+        if program_idx is None:
+            return None
+        value = self.prices[GRADE_INDEX.get(grade, GRADE_INDEX[FALLBACK_GRADE]), program_idx]
+        return None if np.isnan(value) else float(value)
+
+    def to_dict(self) -> dict:
+        return {
+            'school_year': self.school_year,
+            'version': self.version,
+            'academic_fee': self.academic_fee,
+            'sibling_rate': self.sibling_rate,
+            'prices': {
+                grade: {p: float(v) for p, v in zip(PROGRAM_TYPES, row) if not np.isnan(v)}
+                for grade, row in zip(GRADES, self.prices)
+            },
+        }
+
+
+def current_school_year(today: Optional[date] = None) -> str:
+    """School year label for a date, e.g. 2025-10-01 -> '2025-2026' (years roll over in August)."""
+    today = today or date.today()
+    start = today.year if today.month >= 8 else today.year - 1
+    return f"{start}-{start + 1}"
+
+
+def _find_cells(sheet: pd.DataFrame, predicate) -> List[Tuple[int, int]]:
+    cells = []
+    for row_idx, row in enumerate(sheet.itertuples(index=False)):
+        for col_idx, value in enumerate(row):
+            if isinstance(value, str) and predicate(value.strip()):
+                cells.append((row_idx, col_idx))
+    return cells
+
+
+def _number(value) -> Optional[float]:
+    if isinstance(value, (int, float)) and not pd.isna(value):
+        return float(value)
+    return None
+
+
+def parse_pricing_workbook(sheet: pd.DataFrame) -> Tuple[Dict[str, Dict[str, float]], float, float]:
+    """Extract 1 day/week prices, the academic fee and sibling rate from the VLA_Tuition layout."""
+    band_prices: Dict[str, Dict[str, float]] = {band: {} for band in GRADE_BANDS}
+    one_day_rows = [r for r, _ in _find_cells(sheet, lambda v: v == '1 day/week')]
+    if len(one_day_rows) < 2:
+        raise ValueError("Pricing workbook must contain a grades 3-12 and a kindergarten '1 day/week' row")
+
+    # Grades 3-12 table: super header ('Enrichment Only*' / 'Academic + Enrichment**') two rows up,
+    # band header ('Grades 3-8' / 'High School ...') one row up
+    first = one_day_rows[0]
+    program_type = None
+    for col in range(1, sheet.shape[1]):
+        super_header = sheet.iat[first - 2, col] if first >= 2 else None
+        if isinstance(super_header, str) and super_header.strip():
+            program_type = 'academic' if super_header.strip().lower().startswith('academic') else 'enrichment'
+        header = sheet.iat[first - 1, col]
+        price = _number(sheet.iat[first, col])
+        if not isinstance(header, str) or price is None or program_type is None:
+            continue
+        if 'grades 3-8' in header.lower():
+            band_prices['3-8'][program_type] = price
+        elif header.lower().startswith('high school'):
+            band_prices['9-12'][program_type] = price
+
+    # Kindergarten table: 'Morning Only' and 'Afternoon add-on' columns
+    k_row = one_day_rows[1]
+    for col in range(1, sheet.shape[1]):
+        header = sheet.iat[k_row - 1, col]
+        price = _number(sheet.iat[k_row, col])
+        if not isinstance(header, str) or price is None:
+            continue
+        if header.lower().startswith('morning'):
+            band_prices['K']['morning'] = price
+        elif header.lower().startswith('afternoon'):
+            band_prices['K']['afternoon'] = price
+
+    # Grades 1-2 only appear in the summary table; full day and enrichment share the price
+    for row, col in _find_cells(sheet, lambda v: v == 'Grades 1-2'):
+        price = _number(sheet.iat[row, col + 1]) if col + 1 < sheet.shape[1] else None
+        if price is not None:
+            band_prices['1-2'] = {'full': price, 'enrichment': price}
+            break
+
+    academic_fee = None
+    for row, col in _find_cells(sheet, lambda v: v == 'Academic Fee'):
+        academic_fee = _number(sheet.iat[row, col + 1])
+    sibling_rate = None
+    for row, col in _find_cells(sheet, lambda v: v.lower().startswith('sibling discount')):
+        match = _PERCENT_RE.search(sheet.iat[row, col])
+        if match:
+            sibling_rate = float(match.group(1)) / 100
+
+    missing = [band for band, programs in band_prices.items() if not programs]
+    if missing or academic_fee is None or sibling_rate is None:
+        raise ValueError(f"Incomplete pricing workbook (bands missing: {missing}, "
+                         f"academic fee: {academic_fee}, sibling rate: {sibling_rate})")
+    return band_prices, academic_fee, sibling_rate
+
+
+def load_pricing_table(source, school_year: Optional[str] = None) -> PricingTable:
+    """Load and compile a pricing workbook (path or file-like object)."""
+    school_year = school_year or current_school_year()
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            content = f.read()
+    else:
+        content = source.read()
+    sheet = pd.read_excel(io.BytesIO(content), sheet_name=0, header=None)
+    band_prices, academic_fee, sibling_rate = parse_pricing_workbook(sheet)
+    version = f"{school_year}:{hashlib.sha1(content).hexdigest()[:12]}"
+    logger.info(f"Loaded pricing table {version}")
+    return PricingTable.from_bands(band_prices, academic_fee, sibling_rate, school_year, version)
+
+
+def year_pricing_file(school_year: str) -> Optional[str]:
+    """The per-year workbook (VLA_Tuition_2025-2026.xlsx) for a school year, or None."""
+    root, ext = os.path.splitext(os.getenv('TUITION_PRICING_FILE', DEFAULT_PRICING_FILE))
+    year_file = f"{root}_{school_year}{ext}"
+    return year_file if os.path.exists(year_file) else None
+
+
+def pricing_file_for(school_year: str) -> str:
+    """Per-year workbook (VLA_Tuition_2025-2026.xlsx) if present, else the default workbook."""
+    return year_pricing_file(school_year) or os.getenv('TUITION_PRICING_FILE', DEFAULT_PRICING_FILE)
+
+
+# One entry per school year that has a workbook, plus the default year
+_pricing_cache: Dict[str, Tuple[float, PricingTable]] = {}
+
+
+def get_pricing_table(school_year: Optional[str] = None) -> PricingTable:
+    """Compiled pricing for a school year, reloaded only when its workbook changes on disk.
+
+    A year without its own workbook (or a malformed one from a query string) gets the default
+    year's pricing, so the cache only ever holds the years on disk.
+    """
+    default_year = os.getenv('SCHOOL_YEAR') or current_school_year()
+    if not school_year or not _SCHOOL_YEAR_RE.fullmatch(school_year) or not year_pricing_file(school_year):
+        school_year = default_year
+    path = pricing_file_for(school_year)
+    mtime = os.path.getmtime(path)
+    cached = _pricing_cache.get(school_year)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    table = load_pricing_table(path, school_year)
+    _pricing_cache[school_year] = (mtime, table)
+    return table
+
+
+def compute_tuition_ledger(table: PricingTable, students: Iterable[dict], student_parents: Iterable[dict],
+                           class_students: Iterable[dict], classes: Iterable[dict]) -> pd.DataFrame:
+    """Price every student in one vectorized pass.
+
+    Each enrollment costs the daily price for the student's grade and program_type times the
+    number of class days. Students with any priced academic enrollment pay the academic fee once.
+    Students are grouped by their first parent (lowest parent_id); within a family the lowest
+    student_id pays full price and the others get the sibling discount.
+    Returns one row per student: student_id, student_name, grade, parent_id, base_amount, amount.
+    """
+    students_df = pd.DataFrame(list(students), columns=['student_id', 'first_name', 'last_name', 'grade_level'])
+    enroll_df = pd.DataFrame(list(class_students), columns=['class_id', 'student_id', 'program_type'])
+    classes_df = pd.DataFrame(list(classes), columns=['class_id', 'days'])
+    links_df = pd.DataFrame(list(student_parents), columns=['student_id', 'parent_id'])
+
+    classes_df['num_days'] = classes_df['days'].map(lambda d: len(d) if d else 0)
+    enroll_df = enroll_df.merge(classes_df[['class_id', 'num_days']], on='class_id', how='inner')
+    enroll_df = enroll_df.merge(students_df[['student_id', 'grade_level']], on='student_id', how='inner')
+
+    fallback = GRADE_INDEX[FALLBACK_GRADE]
+    grade_idx = enroll_df['grade_level'].map(GRADE_INDEX).fillna(fallback).astype(int).to_numpy()
+    program_idx = (enroll_df['program_type'].fillna('').str.lower()
+                   .map(PROGRAM_INDEX).fillna(-1).astype(int).to_numpy())
+    num_days = enroll_df['num_days'].to_numpy()
+
+    daily = table.prices[grade_idx, np.clip(program_idx, 0, None)]
+    priced = (program_idx >= 0) & (num_days > 0) & ~np.isnan(daily)
+    enroll_df['line_amount'] = np.where(priced, daily * num_days, 0.0)
+    enroll_df['academic'] = priced & (program_idx == PROGRAM_INDEX['academic'])
+
+    per_student = enroll_df.groupby('student_id').agg(line_total=('line_amount', 'sum'),
+                                                      has_academic=('academic', 'any'))
+    ledger = students_df.merge(per_student, left_on='student_id', right_index=True, how='left')
+    ledger['base_amount'] = (ledger['line_total'].fillna(0.0)
+                             + np.where(ledger['has_academic'].fillna(False).astype(bool), table.academic_fee, 0.0))
+
+    first_parent = links_df.sort_values('parent_id', kind='stable').drop_duplicates('student_id', keep='first')
+    ledger = ledger.merge(first_parent, on='student_id', how='left')
+    ledger = ledger.sort_values('student_id', kind='stable')
+    sibling_rank = ledger.groupby('parent_id', dropna=False, sort=False).cumcount().to_numpy()
+    ledger['amount'] = np.where(sibling_rank > 0, ledger['base_amount'] * (1 - table.sibling_rate),
+                                ledger['base_amount'])
+    ledger['parent_id'] = ledger['parent_id'].astype(object).where(ledger['parent_id'].notna(), None)
+    ledger['student_name'] = ledger['last_name'].astype(str) + ', ' + ledger['first_name'].astype(str)
+    ledger = ledger.rename(columns={'grade_level': 'grade'})
+    return ledger[['student_id', 'student_name', 'grade', 'parent_id', 'base_amount', 'amount']].reset_index(drop=True)
+
+
+def scope_ledger(ledger: pd.DataFrame, student_parents: Iterable[dict], parent_id: Optional[str] = None,
+                 all_students: bool = False) -> pd.DataFrame:
+    """A computed ledger limited the way the database paths limit theirs (see ledger_function_params)."""
+    if all_students:
+        return ledger
+    own_students = {sp['student_id'] for sp in student_parents if parent_id is not None and sp['parent_id'] == parent_id}
+    return ledger[ledger['student_id'].isin(own_students)]
+
+
+# Database-side ledger: public.tuition_ledger (sql/tuition_ledger.sql) on Postgres and the query
+# below on a local SQLite copy of the tables. Both apply the rules of compute_tuition_ledger and
+# return only the final rows, so the app no longer pulls every enrollment to price the school.
+TUITION_LEDGER_FUNCTION = 'tuition_ledger'
+_GRADE_LIST = ', '.join(f"'{grade}'" for grade in GRADES)
+TUITION_LEDGER_SQLITE = f"""
+WITH lines AS (
+    SELECT cs.student_id,
+           json_extract(:prices, '$."' || (CASE WHEN s.grade_level IN ({_GRADE_LIST})
+                                                THEN s.grade_level ELSE '{FALLBACK_GRADE}' END)
+                                 || '"."' || lower(cs.program_type) || '"') AS daily,
+           coalesce(json_array_length(c.days), 0) AS num_days,
+           lower(cs.program_type) AS program_type
+    FROM class_students cs
+    JOIN classes c ON c.class_id = cs.class_id
+    JOIN students s ON s.student_id = cs.student_id
+),
+per_student AS (
+    SELECT student_id,
+           sum(CASE WHEN daily IS NOT NULL AND num_days > 0 THEN daily * num_days ELSE 0 END) AS line_total,
+           max(daily IS NOT NULL AND num_days > 0 AND program_type = 'academic') AS has_academic
+    FROM lines
+    GROUP BY student_id
+),
+first_parent AS (
+    SELECT student_id, min(parent_id) AS parent_id FROM student_parents GROUP BY student_id
+),
+ledger AS (
+    SELECT s.student_id,
+           coalesce(s.last_name, '') || ', ' || coalesce(s.first_name, '') AS student_name,
+           s.grade_level AS grade,
+           fp.parent_id,
+           coalesce(p.line_total, 0) + (CASE WHEN p.has_academic THEN :academic_fee ELSE 0 END) AS base_amount
+    FROM students s
+    LEFT JOIN per_student p ON p.student_id = s.student_id
+    LEFT JOIN first_parent fp ON fp.student_id = s.student_id
+),
+ranked AS (
+    SELECT l.*, row_number() OVER (PARTITION BY l.parent_id ORDER BY l.student_id) AS sibling_rank
+    FROM ledger l
+)
+SELECT student_id, student_name, grade, parent_id, base_amount,
+       CASE WHEN sibling_rank > 1 THEN base_amount * (1 - :sibling_rate) ELSE base_amount END AS amount
+FROM ranked
+WHERE :all_students
+   OR student_id IN (SELECT student_id FROM student_parents WHERE parent_id = :for_parent)
+ORDER BY student_id
+"""
+
+
+def ledger_function_params(table: PricingTable, parent_id: Optional[str] = None, all_students: bool = False) -> dict:
+    """Arguments for public.tuition_ledger / TUITION_LEDGER_SQLITE: the compiled prices plus fee and rate.
+
+    Rows are limited to parent_id's students unless all_students is set; no parent_id and no
+    all_students is an empty ledger, never the whole school.
+    """
+    return {
+        'prices': table.to_dict()['prices'],
+        'academic_fee': table.academic_fee,
+        'sibling_rate': table.sibling_rate,
+        'for_parent': parent_id,
+        'all_students': all_students,
+    }
+
+
+def sqlite_tuition_ledger(conn, table: PricingTable, parent_id: Optional[str] = None,
+                          all_students: bool = False) -> List[dict]:
+    """compute_tuition_ledger's rows computed inside SQLite (classes.days stored as JSON array text)."""
+    params = ledger_function_params(table, parent_id, all_students)
+    params['prices'] = json.dumps(params['prices'])
+    cursor = conn.execute(TUITION_LEDGER_SQLITE, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -0,0 +1,201 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import re
+import threading
+import time
+from typing import Callable, List, Optional
+from urllib.parse import parse_qs
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_FILE = 'settings.json'
+SETTINGS_CHECK_SECONDS = 2.0  # how often each worker re-reads the admin toggle
+TOP_FUNCTIONS = 30
+_PROFILE_ID_RE = re.compile(r'^\d+-\d+$')
+
+
+class RequestProfiler:
+    """Admin-toggled cProfile of whole requests, kept as a bounded ring of files in `directory`.
+
+    The toggle lives in directory/settings.json so every worker follows it. While it is off a
+    request costs one clock comparison (the file is re-read every SETTINGS_CHECK_SECONDS). While
+    on, a request is profiled if it falls in the sample rate, or if it asks (?profile=1 or
+    X-Profile: 1) and `can_force` allows it (the app only lets signed-in admins force a profile).
+    Each profile is saved as <id>.prof (load with pstats or snakeviz) plus <id>.json with the
+    route, timing and top functions; only the newest `ring_size` are kept.
+    """
+
+    def __init__(self, directory: str, ring_size: int = 50):
+        self.directory = directory
+        self.ring_size = ring_size
+        self.enabled = False
+        self.sample_rate = 0.0
+        self._next_check = 0.0
+
+    # Settings
+
+    def _settings_path(self) -> str:
+        return os.path.join(self.directory, SETTINGS_FILE)
+
+    def _refresh_settings(self) -> None:
+        self._next_check = time.monotonic() + SETTINGS_CHECK_SECONDS
+        try:
+            with open(self._settings_path(), encoding='utf-8') as f:
+                settings = json.load(f)
+        except (OSError, ValueError):
+            settings = {}
+        self.enabled = bool(settings.get('enabled'))
+        self.sample_rate = float(settings.get('sample_rate') or 0.0)
+
+    def configure(self, enabled: bool, sample_rate: float) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self._settings_path() + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'enabled': enabled, 'sample_rate': min(max(sample_rate, 0.0), 1.0)}, f)
+        os.replace(tmp_path, self._settings_path())
+        self._refresh_settings()
+
+    def active(self) -> bool:
+        if time.monotonic() >= self._next_check:
+            self._refresh_settings()
+        return self.enabled
+
+    def wants(self, environ: dict, can_force: Optional[Callable[[dict], bool]] = None) -> bool:
+        asked = environ.get('HTTP_X_PROFILE') == '1' or \
+            '1' in parse_qs(environ.get('QUERY_STRING', '')).get('profile', [])
+        if asked and can_force is not None and can_force(environ):
+            return True
+        return random.random() < self.sample_rate
+
+    # Ring
+
+    def save(self, profile: cProfile.Profile, route: str, method: str, path: str, elapsed: float) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f"{time.time_ns()}-{os.getpid()}"
+        base = os.path.join(self.directory, profile_id)
+        profile.dump_stats(base + '.prof')
+        stats = pstats.Stats(profile)
+        top = []
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            top.append({'function': f"{os.path.basename(filename)}:{line}({function})", 'ncalls': ncalls,
+                        'tottime_ms': round(tottime * 1000, 2), 'cumtime_ms': round(cumtime * 1000, 2)})
+        top.sort(key=lambda entry: entry['cumtime_ms'], reverse=True)
+        summary = {'id': profile_id, 'route': route, 'method': method, 'path': path,
+                   'elapsed_ms': round(elapsed * 1000, 2), 'recorded_at': time.time(), 'top': top[:TOP_FUNCTIONS]}
+        with open(base + '.json', 'w', encoding='utf-8') as f:
+            json.dump(summary, f)
+        self._prune()
+        return profile_id
+
+    def _ids(self) -> List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        return sorted((name[:-5] for name in names if name.endswith('.json') and _PROFILE_ID_RE.match(name[:-5])),
+                      key=lambda profile_id: int(profile_id.split('-')[0]))
+
+    def _prune(self) -> None:
+        ids = self._ids()
+        for profile_id in ids[:max(0, len(ids) - self.ring_size)]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass  # another worker pruned it first
+
+    def profiles(self) -> List[dict]:
+        """Summaries of the saved profiles, newest first."""
+        result = []
+        for profile_id in reversed(self._ids()):
+            summary = self.load(profile_id)
+            if summary:
+                result.append(summary)
+        return result
+
+    def load(self, profile_id: str) -> Optional[dict]:
+        if not _PROFILE_ID_RE.match(profile_id):
+            return None
+        try:
+            with open(os.path.join(self.directory, profile_id + '.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def stats_path(self, profile_id: str) -> Optional[str]:
+        path = os.path.join(self.directory, profile_id + '.prof')
+        return path if _PROFILE_ID_RE.match(profile_id) and os.path.exists(path) else None
+
+
+class ProfilerMiddleware:
+    """WSGI wrapper, so a profile covers routing, the view, Supabase calls and the (possibly
+    streamed) template rendering. A profiled response is buffered before it is returned.
+
+    One request per process is profiled at a time (from 3.12 cProfile can't run twice at once, and
+    concurrent profiles would blur each other anyway); requests arriving meanwhile run unprofiled.
+    """
+
+    def __init__(self, wsgi_app, profiler: RequestProfiler, route_name: Callable[[dict], str],
+                 can_force: Optional[Callable[[dict], bool]] = None):
+        self.wsgi_app = wsgi_app
+        self.profiler = profiler
+        self.route_name = route_name
+        self.can_force = can_force
+        self._busy = threading.Lock()
+
+    def __call__(self, environ, start_response):
+        if not self.profiler.active() or not self.profiler.wants(environ, self.can_force):
+            return self.wsgi_app(environ, start_response)
+        if not self._busy.acquire(blocking=False):
+            return self.wsgi_app(environ, start_response)
+        try:
+            profile = cProfile.Profile()
+            started = time.perf_counter()
+            try:
+                profile.enable()
+            except ValueError as e:  # another profiling tool (a debugger, coverage) holds the hook
+                logger.warning(f"Request not profiled: {str(e)}")
+                return self.wsgi_app(environ, start_response)
+            try:
+                response = self.wsgi_app(environ, start_response)
+                try:
+                    body = list(response)
+                finally:
+                    if hasattr(response, 'close'):
+                        response.close()
+            finally:
+                profile.disable()
+        finally:
+            self._busy.release()
+        try:
+            self.profiler.save(profile, self.route_name(environ), environ.get('REQUEST_METHOD', ''),
+                               environ.get('PATH_INFO', ''), time.perf_counter() - started)
+        except Exception as e:
+            logger.error(f"Error saving request profile: {str(e)}")
+        return body
+
+
+def route_summaries(profiles: List[dict], top: int = 15) -> List[dict]:
+    """Per route: request count, mean and max time, and the functions with the highest mean
+    cumulative time across that route's profiles. Slowest routes first."""
+    routes = {}
+    for summary in profiles:
+        route = routes.setdefault(summary['route'], {'route': summary['route'], 'count': 0, 'total_ms': 0.0,
+                                                     'max_ms': 0.0, 'functions': {}})
+        route['count'] += 1
+        route['total_ms'] += summary['elapsed_ms']
+        route['max_ms'] = max(route['max_ms'], summary['elapsed_ms'])
+        for entry in summary['top']:
+            route['functions'][entry['function']] = route['functions'].get(entry['function'], 0.0) + entry['cumtime_ms']
+    result = []
+    for route in routes.values():
+        functions = sorted(route.pop('functions').items(), key=lambda item: item[1], reverse=True)[:top]
+        route['avg_ms'] = round(route.pop('total_ms') / route['count'], 2)
+        route['top'] = [{'function': name, 'avg_cumtime_ms': round(total / route['count'], 2)}
+                        for name, total in functions]
+        result.append(route)
+    return sorted(result, key=lambda route: route['avg_ms'], reverse=True)
@@ -0,0 +1,273 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from db_functions import FunctionUnavailable, call_function
+from snapshot import SNAPSHOT_TABLES, TABLE_KEYS, iter_table_rows
+
+logger = logging.getLogger(__name__)
+
+# Only what the replica-backed reads need (students list, tuition ledger), in foreign key order;
+# users (password hashes) always stays upstream
+REPLICA_TABLES = ['parents', 'students', 'classes', 'student_parents', 'class_students']
+REPLICA_INDEXES: Dict[str, List[str]] = {
+    'student_parents': ['parent_id'],
+    'class_students': ['student_id'],
+    'classes': ['teacher_id', 'classroom_id'],
+}
+CLAIM_TIMEOUT = 120  # seconds before another worker may take over a refresh that never finished
+FINGERPRINT_RPC = 'replica_fingerprints'
+# Without FINGERPRINT_RPC, how often a table nobody wrote through the app is pulled anyway
+FULL_REFRESH_INTERVAL = 600
+
+
+def _sqlite_value(value):
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(',', ':'))
+    if isinstance(value, bool):
+        return int(value)
+    return value
+
+
+class ReadReplica:
+    """Local SQLite copy of the hosted tables, shared by every worker on the host through one file.
+
+    Each worker runs a refresher thread, but a table is only pulled by whichever worker claims it
+    in replica_meta. A table is due when a write bumped it (change_seq > synced_seq, set through
+    mark_dirty) or when it was last verified more than the refresh interval ago.
+
+    Due tables are checked before anything is downloaded: one replica_fingerprints call
+    (sql/replica.sql) returns a count and checksum per table, and a table is re-pulled only when
+    its fingerprint moved, so upstream reads follow the write rate instead of the refresh rate.
+    Without that function, a table the app wrote is re-pulled and an unwritten one is only
+    re-verified, with a full pull every full_refresh_interval for changes made outside the app.
+
+    Readers only get a connection when every table they need is clean and was verified within
+    max_staleness; otherwise they should read upstream. So writers see their own writes, and
+    nobody sees data older than the bound (for changes made outside the app, only with the
+    fingerprint function installed).
+    """
+
+    def __init__(self, client, path: str, max_staleness: float = 30.0, refresh_interval: Optional[float] = None,
+                 full_refresh_interval: float = FULL_REFRESH_INTERVAL):
+        self.client = client
+        self.path = path
+        self.max_staleness = max_staleness
+        self.refresh_interval = refresh_interval or max(1.0, max_staleness / 3)
+        self.full_refresh_interval = full_refresh_interval
+        self.pulls = 0  # full table downloads by this worker, for the metrics page
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._init_schema()
+
+    # Storage
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for table in REPLICA_TABLES:
+                columns = ', '.join(SNAPSHOT_TABLES[table])
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({columns}, PRIMARY KEY ({', '.join(TABLE_KEYS[table])}))")
+                for column in REPLICA_INDEXES.get(table, []):
+                    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{column} ON {table} ({column})")
+            conn.execute('CREATE TABLE IF NOT EXISTS replica_meta (table_name PRIMARY KEY, refreshed_at REAL, '
+                         'checksum TEXT, row_count INTEGER, change_seq INTEGER NOT NULL DEFAULT 0, '
+                         'synced_seq INTEGER NOT NULL DEFAULT 0, claimed_at REAL)')
+            existing = {row[1] for row in conn.execute('PRAGMA table_info(replica_meta)')}
+            for column in ('remote_checksum TEXT', 'pulled_at REAL'):  # added after the first release
+                if column.split()[0] not in existing:
+                    conn.execute(f'ALTER TABLE replica_meta ADD COLUMN {column}')
+            conn.executemany('INSERT OR IGNORE INTO replica_meta (table_name) VALUES (?)', [(t,) for t in REPLICA_TABLES])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    # Writes and refreshes
+
+    def mark_dirty(self, *tables: str) -> None:
+        """A write hit these tables upstream: stop serving them locally until they are re-pulled."""
+        tables = [t for t in tables if t in REPLICA_TABLES]
+        if not tables:
+            return
+        self._connect().execute(
+            f"UPDATE replica_meta SET change_seq = change_seq + 1 WHERE table_name IN ({', '.join('?' * len(tables))})",
+            tables)
+        self._wake.set()
+
+    def _claim(self, table: str, force: bool) -> Optional[int]:
+        """Take the refresh of one table for this worker; returns the change_seq being synced."""
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.execute(
+            'UPDATE replica_meta SET claimed_at = :now WHERE table_name = :table '
+            'AND (claimed_at IS NULL OR claimed_at < :now - :timeout) '
+            'AND (:force OR change_seq != synced_seq OR refreshed_at IS NULL OR refreshed_at < :now - :interval)',
+            {'now': now, 'table': table, 'timeout': CLAIM_TIMEOUT, 'force': int(force), 'interval': self.refresh_interval})
+        if cursor.rowcount != 1:
+            return None
+        return conn.execute('SELECT change_seq FROM replica_meta WHERE table_name = ?', (table,)).fetchone()[0]
+
+    def _release(self, table: str) -> None:
+        self._connect().execute('UPDATE replica_meta SET claimed_at = NULL WHERE table_name = ?', (table,))
+
+    def _fingerprints(self, tables: List[str]) -> Optional[Dict[str, str]]:
+        """table -> 'count:md5' as the database sees it now, or None when sql/replica.sql isn't installed."""
+        try:
+            rows = call_function(self.client, FINGERPRINT_RPC, {'tables': tables})
+        except FunctionUnavailable:
+            return None
+        return {row['table_name']: f"{row['row_count']}:{row['checksum']}" for row in rows}
+
+    def _unchanged(self, table: str, seq: int, fingerprint: Optional[str], fingerprints_available: bool) -> bool:
+        synced_seq, remote_checksum, pulled_at = self._connect().execute(
+            'SELECT synced_seq, remote_checksum, pulled_at FROM replica_meta WHERE table_name = ?', (table,)).fetchone()
+        if pulled_at is None:
+            return False
+        if fingerprints_available:
+            # Taken after the claim, so it already covers any write that made the table due
+            return fingerprint is not None and fingerprint == remote_checksum
+        return seq == synced_seq and pulled_at >= time.time() - self.full_refresh_interval
+
+    def _verify(self, table: str, seq: int) -> None:
+        self._connect().execute('UPDATE replica_meta SET refreshed_at = ?, synced_seq = ?, claimed_at = NULL '
+                                'WHERE table_name = ?', (time.time(), seq, table))
+
+    def _pull(self, table: str, seq: int, fingerprint: Optional[str]) -> None:
+        """Download one table and replace the local copy if its contents changed.
+
+        fingerprint was read before the download, so a write landing in between only makes the
+        next check pull again; it can never mark newer upstream data as already synced.
+        """
+        conn = self._connect()
+        columns = SNAPSHOT_TABLES[table]
+        rows = [tuple(_sqlite_value(row.get(column)) for column in columns)
+                for row in iter_table_rows(self.client, table)]
+        self.pulls += 1
+        checksum = hashlib.sha256(json.dumps(rows, separators=(',', ':')).encode('utf-8')).hexdigest()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT checksum FROM replica_meta WHERE table_name = ?', (table,)).fetchone()[0] != checksum:
+                conn.execute(f"DELETE FROM {table}")
+                conn.executemany(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+            now = time.time()
+            conn.execute('UPDATE replica_meta SET refreshed_at = ?, pulled_at = ?, checksum = ?, remote_checksum = ?, '
+                         'row_count = ?, synced_seq = ?, claimed_at = NULL WHERE table_name = ?',
+                         (now, now, checksum, fingerprint, len(rows), seq, table))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def refresh(self, force: bool = False) -> List[str]:
+        """Bring every due table (every table with force) up to date; returns the tables pulled."""
+        claimed = {}
+        for table in REPLICA_TABLES:
+            seq = self._claim(table, force)
+            if seq is not None:
+                claimed[table] = seq
+        if not claimed:
+            return []
+        try:
+            fingerprints = self._fingerprints(list(claimed))
+        except Exception:
+            for table in claimed:
+                self._release(table)
+            raise
+        pulled = []
+        for table, seq in claimed.items():
+            fingerprint = fingerprints.get(table) if fingerprints is not None else None
+            try:
+                if not force and self._unchanged(table, seq, fingerprint, fingerprints is not None):
+                    self._verify(table, seq)
+                else:
+                    self._pull(table, seq, fingerprint)
+                    pulled.append(table)
+            except Exception as e:
+                self._release(table)
+                logger.error(f"Replica refresh of {table} failed: {str(e)}")
+        return pulled
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.refresh_interval)
+            self._wake.clear()
+            try:
+                pulled = self.refresh()
+                if pulled:
+                    logger.info(f"Replica pulled {', '.join(pulled)}")
+            except Exception as e:
+                logger.error(f"Replica refresh failed: {str(e)}")
+
+    def start(self) -> None:
+        """Start this worker's refresher thread (lazily, so it runs in the worker, not a preforking master)."""
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='replica-refresher', daemon=True)
+                self._thread.start()
+                self._wake.set()
+
+    # Reads
+
+    def connection(self, *tables: str) -> Optional[sqlite3.Connection]:
+        """A connection to read these tables locally, or None if any is dirty or past the staleness bound."""
+        self.start()
+        conn = self._connect()
+        placeholders = ', '.join('?' * len(tables))
+        rows = conn.execute(f"SELECT refreshed_at, change_seq, synced_seq FROM replica_meta "
+                            f"WHERE table_name IN ({placeholders})", tables).fetchall()
+        cutoff = time.time() - self.max_staleness
+        if len(rows) != len(tables) or any(r[0] is None or r[0] < cutoff or r[1] != r[2] for r in rows):
+            self._wake.set()
+            return None
+        return conn
+
+    def status(self) -> List[dict]:
+        cursor = self._connect().execute('SELECT table_name, refreshed_at, pulled_at, row_count, change_seq, synced_seq, '
+                                         'claimed_at FROM replica_meta ORDER BY table_name')
+        now = time.time()
+        return [{'table': name, 'age_seconds': round(now - refreshed, 1) if refreshed else None,
+                 'pulled_seconds_ago': round(now - pulled, 1) if pulled else None, 'rows': count,
+                 'dirty': change_seq != synced_seq, 'refreshing': claimed is not None}
+                for name, refreshed, pulled, count, change_seq, synced_seq, claimed in cursor.fetchall()
+                if name in REPLICA_TABLES]
+
+
+def students_with_parents(conn: sqlite3.Connection, student_ids: Optional[List[str]] = None) -> List[dict]:
+    """Replica version of the students list query: the same row shape as the PostgREST embed
+    students(..., student_parents(parents(parent_id, first_name, last_name)))."""
+    columns = SNAPSHOT_TABLES['students']
+    where, params = '', []
+    if student_ids is not None:
+        if not student_ids:
+            return []
+        where, params = f" WHERE student_id IN ({', '.join('?' * len(student_ids))})", list(student_ids)
+    students = [dict(zip(columns, row)) for row in
+                conn.execute(f"SELECT {', '.join(columns)} FROM students{where}", params)]
+    for student in students:
+        student['student_parents'] = []
+    by_id = {student['student_id']: student for student in students}
+    links = conn.execute('SELECT sp.student_id, p.parent_id, p.first_name, p.last_name FROM student_parents sp '
+                         'JOIN parents p ON p.parent_id = sp.parent_id')
+    for student_id, parent_id, first_name, last_name in links:
+        if student_id in by_id:
+            by_id[student_id]['student_parents'].append(
+                {'parents': {'parent_id': parent_id, 'first_name': first_name, 'last_name': last_name}})
+    return students
+
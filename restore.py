@@ -0,0 +1,322 @@
+import argparse
+import csv
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from enrollment import WAITLIST_TABLE, is_missing_table
+from snapshot import (ARRAY_COLUMNS, MANIFEST_FILE, OPTIONAL_TABLES, SNAPSHOT_TABLES, TABLE_KEYS, format_cell,
+                      iter_table_rows, snapshot_file)
+
+logger = logging.getLogger(__name__)
+
+INTEGER_COLUMNS: Dict[str, List[str]] = {
+    'classes': ['max_size'],
+}
+BOOLEAN_COLUMNS: Dict[str, List[str]] = {
+    'parents': ['is_staff'],
+}
+# Identity columns the database generates itself (class_waitlist.position: insert order is line order)
+GENERATED_COLUMNS: Dict[str, List[str]] = {
+    'class_waitlist': ['position'],
+}
+# Restored one chunk at a time, in file order, so generated positions come out in the same order
+SEQUENTIAL_TABLES = {'class_waitlist'}
+STATE_FILE = 'restore_state.json'
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_WORKERS = 4
+
+
+def table_path(directory: str, table: str, manifest: Optional[dict]) -> Optional[str]:
+    """Snapshot file for a table: the one named in the manifest, else <table>_rows.csv(.gz)."""
+    if manifest and table in manifest['tables']:
+        return os.path.join(directory, manifest['tables'][table]['file'])
+    for compress in (False, True):
+        path = os.path.join(directory, snapshot_file(table, compress))
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _open_text(path: str):
+    # utf-8-sig: dashboard exports may start with a BOM
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8-sig', newline='')
+    return open(path, 'r', encoding='utf-8-sig', newline='')
+
+
+def file_checksum(path: str) -> str:
+    """sha256 of the uncompressed CSV text, as recorded in manifest.json."""
+    digest = hashlib.sha256()
+    with _open_text(path) as f:
+        for block in iter(lambda: f.read(1 << 16), ''):
+            digest.update(block.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def parse_row(table: str, record: dict) -> dict:
+    """CSV strings -> API values: '' is NULL, array columns are JSON, plus integer/boolean columns."""
+    row = {column: (value if value != '' else None) for column, value in record.items()
+           if column not in GENERATED_COLUMNS.get(table, [])}
+    for column in ARRAY_COLUMNS.get(table, []):
+        if row.get(column) is not None:
+            row[column] = json.loads(row[column])
+    for column in INTEGER_COLUMNS.get(table, []):
+        if row.get(column) is not None:
+            row[column] = int(row[column])
+    for column in BOOLEAN_COLUMNS.get(table, []):
+        if row.get(column) is not None:
+            row[column] = row[column].strip().lower() in ('true', 't', '1', 'yes')
+    return row
+
+
+def iter_chunks(path: str, table: str, chunk_size: int) -> Iterator[List[dict]]:
+    with _open_text(path) as f:
+        chunk = []
+        for record in csv.DictReader(f):
+            chunk.append(parse_row(table, record))
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+class RestoreState:
+    """Completed chunks per table, saved next to the manifest so an interrupted restore resumes.
+
+    Progress is tied to each table file's checksum and the chunk size; if either changes, that
+    table starts over.
+    """
+
+    def __init__(self, directory: str, restart: bool = False):
+        self.path = os.path.join(directory, STATE_FILE)
+        self.lock = threading.Lock()
+        self.state = {}
+        if not restart and os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state = json.load(f)
+
+    def done_chunks(self, table: str, checksum: str, chunk_size: int) -> set:
+        entry = self.state.get(table)
+        if not entry or entry['sha256'] != checksum or entry['chunk_size'] != chunk_size:
+            self.state[table] = {'sha256': checksum, 'chunk_size': chunk_size, 'done': [], 'complete': False}
+            return set()
+        return set(entry['done'])
+
+    def mark(self, table: str, chunk_index: int = None, complete: bool = False) -> None:
+        with self.lock:
+            entry = self.state[table]
+            if chunk_index is not None:
+                entry['done'].append(chunk_index)
+            entry['complete'] = entry['complete'] or complete
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.path)
+
+    def reset(self, table: str) -> None:
+        """Forget a table's progress, so it is restored again in full."""
+        with self.lock:
+            self.state.pop(table, None)
+
+    def clear(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def complete(self, table: str) -> bool:
+        return bool(self.state.get(table, {}).get('complete'))
+
+
+def load_manifest(directory: str) -> Optional[dict]:
+    path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def snapshot_tables(directory: str, tables: Optional[List[str]] = None,
+                    manifest: Optional[dict] = None) -> List[Tuple[str, str, str]]:
+    """(table, path, checksum) for every snapshot file to restore, in foreign key order.
+
+    Every checksum is verified against the manifest up front, so a corrupt file stops the restore
+    before anything is written or deleted.
+    """
+    files = []
+    for table in [t for t in SNAPSHOT_TABLES if not tables or t in tables]:
+        path = table_path(directory, table, manifest)
+        if not path:
+            logger.warning(f"Restore: no snapshot file for {table}, skipping")
+            continue
+        checksum = file_checksum(path)
+        expected = manifest['tables'][table]['sha256'] if manifest and table in manifest['tables'] else None
+        if expected and expected != checksum:
+            raise ValueError(f"Checksum mismatch for {path}: snapshot file is corrupt or was edited")
+        files.append((table, path, checksum))
+    return files
+
+
+def snapshot_keys(path: str, table: str) -> Set[Tuple[str, ...]]:
+    """Key tuples of the rows in a snapshot file, as CSV text."""
+    columns = TABLE_KEYS[table]
+    with _open_text(path) as f:
+        return {tuple(record[column] for column in columns) for record in csv.DictReader(f)}
+
+
+def database_keys(client, table: str) -> Iterator[Tuple[str, ...]]:
+    """Key tuples of the rows in a database table, as snapshot CSV text."""
+    columns = TABLE_KEYS[table]
+    for row in iter_table_rows(client, table):
+        yield tuple(format_cell(row.get(column)) for column in columns)
+
+
+def find_extra_rows(client, directory: str, tables: Optional[List[str]] = None) -> Dict[str, List[Tuple[str, ...]]]:
+    """Per table, the keys of database rows that the snapshot doesn't have (what upserting leaves
+    behind). Tables without a snapshot file are not compared."""
+    extra = {}
+    for table, path, _ in snapshot_tables(directory, tables, load_manifest(directory)):
+        wanted = snapshot_keys(path, table)
+        try:
+            extra[table] = [key for key in database_keys(client, table) if key not in wanted]
+        except Exception as e:
+            if table not in OPTIONAL_TABLES or not is_missing_table(e):
+                raise
+            logger.warning(f"Restore: {table} is not installed, not compared")
+    return extra
+
+
+def delete_extra_rows(client, extra: Dict[str, List[Tuple[str, ...]]],
+                      chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, int]:
+    """Delete the rows found by find_extra_rows, children before parents (reverse foreign key order)."""
+    deleted = {}
+    for table in reversed(list(SNAPSHOT_TABLES)):
+        keys = extra.get(table)
+        if not keys:
+            continue
+        columns = TABLE_KEYS[table]
+        groups: Dict[Tuple[str, ...], List[str]] = {}
+        for key in keys:
+            groups.setdefault(key[:-1], []).append(key[-1])
+        for prefix, last in groups.items():
+            for start in range(0, len(last), chunk_size):
+                query = client.table(table).delete()
+                for column, value in zip(columns, prefix):
+                    query = query.eq(column, value)
+                query.in_(columns[-1], last[start:start + chunk_size]).execute()
+        deleted[table] = len(keys)
+        logger.info(f"Restore: deleted {len(keys)} {table} rows not in the snapshot")
+    return deleted
+
+
+def restore_snapshot(client, directory: str, tables: Optional[List[str]] = None,
+                     chunk_size: int = DEFAULT_CHUNK_SIZE, workers: int = DEFAULT_WORKERS,
+                     restart: bool = False, prune: bool = False) -> Dict[str, int]:
+    """Upsert a backups/-style snapshot into the database, table by table in foreign key order.
+
+    Chunks of one table are written concurrently by `workers` threads; tables are done one after
+    another so parents always exist before the rows that reference them. Returns rows written per
+    table (0 for tables skipped because a previous run completed them).
+
+    Upserting leaves rows the snapshot doesn't have in place; with prune they are deleted first
+    (see find_extra_rows), so the restored tables match the snapshot exactly.
+
+    Pruning class_students fires the waitlist promote trigger (sql/enrollment.sql), which would
+    move waitlisted students into the freed seats; upserting class_waitlist afterwards would then
+    leave them on both the roster and the waitlist. So when roster rows are pruned and the
+    waitlist is restored too, the whole waitlist is cleared first (nothing left to promote) and
+    written back from the snapshot after class_students, in line order. Pruning class_students
+    without restoring class_waitlist lets the trigger fill the freed seats, as any delete would.
+    """
+    manifest = load_manifest(directory)
+    files = snapshot_tables(directory, tables, manifest)
+    state = RestoreState(directory, restart)
+    if prune:
+        extra = find_extra_rows(client, directory, [table for table, _, _ in files])
+        if extra.get('class_students'):
+            if WAITLIST_TABLE in extra:
+                extra[WAITLIST_TABLE] = list(database_keys(client, WAITLIST_TABLE))
+                state.reset(WAITLIST_TABLE)
+            else:
+                logger.warning(f"Restore: pruning class_students without restoring {WAITLIST_TABLE}; "
+                               f"freed seats are filled from the waitlist if it is installed")
+        delete_extra_rows(client, extra, chunk_size)
+    written = {}
+    for table, path, checksum in files:
+        done = state.done_chunks(table, checksum, chunk_size)
+        if state.complete(table):
+            logger.info(f"Restore: {table} already restored, skipping")
+            written[table] = 0
+            continue
+
+        on_conflict = ','.join(TABLE_KEYS[table])
+        counts = []
+
+        def upsert(index_chunk):
+            index, chunk = index_chunk
+            client.table(table).upsert(chunk, on_conflict=on_conflict).execute()
+            state.mark(table, index)
+            return len(chunk)
+
+        started = time.perf_counter()
+        pending = ((i, chunk) for i, chunk in enumerate(iter_chunks(path, table, chunk_size)) if i not in done)
+        try:
+            with ThreadPoolExecutor(max_workers=1 if table in SEQUENTIAL_TABLES else max(1, workers)) as pool:
+                counts.extend(pool.map(upsert, pending))
+        except Exception as e:
+            if table not in OPTIONAL_TABLES or not is_missing_table(e):
+                raise
+            logger.warning(f"Restore: {table} is not installed (see sql/), skipping")
+            written[table] = 0
+            continue
+        state.mark(table, complete=True)
+        written[table] = sum(counts)
+        logger.info(f"Restore: {table} {written[table]} rows in {time.perf_counter() - started:.2f}s")
+    # Finished: the next run restores from scratch instead of resuming
+    state.clear()
+    return written
+
+
+if __name__ == '__main__':
+    # Restore or seed: python restore.py backups/snapshots/20250601-020000 [--workers 8] [--restart]
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Restore (upsert) a backups/-style snapshot.')
+    parser.add_argument('directory', nargs='?', default='backups')
+    parser.add_argument('--tables', nargs='*', help=f"subset of: {' '.join(SNAPSHOT_TABLES)}")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--restart', action='store_true', help='ignore progress from an interrupted run')
+    parser.add_argument('--report-extra', action='store_true',
+                        help='list rows in the database that are not in the snapshot, then restore')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete rows that are not in the snapshot before restoring; class_waitlist is '
+                             'rewritten whole when roster rows are pruned')
+    args = parser.parse_args()
+
+    load_dotenv()
+    # After load_dotenv, so DATA_VERSION_FILE from .env is the app's shared version file
+    from versions import bump_version
+
+    client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+    started = time.perf_counter()
+    if args.report_extra and not args.prune:
+        for table, keys in find_extra_rows(client, args.directory, args.tables).items():
+            print(f"{table}: {len(keys)} rows not in the snapshot"
+                  + (f" ({', '.join('/'.join(key) for key in keys[:5])}{' ...' if len(keys) > 5 else ''})" if keys else ''))
+    try:
+        result = restore_snapshot(client, args.directory, args.tables, args.chunk_size, args.workers, args.restart,
+                                  prune=args.prune)
+    finally:
+        # Running workers on this host drop their cached copies of the restored tables
+        bump_version(*[table for table in SNAPSHOT_TABLES if not args.tables or table in args.tables])
+    print(f"Restored {sum(result.values())} rows in {time.perf_counter() - started:.1f}s: "
+          + ', '.join(f"{t} {n}" for t, n in result.items()))
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import logging
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from enrollment import clear_waitlists
+from normalize import VALID_GRADES, normalize_grade_level
+
+logger = logging.getLogger(__name__)
+
+FINAL_GRADE = VALID_GRADES[-1]
+DEFAULT_CHUNK_SIZE = 500  # ids per in_() filter, keeps request URLs well under proxy limits
+
+
+def next_grade(grade) -> Optional[str]:
+    """'K' -> '1', '7th' -> '8'; None for 12th grade and for anything that isn't a single K-12 grade."""
+    grades = normalize_grade_level(grade or '')
+    if len(grades) != 1:
+        return None
+    position = VALID_GRADES.index(grades[0])
+    return VALID_GRADES[position + 1] if position + 1 < len(VALID_GRADES) else None
+
+
+def _student_name(student: dict) -> str:
+    return f"{student.get('last_name') or ''}, {student.get('first_name') or ''}"
+
+
+def plan_rollover(students: Iterable[dict], class_students: Iterable[dict], classes: Iterable[dict]) -> dict:
+    """The whole year-end transition computed in memory, in the shape shown as the preview.
+
+    - promote: every student one grade up the K-12 ordering
+    - graduate: 12th graders, removed with their parent links (they stay in the archive snapshot)
+    - skipped: students whose grade_level isn't a single K-12 grade; left untouched for review
+    - enrollments: class_students rows cleared so next year's rosters start empty
+    - classes: carried forward unchanged (terms are 'Semester 1'/'Semester 2'/'Both', not dated)
+    """
+    plan = {'promote': [], 'graduate': [], 'skipped': [], 'enrollments': 0, 'classes': []}
+    enrolled = defaultdict(int)
+    for enrollment in class_students:
+        enrolled[enrollment['class_id']] += 1
+        plan['enrollments'] += 1
+    for student in sorted(students, key=lambda s: (_student_name(s).lower(), s['student_id'])):
+        grades = normalize_grade_level(student.get('grade_level') or '')
+        entry = {'student_id': student['student_id'], 'name': _student_name(student),
+                 'grade': student.get('grade_level')}
+        if len(grades) != 1:
+            plan['skipped'].append(entry)
+        elif grades[0] == FINAL_GRADE:
+            plan['graduate'].append(entry)
+        else:
+            plan['promote'].append({**entry, 'new_grade': next_grade(grades[0])})
+    plan['classes'] = sorted(
+        ({'class_id': cls['class_id'], 'name': cls.get('name'), 'term': cls.get('term'),
+          'enrolled': enrolled.get(cls['class_id'], 0)} for cls in classes),
+        key=lambda c: ((c['name'] or '').lower(), c['term'] or ''),
+    )
+    plan['fingerprint'] = plan_fingerprint(plan)
+    return plan
+
+
+def plan_fingerprint(plan: dict) -> str:
+    """Short hash of a plan, echoed back on apply so a preview that went stale is refused."""
+    content = {key: plan[key] for key in ('promote', 'graduate', 'skipped', 'enrollments', 'classes')}
+    return hashlib.sha1(json.dumps(content, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def _chunks(ids: List[str], size: int) -> Iterable[List[str]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def apply_rollover(client, plan: dict, enrollment_class_ids: Iterable[str],
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict[str, int]:
+    """Write a plan with bulk deletes/updates: one update per target grade instead of one per student.
+
+    enrollment_class_ids are the class_ids that currently have class_students rows (including
+    orphans whose class no longer exists). Take a snapshot before calling this; it is the only undo.
+    """
+    class_ids = sorted(set(enrollment_class_ids))
+    # Waitlists go first: clearing a roster would otherwise promote last year's waitlist into it
+    clear_waitlists(client, class_ids + [cls['class_id'] for cls in plan['classes']], chunk_size)
+    for chunk in _chunks(class_ids, chunk_size):
+        client.table('class_students').delete().in_('class_id', chunk).execute()
+
+    graduate_ids = [entry['student_id'] for entry in plan['graduate']]
+    for chunk in _chunks(graduate_ids, chunk_size):
+        client.table('student_parents').delete().in_('student_id', chunk).execute()
+        client.table('students').delete().in_('student_id', chunk).execute()
+
+    by_grade = defaultdict(list)
+    for entry in plan['promote']:
+        by_grade[entry['new_grade']].append(entry['student_id'])
+    for grade, student_ids in by_grade.items():
+        for chunk in _chunks(student_ids, chunk_size):
+            client.table('students').update({'grade_level': grade}).in_('student_id', chunk).execute()
+
+    counts = {'promoted': len(plan['promote']), 'graduated': len(graduate_ids),
+              'enrollments_cleared': plan['enrollments'], 'classes_carried': len(plan['classes'])}
+    logger.info(f"Rollover applied: {counts}")
+    return counts
@@ -0,0 +1,202 @@
+from collections import defaultdict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+# A slot is (semester, day, block). 'Both' (and unknown) terms occupy the slot in both semesters.
+Slot = Tuple[int, int, int]
+
+TERM_SEMESTERS = {
+    'Semester 1': (1,),
+    'Semester 2': (2,),
+    'Both': (1, 2),
+}
+DAY_NAMES = {1: 'Monday', 2: 'Tuesday', 3: 'Wednesday', 4: 'Thursday', 5: 'Friday'}
+
+# Who can be double-booked, and which class column names them
+RESOURCE_COLUMNS = {
+    'teacher': 'teacher_id',
+    'classroom': 'classroom_id',
+}
+
+
+def _as_ints(value) -> List[int]:
+    """days/schedule_block are INTEGER[] but older rows hold a bare int or digit strings."""
+    if value is None:
+        return []
+    if not isinstance(value, (list, tuple)):
+        value = [value]
+    return [int(v) for v in value if isinstance(v, int) or (isinstance(v, str) and v.strip().isdigit())]
+
+
+def class_slots(cls: dict) -> FrozenSet[Slot]:
+    """Every (semester, day, block) a class meets in; empty when it is not scheduled."""
+    semesters = TERM_SEMESTERS.get(cls.get('term'), (1, 2))
+    days = _as_ints(cls.get('days'))
+    blocks = _as_ints(cls.get('schedule_block'))
+    return frozenset((s, d, b) for s in semesters for d in days for b in blocks)
+
+
+def describe_slot(slot: Slot) -> str:
+    semester, day, block = slot
+    return f"S{semester} {DAY_NAMES.get(day, f'Day {day}')} B{block}"
+
+
+class ScheduleIndex:
+    """Occupancy index (kind, entity_id, slot) -> class_ids over students, teachers and classrooms.
+
+    Building is linear in the number of class slots plus enrollments. Checks for a proposed roster
+    or class edit only touch the slots of that one class, so they stay cheap on every save.
+    """
+
+    def __init__(self, classes: Iterable[dict], class_students: Iterable[dict]):
+        self.classes: Dict[str, dict] = {}
+        self.slots: Dict[str, FrozenSet[Slot]] = {}
+        self.rosters: Dict[str, Set[str]] = defaultdict(set)
+        self.student_classes: Dict[str, Set[str]] = defaultdict(set)
+        self.occupancy: Dict[Tuple[str, str, Slot], Set[str]] = defaultdict(set)
+        self._axes: Optional[Tuple[List[int], List[int]]] = None
+        for cls in classes:
+            self.set_class(cls)
+        for enrollment in class_students:
+            self._enroll(enrollment['class_id'], enrollment['student_id'])
+
+    # Incremental maintenance
+
+    def _occupy(self, kind: str, entity_id: Optional[str], class_id: str, slots: Iterable[Slot], add: bool) -> None:
+        if not entity_id:
+            return
+        for slot in slots:
+            key = (kind, entity_id, slot)
+            if add:
+                self.occupancy[key].add(class_id)
+            else:
+                occupants = self.occupancy.get(key)
+                if occupants is not None:
+                    occupants.discard(class_id)
+                    if not occupants:
+                        del self.occupancy[key]
+
+    def _enroll(self, class_id: str, student_id: str) -> None:
+        if class_id not in self.classes or student_id in self.rosters[class_id]:
+            return
+        self.rosters[class_id].add(student_id)
+        self.student_classes[student_id].add(class_id)
+        self._occupy('student', student_id, class_id, self.slots[class_id], True)
+
+    def remove_class(self, class_id: str) -> None:
+        cls = self.classes.pop(class_id, None)
+        if cls is None:
+            return
+        slots = self.slots.pop(class_id)
+        for kind, column in RESOURCE_COLUMNS.items():
+            self._occupy(kind, cls.get(column), class_id, slots, False)
+        for student_id in self.rosters.pop(class_id, set()):
+            self._unenroll(class_id, student_id, slots)
+        self._axes = None
+
+    def set_class(self, cls: dict) -> None:
+        """Add or replace a class (its roster is kept and re-slotted)."""
+        class_id = cls['class_id']
+        roster = set(self.rosters.get(class_id, ()))
+        if class_id in self.classes:
+            cls = {**self.classes[class_id], **cls}
+        self.remove_class(class_id)
+        self.classes[class_id] = cls
+        self.slots[class_id] = class_slots(cls)
+        for kind, column in RESOURCE_COLUMNS.items():
+            self._occupy(kind, cls.get(column), class_id, self.slots[class_id], True)
+        self._axes = None
+        for student_id in roster:
+            self._enroll(class_id, student_id)
+
+    def _unenroll(self, class_id: str, student_id: str, slots: Iterable[Slot]) -> None:
+        self._occupy('student', student_id, class_id, slots, False)
+        self.student_classes[student_id].discard(class_id)
+
+    def set_roster(self, class_id: str, student_ids: Iterable[str]) -> None:
+        for student_id in self.rosters.pop(class_id, set()):
+            self._unenroll(class_id, student_id, self.slots.get(class_id, ()))
+        for student_id in student_ids:
+            self._enroll(class_id, student_id)
+
+    # Queries
+
+    def conflicts(self) -> List[dict]:
+        """Every double booking in the school, one entry per (kind, entity, slot)."""
+        return [
+            {'kind': kind, 'entity_id': entity_id, 'slot': describe_slot(slot), 'class_ids': sorted(class_ids)}
+            for (kind, entity_id, slot), class_ids in self.occupancy.items()
+            if len(class_ids) > 1
+        ]
+
+    def _clashes(self, kind: str, entity_id: Optional[str], class_id: str, slots: Iterable[Slot]) -> List[dict]:
+        if not entity_id:
+            return []
+        found = []
+        for slot in slots:
+            others = self.occupancy.get((kind, entity_id, slot), set()) - {class_id}
+            if others:
+                found.append({'kind': kind, 'entity_id': entity_id, 'slot': describe_slot(slot),
+                              'class_ids': sorted(others)})
+        return found
+
+    def check_roster(self, class_id: str, student_ids: Iterable[str]) -> List[dict]:
+        """Conflicts the proposed roster would create for class_id."""
+        slots = self.slots.get(class_id, frozenset())
+        found = []
+        for student_id in student_ids:
+            found.extend(self._clashes('student', student_id, class_id, slots))
+        return found
+
+    def check_class(self, cls: dict) -> List[dict]:
+        """Conflicts a proposed class insert/edit would create for its teacher, classroom and roster."""
+        class_id = cls.get('class_id')
+        merged = {**self.classes.get(class_id, {}), **cls}
+        slots = class_slots(merged)
+        found = []
+        for kind, column in RESOURCE_COLUMNS.items():
+            found.extend(self._clashes(kind, merged.get(column), class_id, slots))
+        for student_id in self.rosters.get(class_id, ()):
+            found.extend(self._clashes('student', student_id, class_id, slots))
+        return found
+
+    def classes_for(self, kind: str, entity_id: str) -> List[str]:
+        """class_ids a student, teacher or classroom is booked into."""
+        if kind == 'student':
+            return list(self.student_classes.get(entity_id, ()))
+        column = RESOURCE_COLUMNS[kind]
+        return [class_id for class_id, cls in self.classes.items() if cls.get(column) == entity_id]
+
+    def axes(self) -> Tuple[List[int], List[int]]:
+        """School-wide (days, blocks) so every timetable grid lines up."""
+        if self._axes is None:
+            used = {(day, block) for slots in self.slots.values() for _, day, block in slots}
+            self._axes = (sorted({day for day, _ in used} | {1, 2, 3, 4}),
+                          sorted({block for _, block in used}) or [1])
+        return self._axes
+
+    def timetable(self, kind: str, entity_id: str) -> dict:
+        """Weekly grid for one student/teacher/classroom: {'cells': {(day, block): [class]}, 'unscheduled': [class]}."""
+        cells = defaultdict(list)
+        unscheduled = []
+        for class_id in self.classes_for(kind, entity_id):
+            cls = self.classes[class_id]
+            cell_keys = sorted({(day, block) for _, day, block in self.slots[class_id]})
+            if not cell_keys:
+                unscheduled.append(cls)
+            for key in cell_keys:
+                cells[key].append(cls)
+        for entries in cells.values():
+            entries.sort(key=lambda c: (c.get('term') or '', c.get('name') or ''))
+        unscheduled.sort(key=lambda c: c.get('name') or '')
+        return {'cells': dict(cells), 'unscheduled': unscheduled}
+
+
+def describe_conflicts(conflicts: List[dict], names: Dict[str, str], limit: int = 5) -> str:
+    """Human readable summary for flash messages, e.g. 'teacher Smith, Ann: S1 Monday B2 (Art)'."""
+    parts = [
+        f"{c['kind']} {names.get(c['entity_id'], c['entity_id'])}: {c['slot']} "
+        f"({', '.join(names.get(class_id, class_id) for class_id in c['class_ids'])})"
+        for c in conflicts[:limit]
+    ]
+    more = len(conflicts) - limit
+    return '; '.join(parts) + (f" and {more} more" if more > 0 else '')
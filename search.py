@@ -0,0 +1,298 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from normalize import NON_DIGIT_RE, format_phone
+
+# Indexed entity -> (table, id column, public fields, staff-only fields, label)
+SEARCH_ENTITIES: Dict[str, Tuple[str, str, List[str], List[str], Callable[[dict], str]]] = {
+    'students': ('students', 'student_id', ['first_name', 'last_name', 'email', 'phone'],
+                 ['allergies', 'medicines', 'medical_conditions'],
+                 lambda r: f"{r.get('last_name') or ''}, {r.get('first_name') or ''} ({r.get('grade_level') or ''})"),
+    'parents': ('parents', 'parent_id', ['first_name', 'last_name', 'email', 'phone'], [],
+                lambda r: f"{r.get('last_name') or ''}, {r.get('first_name') or ''}"),
+    'teachers': ('teachers', 'teacher_id', ['first_name', 'last_name', 'email', 'phone'], [],
+                 lambda r: f"{r.get('last_name') or ''}, {r.get('first_name') or ''}"),
+    'classes': ('classes', 'class_id', ['name'], [], lambda r: f"{r.get('name') or ''} ({r.get('term') or ''})"),
+}
+# Which fields' matches rank first (a name hit beats an email or allergy hit)
+FIELD_WEIGHT = {'last_name': 3, 'first_name': 3, 'name': 3}
+TRIGRAM_MIN = 3
+MIN_QUERY_LENGTH = 2  # a single character matches most of the index; type-ahead waits for two
+
+_PART_RE = re.compile(r'[\W_]+')
+
+DocKey = Tuple[str, str]
+
+
+def tokens(field: str, value) -> Set[str]:
+    """Searchable tokens of one field value: words, casefolded. Emails also keep the whole address
+    and phones are normalized with format_phone and also kept as a bare digit string."""
+    if value is None or value == '':
+        return set()
+    text = str(value)
+    if field == 'phone':
+        text = format_phone(text)
+        digits = NON_DIGIT_RE.sub('', text)
+        result = {digits} if digits else set()
+    else:
+        result = set()
+    text = text.casefold()
+    if field == 'email':
+        result.add(text.strip())
+    result.update(part for part in _PART_RE.split(text) if part)
+    return result
+
+
+def query_terms(query: str) -> List[str]:
+    return [part for part in _PART_RE.split((query or '').casefold()) if part]
+
+
+def trigrams(token: str) -> Set[str]:
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class _Postings:
+    """token -> {doc key: field weight}, a sorted token list for prefix ranges, and trigram -> tokens
+    for infix terms. New tokens are sorted in lazily, so a bulk sync doesn't pay an insort each."""
+
+    def __init__(self):
+        self.docs_by_token: Dict[str, Dict[DocKey, int]] = {}
+        self.tokens_by_trigram: Dict[str, Set[str]] = {}
+        self._sorted_tokens: List[str] = []
+        self._stale = False  # tokens added or removed since _sorted_tokens was built
+
+    def add(self, token: str, key: DocKey, weight: int) -> None:
+        docs = self.docs_by_token.get(token)
+        if docs is None:
+            docs = self.docs_by_token[token] = {}
+            self._stale = True
+            for gram in trigrams(token):
+                self.tokens_by_trigram.setdefault(gram, set()).add(token)
+        docs[key] = max(weight, docs.get(key, 0))
+
+    def discard(self, token: str, key: DocKey) -> None:
+        docs = self.docs_by_token.get(token)
+        if docs is None:
+            return
+        docs.pop(key, None)
+        if not docs:
+            del self.docs_by_token[token]
+            self._stale = True
+            for gram in trigrams(token):
+                grams = self.tokens_by_trigram.get(gram)
+                if grams is not None:
+                    grams.discard(token)
+                    if not grams:
+                        del self.tokens_by_trigram[gram]
+
+    def sorted_tokens(self) -> List[str]:
+        if self._stale:
+            self._sorted_tokens = sorted(self.docs_by_token)
+            self._stale = False
+        return self._sorted_tokens
+
+    def matching_tokens(self, term: str) -> Dict[str, int]:
+        """token -> match strength for one query term: 3 exact, 2 prefix, 1 infix (trigrams)."""
+        matches = {}
+        sorted_tokens = self.sorted_tokens()
+        for position in range(bisect_left(sorted_tokens, term), len(sorted_tokens)):
+            token = sorted_tokens[position]
+            if not token.startswith(term):
+                break
+            matches[token] = 3 if token == term else 2
+        if len(term) >= TRIGRAM_MIN:
+            grams = sorted((self.tokens_by_trigram.get(gram, set()) for gram in trigrams(term)), key=len)
+            candidates = set.intersection(*grams) if grams and grams[0] else set()
+            for token in candidates:
+                if token not in matches and term in token:
+                    matches[token] = 1
+        return matches
+
+
+def _term_strength(term: str, token: str) -> int:
+    if token == term:
+        return 3
+    if token.startswith(term):
+        return 2
+    return 1 if len(term) >= TRIGRAM_MIN and term in token else 0
+
+
+class _Doc:
+    __slots__ = ('entity', 'record_id', 'label', 'sort_label', 'fingerprint', 'fields')
+
+    def __init__(self, entity, record_id, label, fingerprint, fields):
+        self.entity = entity
+        self.record_id = record_id
+        self.label = label
+        self.sort_label = label.casefold()
+        self.fingerprint = fingerprint
+        self.fields = fields  # (token, staff_only) -> field it first came from
+
+    def best_match(self, term: str, include_private: bool) -> Tuple[int, str]:
+        best = (0, '')
+        for (token, staff_only), field in self.fields.items():
+            if staff_only and not include_private:
+                continue
+            score = _term_strength(term, token) * FIELD_WEIGHT.get(field, 1)
+            if score > best[0]:
+                best = (score, field)
+        return best
+
+
+class SearchIndex:
+    """In-memory prefix + trigram index over SEARCH_ENTITIES, updated a row at a time.
+
+    sync(entity, rows) diffs a full table against what is indexed and only re-tokenizes rows whose
+    indexed fields changed, so keeping it current after a write costs one table read and a few
+    postings updates. Staff-only fields are kept in separate postings and only searched when
+    search(..., include_private=True).
+    """
+
+    # Once this few candidates remain, later query terms are checked against each candidate's own
+    # tokens instead of expanding the term over the whole index.
+    VERIFY_THRESHOLD = 2000
+
+    def __init__(self):
+        self._docs: Dict[DocKey, _Doc] = {}
+        self._public = _Postings()
+        self._private = _Postings()
+        self._lock = threading.RLock()
+        self.synced: Dict[str, object] = {}  # entity -> data version it was last synced at
+
+    def _postings(self, staff_only: bool) -> _Postings:
+        return self._private if staff_only else self._public
+
+    def upsert(self, entity: str, row: dict) -> None:
+        table, id_column, public, private, label = SEARCH_ENTITIES[entity]
+        key = (entity, row[id_column])
+        fingerprint = tuple(row.get(field) for field in public + private) + (label(row),)
+        with self._lock:
+            existing = self._docs.get(key)
+            if existing is not None and existing.fingerprint == fingerprint:
+                return
+            self.remove(entity, row[id_column])
+            fields = {}
+            for staff_only, names in ((False, public), (True, private)):
+                for field in names:
+                    for token in tokens(field, row.get(field)):
+                        if (token, staff_only) not in fields:
+                            fields[(token, staff_only)] = field
+                            self._postings(staff_only).add(token, key, FIELD_WEIGHT.get(field, 1))
+            self._docs[key] = _Doc(entity, row[id_column], label(row), fingerprint, fields)
+
+    def remove(self, entity: str, record_id: str) -> None:
+        key = (entity, record_id)
+        with self._lock:
+            doc = self._docs.pop(key, None)
+            if doc is None:
+                return
+            for token, staff_only in doc.fields:
+                self._postings(staff_only).discard(token, key)
+
+    def sync(self, entity: str, rows: Iterable[dict], version=None) -> int:
+        """Make the index hold exactly these rows for the entity; returns how many docs changed."""
+        id_column = SEARCH_ENTITIES[entity][1]
+        changed = 0
+        with self._lock:
+            seen = set()
+            for row in rows:
+                seen.add(row[id_column])
+                before = self._docs.get((entity, row[id_column]))
+                self.upsert(entity, row)
+                changed += self._docs[(entity, row[id_column])] is not before
+            for key in [key for key in self._docs if key[0] == entity and key[1] not in seen]:
+                self.remove(*key)
+                changed += 1
+            self.synced[entity] = version
+        return changed
+
+    def _match_term(self, term: str, include_private: bool) -> Dict[DocKey, int]:
+        """doc key -> score of its best match for one term, over the whole index."""
+        result = {}
+        sources = [self._public] + ([self._private] if include_private else [])
+        for postings in sources:
+            for token, strength in postings.matching_tokens(term).items():
+                for key, weight in postings.docs_by_token[token].items():
+                    score = strength * weight
+                    if score > result.get(key, 0):
+                        result[key] = score
+        return result
+
+    def search(self, query: str, entities: Optional[Iterable[str]] = None, include_private: bool = False,
+               limit: int = 20) -> List[dict]:
+        """Docs matching every term of the query (as a prefix of, or for 3+ characters anywhere in,
+        one of their tokens), best matches first."""
+        terms = sorted(set(query_terms(query)), key=len, reverse=True)  # longest (most selective) first
+        if not terms or sum(len(term) for term in terms) < MIN_QUERY_LENGTH:
+            return []
+        wanted = set(entities) if entities else None
+        with self._lock:
+            scored = self._match_term(terms[0], include_private)
+            if wanted is not None:
+                scored = {key: score for key, score in scored.items() if key[0] in wanted}
+            for term in terms[1:]:
+                if not scored:
+                    break
+                if len(scored) <= self.VERIFY_THRESHOLD:
+                    narrowed = {}
+                    for key, score in scored.items():
+                        extra = self._docs[key].best_match(term, include_private)[0]
+                        if extra:
+                            narrowed[key] = score + extra
+                else:
+                    matches = self._match_term(term, include_private)
+                    narrowed = {key: score + matches[key] for key, score in scored.items() if key in matches}
+                scored = narrowed
+            # Scores are small integers: take whole score tiers from the top and only order by label
+            # within the tiers that reach the limit
+            tiers: Dict[int, List[DocKey]] = {}
+            for key, score in scored.items():
+                tiers.setdefault(score, []).append(key)
+            best = []
+            for score in sorted(tiers, reverse=True):
+                best.extend(heapq.nsmallest(limit - len(best), tiers[score], key=lambda key: self._docs[key].sort_label))
+                if len(best) >= limit:
+                    break
+            results = []
+            for key in best:
+                doc = self._docs[key]
+                matched = max((doc.best_match(term, include_private) for term in terms), key=lambda m: m[0])[1]
+                results.append({'type': doc.entity, 'id': doc.record_id, 'label': doc.label, 'matched': matched})
+            return results
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+
+if __name__ == '__main__':
+    # Latency benchmark: python search.py [records=50000]
+    import random
+    import sys
+    import uuid
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    rng = random.Random(1)
+    firsts = ['Anna', 'Ben', 'Caleb', 'Dana', 'Eli', 'Faith', 'Grace', 'Hannah', 'Isaac', 'Jonah', 'Levi', 'Mary']
+    lasts = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(4, 9))).title()
+             for _ in range(5000)]
+    allergies = [None, None, None, 'Peanuts', 'Tree nuts, shellfish', 'Gluten', 'Penicillin', 'Bee stings']
+    rows = [{'student_id': str(uuid.UUID(int=i)), 'first_name': rng.choice(firsts), 'last_name': rng.choice(lasts),
+             'grade_level': str(rng.randint(1, 12)), 'email': f"student{i}@example.com",
+             'phone': f"256{rng.randint(1000000, 9999999)}", 'allergies': rng.choice(allergies)}
+            for i in range(count)]
+    index = SearchIndex()
+    started = time.perf_counter()
+    index.sync('students', rows)
+    print(f"indexed {len(index)} students in {time.perf_counter() - started:.2f}s")
+    for query in ['gr', lasts[0][:3], f"{rows[7]['first_name']} {rows[7]['last_name'][:2]}", 'peanut',
+                  'nuts', '714', 'student4242@', 'zzzz']:
+        runs = 20
+        started = time.perf_counter()
+        for _ in range(runs):
+            results = index.search(query, include_private=True)
+        elapsed = (time.perf_counter() - started) / runs * 1000
+        print(f"  {query!r:24} {elapsed:7.2f} ms  {len(results)} results")
@@ -0,0 +1,394 @@
+import hashlib
+import json
+import logging
+import re
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from dedup import name_key
+from enrollment import WAITLIST_TABLE, SeatLocks, change_roster, is_missing_table
+from normalize import strip_bracket_code
+from schedule import DAY_NAMES, class_slots
+
+logger = logging.getLogger(__name__)
+
+SECTION_COLUMNS = ['class_id', 'name', 'term', 'max_size', 'days', 'schedule_block', 'section_code']
+# PostgREST / Postgres codes for a column that doesn't exist (sql/sections.sql not installed)
+MISSING_COLUMN_CODES = {'PGRST204', '42703'}
+# Day or block suffix that tells sections apart when there is no section_code: 'History (M)', 'Science B2'
+SECTION_SUFFIX_RE = re.compile(r'\s*(?:\((?:M|T|Tu|W|Th|F)\)|B\d)$', re.IGNORECASE)
+DEFAULT_CHUNK_SIZE = 500
+
+# Who is placed, in order: enrolled students keep a seat in the course whatever happens, then
+# students added from the preview form, then the course's waitlists in line order
+ENROLLED, REQUESTED, WAITLIST = 'enrolled', 'requested', 'waitlist'
+
+
+def is_missing_column(error: Exception) -> bool:
+    return getattr(error, 'code', None) in MISSING_COLUMN_CODES
+
+
+def load_section_classes(client) -> List[dict]:
+    """Every class with the columns the balancer needs (section_code None when it isn't installed)."""
+    try:
+        return client.table('classes').select(', '.join(SECTION_COLUMNS)).execute().data
+    except Exception as e:
+        if not is_missing_column(e):
+            raise
+        logger.warning("classes.section_code is not installed (sql/sections.sql); grouping sections by name")
+        columns = [column for column in SECTION_COLUMNS if column != 'section_code']
+        return [dict(row, section_code=None) for row in client.table('classes').select(', '.join(columns)).execute().data]
+
+
+def load_waitlists(client) -> List[dict]:
+    """class_waitlist rows in line order, or [] when sql/enrollment.sql isn't installed."""
+    try:
+        return client.table(WAITLIST_TABLE).select('class_id, student_id, program_type') \
+            .order('class_id').order('position').execute().data
+    except Exception as e:
+        if not is_missing_table(e):
+            raise
+        return []
+
+
+def course_key(cls: dict) -> Tuple[str, str]:
+    """(course, term) shared by the sections of one course: the section code when the class has one,
+    otherwise its name without the bracket code and day/block suffix ('1-2 History (M)' -> '1-2 History')."""
+    code = (cls.get('section_code') or '').strip()
+    if code:
+        return f"code:{code.casefold()}", cls.get('term') or ''
+    base = SECTION_SUFFIX_RE.sub('', strip_bracket_code(cls.get('name') or ''))
+    return f"name:{name_key(base)}", cls.get('term') or ''
+
+
+def course_id(key: Tuple[str, str]) -> str:
+    return f"{key[0]}|{key[1]}"
+
+
+def _course_label(sections: List[dict]) -> str:
+    base = SECTION_SUFFIX_RE.sub('', strip_bracket_code(sections[0].get('name') or ''))
+    code = (sections[0].get('section_code') or '').strip()
+    return f"{base} [{code}]" if code else base
+
+
+def _schedule(slots) -> str:
+    meetings = sorted({(day, block) for _, day, block in slots})
+    return ', '.join(f"{DAY_NAMES.get(day, f'Day {day}')[:3]} B{block}" for day, block in meetings) or 'Not scheduled'
+
+
+def _targets(sections: List[str], limits: Dict[str, int], weights: Dict[str, float], total: int) -> Dict[str, int]:
+    """Split total seats over the sections in proportion to their weights (largest remainder), never
+    past a section's limit; what a full section can't take goes to the others."""
+    targets = {class_id: 0 for class_id in sections}
+    remaining = min(total, sum(limits.values()))
+    open_sections = [class_id for class_id in sections if limits[class_id] > 0]
+    while remaining > 0 and open_sections:
+        weight = sum(weights[class_id] for class_id in open_sections)
+        shares = {class_id: remaining * weights[class_id] / weight for class_id in open_sections}
+        give = {class_id: min(int(shares[class_id]), limits[class_id] - targets[class_id]) for class_id in open_sections}
+        leftover = remaining - sum(give.values())
+        for class_id in sorted(open_sections, key=lambda c: (int(shares[c]) - shares[c], sections.index(c))):
+            if leftover <= 0:
+                break
+            if targets[class_id] + give[class_id] < limits[class_id]:
+                give[class_id] += 1
+                leftover -= 1
+        for class_id in open_sections:
+            targets[class_id] += give[class_id]
+        remaining -= sum(give.values())
+        open_sections = [class_id for class_id in open_sections if targets[class_id] < limits[class_id]]
+    return targets
+
+
+class _Course:
+    """Assignment state for one course: which section each movable student sits in, and the load of
+    every section counting students that don't move (in several sections of the course, or kept)."""
+
+    def __init__(self, sections: List[str], allowed: Dict[str, List[str]], weights: Dict[str, float],
+                 loads: Dict[str, int]):
+        self.sections = sections
+        self.allowed = allowed
+        self.weights = weights
+        self.loads = loads
+        self.seat: Dict[str, str] = {}
+        # Seated students per section, in seating order (dicts as ordered sets keep plans deterministic)
+        self.movers: Dict[str, Dict[str, None]] = {class_id: {} for class_id in sections}
+        # Per limits: sections a failed search could not get out of. Nothing seated later can open
+        # a path out of them (any such path would end in a section with room), so later searches
+        # skip them, which keeps a run of unplaceable students linear instead of quadratic.
+        self.closed: Dict[int, Set[str]] = defaultdict(set)
+
+    def put(self, student_id: str, class_id: str) -> None:
+        previous = self.seat.get(student_id)
+        if previous is not None:
+            del self.movers[previous][student_id]
+            self.loads[previous] -= 1
+        self.seat[student_id] = class_id
+        self.movers[class_id][student_id] = None
+        self.loads[class_id] += 1
+
+    def place(self, student_id: str, limits: Dict[str, int], current: Optional[str]) -> bool:
+        """Seat a student in the least-loaded fitting section under limits, shifting already seated
+        students along an augmenting path (breadth-first, so the fewest moves) when those are full."""
+        fitting = [class_id for class_id in self.allowed[student_id] if self.loads[class_id] < limits[class_id]]
+        if fitting:
+            self.put(student_id, min(fitting, key=lambda c: (self.loads[c] / self.weights[c], c != current,
+                                                             self.sections.index(c))))
+            return True
+        closed = self.closed[id(limits)]
+        if closed.issuperset(self.allowed[student_id]):
+            return False
+        parent: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        queue = deque()
+        for class_id in self.allowed[student_id]:
+            parent[class_id] = (None, None)
+            queue.append(class_id)
+        while queue:
+            class_id = queue.popleft()
+            if class_id in closed:
+                continue
+            for other in self.movers[class_id]:
+                for target in self.allowed[other]:
+                    if target in parent:
+                        continue
+                    parent[target] = (class_id, other)
+                    if self.loads[target] < limits[target]:
+                        while True:
+                            source, mover = parent[target]
+                            if source is None:
+                                self.put(student_id, target)
+                                return True
+                            self.put(mover, target)
+                            target = source
+                    queue.append(target)
+        closed.update(parent)
+        return False
+
+
+def course_sections(classes: Iterable[dict], course: Optional[str] = None) -> Dict[Tuple[str, str], List[dict]]:
+    """course_key -> its sections (sorted by name) for every course with more than one, or only `course`."""
+    groups: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+    for cls in classes:
+        groups[course_key(cls)].append(cls)
+    return {key: sorted(sections, key=lambda c: ((c.get('name') or '').casefold(), c['class_id']))
+            for key, sections in groups.items() if len(sections) > 1 and (course is None or course_id(key) == course)}
+
+
+def plan_sections(classes: Iterable[dict], class_students: Iterable[dict], students: Iterable[dict] = (),
+                  waitlists: Iterable[dict] = (), course: Optional[str] = None, additions: Iterable[str] = (),
+                  program_type: Optional[str] = None) -> dict:
+    """Balanced section assignments for every multi-section course (or only `course`, a course_id),
+    in the shape shown as the preview.
+
+    Sections of a course share course_key. Each course's students are spread over its sections in
+    proportion to max_size, never past it, and only into sections that don't clash with the
+    student's other classes; students stay in their current section where that is already balanced.
+    Students in more than one section of a course are left alone. Free seats then go to `additions`
+    (student_ids, only with `course`) and to the course's waitlisted students in line order. Courses
+    are planned one after another against the updated timetables, so moves can't clash across courses.
+    """
+    classes = list(classes)
+    slots = {cls['class_id']: class_slots(cls) for cls in classes}
+    groups = course_sections(classes, course)
+
+    rosters: Dict[str, Dict[str, Optional[str]]] = defaultdict(dict)  # class_id -> student_id -> program_type
+    student_classes: Dict[str, Set[str]] = defaultdict(set)
+    for row in class_students:
+        if row['class_id'] in slots:
+            rosters[row['class_id']][row['student_id']] = row.get('program_type')
+            student_classes[row['student_id']].add(row['class_id'])
+    waiting: Dict[str, List[Tuple[str, Optional[str]]]] = defaultdict(list)
+    for row in waitlists:
+        waiting[row['class_id']].append((row['student_id'], row.get('program_type')))
+    names = {s['student_id']: f"{s.get('last_name') or ''}, {s.get('first_name') or ''}" for s in students}
+
+    courses = []
+    for key in sorted(groups, key=lambda k: (_course_label(groups[k]).casefold(), k)):
+        courses.append(_plan_course(key, groups[key], slots, rosters, student_classes, waiting, names,
+                                    list(additions) if course is not None else [], program_type))
+    plan = {
+        'courses': courses,
+        'summary': {
+            'courses': len(courses),
+            'sections': sum(len(c['sections']) for c in courses),
+            'students': sum(sum(s['before'] for s in c['sections']) for c in courses),
+            'moves': sum(len(c['moves']) for c in courses),
+            'added': sum(len(c['added']) for c in courses),
+            'kept': sum(len(c['kept']) for c in courses),
+            'unplaced': sum(len(c['unplaced']) for c in courses),
+        },
+    }
+    plan['fingerprint'] = plan_fingerprint(plan)
+    return plan
+
+
+def _plan_course(key, sections: List[dict], slots, rosters, student_classes, waiting, names,
+                 additions: List[str], program_type: Optional[str]) -> dict:
+    section_ids = [cls['class_id'] for cls in sections]
+    in_course = set(section_ids)
+    by_id = {cls['class_id']: cls for cls in sections}
+
+    # Who is in the course now: one section -> movable, several -> left where they are
+    memberships: Dict[str, List[str]] = defaultdict(list)
+    for class_id in section_ids:
+        for student_id in rosters[class_id]:
+            memberships[student_id].append(class_id)
+    current: Dict[str, str] = {}
+    fixed: Dict[str, int] = defaultdict(int)
+    for student_id in sorted(memberships):
+        mine = memberships[student_id]
+        if len(mine) == 1:
+            current[student_id] = mine[0]
+        else:
+            for class_id in mine:
+                fixed[class_id] += 1
+    candidates: List[Tuple[str, str, Optional[str]]] = [(sid, ENROLLED, rosters[current[sid]][sid]) for sid in current]
+    seen = set(memberships)
+    unplaced = []
+    for student_id in additions:
+        if student_id in seen:
+            continue
+        seen.add(student_id)
+        if names and student_id not in names:
+            unplaced.append({'student_id': student_id, 'name': student_id, 'source': REQUESTED, 'reason': 'unknown student'})
+            continue
+        candidates.append((student_id, REQUESTED, program_type))
+    for class_id in section_ids:
+        for student_id, waiting_program in waiting.get(class_id, ()):
+            if student_id not in seen:
+                seen.add(student_id)
+                candidates.append((student_id, WAITLIST, waiting_program))
+
+    allowed = {}
+    for student_id, _, _ in candidates:
+        busy = set()
+        for class_id in student_classes.get(student_id, ()):
+            if class_id not in in_course:
+                busy |= slots[class_id]
+        allowed[student_id] = [class_id for class_id in section_ids if not slots[class_id] & busy]
+
+    capped = [by_id[c]['max_size'] for c in section_ids if by_id[c].get('max_size') is not None]
+    limits = {c: by_id[c]['max_size'] if by_id[c].get('max_size') is not None else len(candidates) + fixed[c]
+              for c in section_ids}
+    weights = {c: float(by_id[c].get('max_size') or max(capped or [1]) or 1) for c in section_ids}
+    rank = {sid: position for position, (sid, _, _) in enumerate(candidates)}
+    # Enrolled students that fit nowhere else keep their seat, whatever the caps
+    kept = []
+    for student_id, source, _ in candidates:
+        if source == ENROLLED and not allowed[student_id]:
+            fixed[current[student_id]] += 1
+            kept.append({'student_id': student_id, 'name': names.get(student_id, student_id),
+                         'class_id': current[student_id], 'section': by_id[current[student_id]].get('name'),
+                         'reason': 'conflicts with every section'})
+    movable = [c for c in candidates if allowed[c[0]]]
+    targets = _targets(section_ids, limits, weights, sum(fixed.values()) + len(movable))
+    state = _Course(section_ids, allowed, weights, {c: fixed[c] for c in section_ids})
+
+    # Most constrained first; the current section is kept while it is within its balanced share
+    enrolled = sorted((c for c in movable if c[1] == ENROLLED), key=lambda c: (len(allowed[c[0]]), rank[c[0]]))
+    for student_id, _, _ in enrolled:
+        if current[student_id] in allowed[student_id] and state.loads[current[student_id]] < targets[current[student_id]]:
+            state.put(student_id, current[student_id])
+    for student_id, source, _ in enrolled + [c for c in movable if c[1] != ENROLLED]:
+        if student_id in state.seat:
+            continue
+        if state.place(student_id, targets, current.get(student_id)) or state.place(student_id, limits, current.get(student_id)):
+            continue
+        if source == ENROLLED:
+            state.put(student_id, current[student_id])
+            kept.append({'student_id': student_id, 'name': names.get(student_id, student_id),
+                         'class_id': current[student_id], 'section': by_id[current[student_id]].get('name'),
+                         'reason': 'every section that fits is full'})
+        else:
+            unplaced.append({'student_id': student_id, 'name': names.get(student_id, student_id), 'source': source,
+                             'reason': 'every section that fits is full'})
+    for student_id, source, _ in candidates:
+        if source != ENROLLED and not allowed[student_id]:
+            unplaced.append({'student_id': student_id, 'name': names.get(student_id, student_id), 'source': source,
+                             'reason': 'conflicts with every section'})
+
+    before = {c: len(rosters[c]) for c in section_ids}
+    moves, added = [], []
+    programs = {sid: program for sid, _, program in candidates}
+    for student_id, source, _ in candidates:
+        target = state.seat.get(student_id)
+        if target is None or target == current.get(student_id):
+            continue
+        entry = {'student_id': student_id, 'name': names.get(student_id, student_id), 'to_class_id': target,
+                 'to': by_id[target].get('name'), 'program_type': programs[student_id]}
+        if source == ENROLLED:
+            source_class = current[student_id]
+            moves.append({**entry, 'from_class_id': source_class, 'from': by_id[source_class].get('name')})
+            del rosters[source_class][student_id]
+            student_classes[student_id].discard(source_class)
+        else:
+            added.append({**entry, 'source': source})
+        rosters[target][student_id] = programs[student_id]
+        student_classes[student_id].add(target)
+
+    return {
+        'course_id': course_id(key),
+        'course': _course_label(sections),
+        'term': key[1],
+        'sections': [{'class_id': c, 'name': by_id[c].get('name'), 'schedule': _schedule(slots[c]),
+                      'max_size': by_id[c].get('max_size'), 'before': before[c], 'after': len(rosters[c]),
+                      'target': targets[c]} for c in section_ids],
+        'moves': sorted(moves, key=lambda m: (m['name'].casefold(), m['student_id'])),
+        'added': added,
+        'kept': kept,
+        'unplaced': unplaced,
+    }
+
+
+def plan_fingerprint(plan: dict) -> str:
+    """Short hash of a plan, echoed back on apply so a preview that went stale is refused."""
+    return hashlib.sha1(json.dumps(plan['courses'], sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def _chunks(ids: List[str], size: int) -> Iterable[List[str]]:
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def apply_sections(client, plan: dict, locks: Optional[SeatLocks] = None,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> dict:
+    """Write a plan through enrollment.change_roster, one call per section that changes, so seats are
+    taken under the same capacity rules and locks as every other roster change.
+
+    Each call drops the section's leavers before seating its new students, so a section is never
+    over max_size, and leaves its waitlist alone: the plan already gave the free seats to waitlisted
+    students in line order. Waitlisted students who got a seat leave every waitlist of their course
+    first. A student the section can't take after all (its roster changed since the plan) joins its
+    waitlist and, if the old section's call hasn't run yet, keeps that seat.
+    Returns {moved, added, waitlisted, rosters: {class_id: [student_id]}}.
+    """
+    joining: Dict[str, List[dict]] = defaultdict(list)
+    leaving: Dict[str, List[str]] = defaultdict(list)
+    for course in plan['courses']:
+        from_waitlist = [entry['student_id'] for entry in course['added'] if entry['source'] == WAITLIST]
+        if from_waitlist:
+            section_ids = [section['class_id'] for section in course['sections']]
+            try:
+                for chunk in _chunks(from_waitlist, chunk_size):
+                    client.table(WAITLIST_TABLE).delete().in_('class_id', section_ids).in_('student_id', chunk).execute()
+            except Exception as e:
+                if not is_missing_table(e):
+                    raise
+        for entry in course['moves'] + course['added']:
+            joining[entry['to_class_id']].append({'student_id': entry['student_id'], 'program_type': entry['program_type']})
+        for move in course['moves']:
+            leaving[move['from_class_id']].append(move['student_id'])
+
+    seated, stuck, rosters = set(), set(), {}
+    for class_id in dict.fromkeys(list(joining) + list(leaving)):
+        removals = [student_id for student_id in leaving.get(class_id, ()) if student_id not in stuck]
+        result = change_roster(client, class_id, joining.get(class_id, []), removals=removals, locks=locks,
+                               promote=False, chunk_size=chunk_size)
+        seated.update(result['enrolled'])
+        stuck.update(entry['student_id'] for entry in result['waitlisted'])
+        stuck.update(result.get('rejected', ()))
+        rosters[class_id] = result['roster']
+    if stuck:
+        logger.warning(f"Section plan: {len(stuck)} students could not take their planned seat and were waitlisted")
+    moved = {student_id for student_ids in leaving.values() for student_id in student_ids} & seated
+    return {'moved': len(moved), 'added': len(seated - moved), 'waitlisted': len(stuck), 'rosters': rosters}
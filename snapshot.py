@@ -0,0 +1,187 @@
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional
+
+from enrollment import is_missing_table
+
+logger = logging.getLogger(__name__)
+
+# Tables in foreign key order with the column order of the backups/*_rows.csv files
+SNAPSHOT_TABLES: Dict[str, List[str]] = {
+    'teachers': ['teacher_id', 'first_name', 'last_name', 'email', 'phone'],
+    'classrooms': ['classroom_id', 'building_number', 'room_number'],
+    'parents': ['parent_id', 'first_name', 'last_name', 'phone', 'created_at', 'email', 'is_staff'],
+    'students': ['student_id', 'first_name', 'last_name', 'grade_level', 'medicines', 'allergies',
+                 'medical_conditions', 'comments', 'email', 'phone'],
+    'classes': ['class_id', 'name', 'days', 'teacher_id', 'grade_level', 'max_size', 'term',
+                'schedule_block', 'classroom_id'],
+    'users': ['user_id', 'email', 'password_hash', 'role', 'parent_id', 'created_at'],
+    'student_parents': ['student_id', 'parent_id'],
+    'class_students': ['class_id', 'student_id', 'program_type'],
+    'class_waitlist': ['class_id', 'student_id', 'program_type', 'position', 'created_at'],
+}
+# Key columns: stable paging order and upsert conflict target
+TABLE_KEYS: Dict[str, List[str]] = {
+    'teachers': ['teacher_id'],
+    'classrooms': ['classroom_id'],
+    'parents': ['parent_id'],
+    'students': ['student_id'],
+    'classes': ['class_id'],
+    'users': ['user_id'],
+    'student_parents': ['student_id', 'parent_id'],
+    'class_students': ['class_id', 'student_id'],
+    'class_waitlist': ['class_id', 'student_id'],
+}
+# Paging order where key order isn't enough: the waitlist is written (and restored) in line order
+TABLE_ORDER: Dict[str, List[str]] = {
+    'class_waitlist': ['position'],
+}
+# Tables that only exist once an optional sql/ script is installed; skipped when missing
+OPTIONAL_TABLES = {'class_waitlist'}
+# Postgres array columns, written as JSON ('[1,4]', '["6","7"]') like the dashboard export
+ARRAY_COLUMNS: Dict[str, List[str]] = {
+    'classes': ['days', 'grade_level', 'schedule_block'],
+}
+
+DEFAULT_PAGE_SIZE = 1000  # PostgREST's default max rows per request
+MANIFEST_FILE = 'manifest.json'
+
+
+def format_cell(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, separators=(',', ':'))
+    return str(value)
+
+
+def iter_table_rows(client, table: str, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[dict]:
+    """Every row of a table, read page by page with range() in key order."""
+    columns = ', '.join(SNAPSHOT_TABLES[table])
+    start = 0
+    while True:
+        query = client.table(table).select(columns)
+        for key in TABLE_ORDER.get(table, TABLE_KEYS[table]):
+            query = query.order(key)
+        page = query.range(start, start + page_size - 1).execute().data
+        yield from page
+        if len(page) < page_size:
+            return
+        start += page_size
+
+
+def csv_line(cells: List[str]) -> str:
+    """One CSV record quoted the way the dashboard export does: minimal quoting, plus any cell
+    with leading/trailing whitespace (so 'David ' and ' (256) 714-1891' survive a round trip)."""
+    out = []
+    for cell in cells:
+        if any(ch in cell for ch in ',"\n\r') or cell != cell.strip():
+            cell = '"' + cell.replace('"', '""') + '"'
+        out.append(cell)
+    return ','.join(out) + '\n'
+
+
+def _csv_chunks(client, table: str, page_size: int) -> Iterator[tuple]:
+    """(csv text, rows in it) per page of rows; the header comes with the first chunk."""
+    columns = SNAPSHOT_TABLES[table]
+    buffer = io.StringIO()
+    buffer.write(csv_line(columns))
+    pending = 0
+    for row in iter_table_rows(client, table, page_size):
+        buffer.write(csv_line([format_cell(row.get(column)) for column in columns]))
+        pending += 1
+        if pending == page_size:
+            yield buffer.getvalue(), pending
+            buffer.seek(0)
+            buffer.truncate()
+            pending = 0
+    yield buffer.getvalue(), pending
+
+
+def iter_table_csv(client, table: str, page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[str]:
+    """CSV text for a table (header first), one chunk per page of rows."""
+    for text, _ in _csv_chunks(client, table, page_size):
+        yield text
+
+
+def snapshot_file(table: str, compress: bool) -> str:
+    return f"{table}_rows.csv{'.gz' if compress else ''}"
+
+
+def write_snapshot(client, directory: str, compress: bool = False, page_size: int = DEFAULT_PAGE_SIZE,
+                   tables: Optional[List[str]] = None) -> dict:
+    """Stream every table to <directory>/<table>_rows.csv[.gz] and write manifest.json.
+
+    Memory use is bounded by one page per table. The manifest records row counts and the
+    sha256 of each table's uncompressed CSV text.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'compressed': compress,
+        'tables': {},
+    }
+    for table in tables or SNAPSHOT_TABLES:
+        path = os.path.join(directory, snapshot_file(table, compress))
+        digest = hashlib.sha256()
+        rows = 0
+        opener = gzip.open if compress else open
+        try:
+            with opener(path, 'wt', encoding='utf-8', newline='') as f:
+                for text, count in _csv_chunks(client, table, page_size):
+                    digest.update(text.encode('utf-8'))
+                    rows += count
+                    f.write(text)
+        except Exception as e:
+            if table not in OPTIONAL_TABLES or not is_missing_table(e):
+                raise
+            os.remove(path)
+            logger.info(f"Snapshot {table}: table not installed, skipping")
+            continue
+        manifest['tables'][table] = {
+            'file': snapshot_file(table, compress),
+            'rows': rows,
+            'sha256': digest.hexdigest(),
+            'columns': SNAPSHOT_TABLES[table],
+        }
+        logger.info(f"Snapshot {table}: {rows} rows -> {path}")
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def default_snapshot_dir(root: str = 'backups') -> str:
+    """backups/snapshots/<timestamp>, suffixed if a snapshot was already taken this second."""
+    base = os.path.join(root, 'snapshots', datetime.now().strftime('%Y%m%d-%H%M%S'))
+    path, suffix = base, 1
+    while os.path.exists(path):
+        suffix += 1
+        path = f"{base}-{suffix}"
+    return path
+
+
+if __name__ == '__main__':
+    # Nightly snapshot: python snapshot.py [--gzip] [--out backups/snapshots/20250601-020000]
+    from dotenv import load_dotenv
+    from supabase import create_client
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Snapshot every table to backups/-style CSV files.')
+    parser.add_argument('--out', default=None, help='output directory (default backups/snapshots/<timestamp>)')
+    parser.add_argument('--gzip', action='store_true', help='write .csv.gz files')
+    parser.add_argument('--page-size', type=int, default=DEFAULT_PAGE_SIZE)
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = create_client(os.getenv('SUPABASE_URL'), os.getenv('SUPABASE_KEY'))
+    out = args.out or default_snapshot_dir()
+    result = write_snapshot(client, out, compress=args.gzip, page_size=args.page_size)
+    print(f"Snapshot written to {out}: " + ', '.join(f"{t} {m['rows']}" for t, m in result['tables'].items()))
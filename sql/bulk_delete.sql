@@ -0,0 +1,42 @@
+-- Cascading bulk delete used by cascade.bulk_delete (app: /delete_selected/<entity> and the
+-- single-row delete routes). Runs in one transaction, so a failure leaves nothing half deleted.
+-- Install: paste into the Supabase SQL editor, or psql "$DATABASE_URL" -f sql/bulk_delete.sql
+-- Without it the app falls back to the same deletes issued as in_() filtered requests.
+
+create or replace function public.bulk_delete(entity text, ids uuid[])
+returns integer
+language plpgsql
+as $$
+declare
+    deleted integer;
+    -- sql/enrollment.sql (waitlist + promote trigger) is optional
+    has_waitlist boolean := to_regclass('public.class_waitlist') is not null;
+begin
+    -- Waitlist rows go before class_students: the promote trigger on class_students would
+    -- otherwise seat a waitlisted student (or fill a class) that is about to be deleted
+    if entity = 'students' then
+        delete from public.student_parents where student_id = any(ids);
+        if has_waitlist then
+            delete from public.class_waitlist where student_id = any(ids);
+        end if;
+        delete from public.class_students where student_id = any(ids);
+        delete from public.students where student_id = any(ids);
+    elsif entity = 'parents' then
+        delete from public.student_parents where parent_id = any(ids);
+        update public.users set parent_id = null where parent_id = any(ids);
+        delete from public.parents where parent_id = any(ids);
+    elsif entity = 'classes' then
+        if has_waitlist then
+            delete from public.class_waitlist where class_id = any(ids);
+        end if;
+        delete from public.class_students where class_id = any(ids);
+        delete from public.classes where class_id = any(ids);
+    else
+        raise exception 'bulk_delete: unsupported entity %', entity;
+    end if;
+    get diagnostics deleted = row_count;
+    return deleted;
+end;
+$$;
+
+grant execute on function public.bulk_delete(text, uuid[]) to authenticated, service_role;
@@ -0,0 +1,224 @@
+-- Capacity-enforced enrollment used by enrollment.change_roster (app: /assign_students_to_class,
+-- /classes/<class_id>/enroll and /classes/<class_id>/withdraw).
+--   * class_seats holds one enrolled-seat counter per class, kept by a trigger on class_students,
+--     so a capacity check reads one row instead of counting the roster
+--   * class_waitlist is the ordered overflow; position only ever grows, so order is join order
+--   * change_roster locks the class row, so concurrent submissions for the same class run one
+--     after another and can never oversubscribe it; other classes are not blocked
+--   * a seat freed anywhere else (student deleted, bulk delete) promotes from the waitlist
+--   * promotion passes over waitlisted students who are booked elsewhere at the class's time
+-- Install: paste into the Supabase SQL editor, or psql "$DATABASE_URL" -f sql/enrollment.sql
+-- Without change_roster the app runs the same plan itself under a per-class lock that only
+-- serializes the workers of one host; the waitlist needs class_waitlist either way.
+
+create table if not exists public.class_waitlist (
+    class_id uuid not null references public.classes(class_id) on delete cascade,
+    student_id uuid not null references public.students(student_id) on delete cascade,
+    program_type text,
+    position bigint generated always as identity,
+    created_at timestamptz not null default now(),
+    primary key (class_id, student_id)
+);
+create index if not exists class_waitlist_order on public.class_waitlist (class_id, position);
+
+create table if not exists public.class_seats (
+    class_id uuid primary key references public.classes(class_id) on delete cascade,
+    enrolled integer not null default 0
+);
+
+create or replace function public.class_seats_count()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op in ('INSERT', 'UPDATE') then
+        insert into public.class_seats (class_id, enrolled) values (new.class_id, 1)
+        on conflict (class_id) do update set enrolled = public.class_seats.enrolled + 1;
+    end if;
+    if tg_op in ('DELETE', 'UPDATE') then
+        update public.class_seats set enrolled = enrolled - 1 where class_id = old.class_id;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists class_students_seats on public.class_students;
+create trigger class_students_seats
+    after insert or delete or update of class_id on public.class_students
+    for each row execute function public.class_seats_count();
+
+-- Backfill (and repair) the counters from the current rosters
+insert into public.class_seats (class_id, enrolled)
+select c.class_id, count(cs.student_id)
+from public.classes c
+left join public.class_students cs on cs.class_id = c.class_id
+group by c.class_id
+on conflict (class_id) do update set enrolled = excluded.enrolled;
+
+-- Whether a student is enrolled in another class meeting at the same time as target_class. Same
+-- rule as schedule.class_slots: a class meets on every (day, block) of its days x schedule_block,
+-- in its semester ('Semester 1' / 'Semester 2', anything else both)
+create or replace function public.schedule_clash(target_class uuid, student uuid)
+returns boolean
+language sql
+stable
+as $$
+    select exists (
+        select 1
+        from public.classes t
+        join public.class_students cs on cs.student_id = student and cs.class_id <> t.class_id
+        join public.classes o on o.class_id = cs.class_id
+        where t.class_id = target_class
+          and o.days && t.days
+          and o.schedule_block && t.schedule_block
+          and (o.term = t.term or o.term is null or t.term is null
+               or o.term not in ('Semester 1', 'Semester 2') or t.term not in ('Semester 1', 'Semester 2'))
+    );
+$$;
+
+-- Fill free seats of one class from its waitlist in order; returns the promoted student_ids.
+-- Students booked elsewhere at the class's time are passed over and keep their place in line
+create or replace function public.promote_waitlist(target_class uuid)
+returns uuid[]
+language plpgsql
+as $$
+declare
+    capacity integer;
+    taken integer;
+    waiting record;
+    promoted uuid[] := '{}';
+begin
+    select max_size into capacity from public.classes where class_id = target_class for update;
+    if not found then
+        return promoted;
+    end if;
+    select coalesce((select enrolled from public.class_seats where class_id = target_class), 0) into taken;
+    for waiting in
+        select w.student_id, w.program_type from public.class_waitlist w
+        where w.class_id = target_class order by w.position
+    loop
+        exit when capacity is not null and taken >= capacity;
+        continue when public.schedule_clash(target_class, waiting.student_id);
+        insert into public.class_students (class_id, student_id, program_type)
+        values (target_class, waiting.student_id, waiting.program_type)
+        on conflict do nothing;
+        delete from public.class_waitlist where class_id = target_class and student_id = waiting.student_id;
+        taken := taken + 1;
+        promoted := promoted || waiting.student_id;
+    end loop;
+    return promoted;
+end;
+$$;
+
+create or replace function public.class_students_promote()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- change_roster promotes itself, in the right order relative to its own inserts
+    if current_setting('school.roster_change', true) = 'on' then
+        return null;
+    end if;
+    perform public.promote_waitlist(freed.class_id)
+    from (select distinct class_id from old_rows) freed;
+    return null;
+end;
+$$;
+
+drop trigger if exists class_students_promote on public.class_students;
+create trigger class_students_promote
+    after delete on public.class_students
+    referencing old table as old_rows
+    for each statement execute function public.class_students_promote();
+
+-- One roster change for one class: drop `removals` (from the roster and the waitlist), with
+-- replace also drop enrolled students not in `entries`; update program types; promote waitlisted
+-- students into free seats (unless promote is off); then seat each new entry
+-- ([{student_id, program_type}], in order) while seats last and waitlist the rest. Same rules as
+-- enrollment.plan_roster_change.
+drop function if exists public.change_roster(uuid, jsonb, uuid[], boolean);
+create or replace function public.change_roster(target_class uuid, entries jsonb, removals uuid[] default '{}',
+                                                replace boolean default false, promote boolean default true)
+returns jsonb
+language plpgsql
+as $$
+declare
+    capacity integer;
+    taken integer;
+    wanted uuid[];
+    entry record;
+    removed_ids uuid[];
+    promoted_ids uuid[];
+    seated_ids uuid[] := '{}';
+    waitlisted_ids uuid[] := '{}';
+begin
+    perform set_config('school.roster_change', 'on', true);
+    select max_size into capacity from public.classes where class_id = target_class for update;
+    if not found then
+        raise exception 'Class % not found', target_class;
+    end if;
+    select coalesce(array_agg((e.item->>'student_id')::uuid), '{}') into wanted
+    from jsonb_array_elements(entries) as e(item);
+
+    with gone as (
+        delete from public.class_students cs
+        where cs.class_id = target_class
+          and (cs.student_id = any(removals) or (replace and not cs.student_id = any(wanted)))
+        returning cs.student_id
+    )
+    select coalesce(array_agg(student_id), '{}') into removed_ids from gone;
+    delete from public.class_waitlist where class_id = target_class and student_id = any(removals);
+
+    update public.class_students cs set program_type = e.item->>'program_type'
+    from jsonb_array_elements(entries) as e(item)
+    where cs.class_id = target_class and cs.student_id = (e.item->>'student_id')::uuid
+      and cs.program_type is distinct from e.item->>'program_type';
+
+    -- Students already waiting were first in line for any seat that is free now
+    promoted_ids := case when promote then public.promote_waitlist(target_class) else '{}' end;
+    select coalesce((select enrolled from public.class_seats where class_id = target_class), 0) into taken;
+
+    for entry in
+        select (e.item->>'student_id')::uuid as student_id, e.item->>'program_type' as program_type
+        from jsonb_array_elements(entries) with ordinality as e(item, ord)
+        order by e.ord
+    loop
+        continue when exists (select 1 from public.class_students
+                              where class_id = target_class and student_id = entry.student_id);
+        if capacity is null or taken < capacity then
+            insert into public.class_students (class_id, student_id, program_type)
+            values (target_class, entry.student_id, entry.program_type);
+            delete from public.class_waitlist where class_id = target_class and student_id = entry.student_id;
+            taken := taken + 1;
+            seated_ids := seated_ids || entry.student_id;
+        else
+            insert into public.class_waitlist (class_id, student_id, program_type)
+            values (target_class, entry.student_id, entry.program_type)
+            on conflict (class_id, student_id) do nothing;
+            waitlisted_ids := waitlisted_ids || entry.student_id;
+        end if;
+    end loop;
+
+    perform set_config('school.roster_change', 'off', true);
+    return jsonb_build_object(
+        'enrolled', to_jsonb(seated_ids),
+        'promoted', to_jsonb(promoted_ids),
+        'removed', to_jsonb(removed_ids),
+        'waitlisted', coalesce((
+            select jsonb_agg(jsonb_build_object('student_id', ranked.student_id, 'position', ranked.place)
+                             order by ranked.place)
+            from (select w.student_id, row_number() over (order by w.position) as place
+                  from public.class_waitlist w where w.class_id = target_class) ranked
+            where ranked.student_id = any(waitlisted_ids)), '[]'::jsonb),
+        'roster', coalesce((select jsonb_agg(cs.student_id) from public.class_students cs
+                            where cs.class_id = target_class), '[]'::jsonb),
+        'seats_left', case when capacity is null then null else capacity - taken end
+    );
+end;
+$$;
+
+grant execute on function public.change_roster(uuid, jsonb, uuid[], boolean, boolean) to authenticated, service_role;
+grant execute on function public.promote_waitlist(uuid) to authenticated, service_role;
+grant execute on function public.schedule_clash(uuid, uuid) to authenticated, service_role;
+grant select, insert, delete on public.class_waitlist to authenticated, service_role;
+grant select on public.class_seats to authenticated, service_role;
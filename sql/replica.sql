@@ -0,0 +1,31 @@
+-- Change detection for the local read replica (replica.ReadReplica, enabled with READ_REPLICA_PATH).
+-- One call returns a row count and an md5 over every row of each requested table, so a worker can
+-- tell whether its copy is still current without downloading the table; only tables whose
+-- fingerprint moved are pulled again. The hashing reads the tables inside the database (no
+-- transfer), which for this school's table sizes is a few milliseconds per call.
+-- Install: paste into the Supabase SQL editor, or psql "$DATABASE_URL" -f sql/replica.sql
+-- Without it the replica re-pulls only the tables the app itself wrote, plus a full pull every
+-- READ_REPLICA_FULL_REFRESH seconds to pick up changes made outside the app.
+
+create or replace function public.replica_fingerprints(tables text[])
+returns table (table_name text, row_count bigint, checksum text)
+language plpgsql
+stable
+as $$
+declare
+    target text;
+begin
+    foreach target in array tables loop
+        if target not in ('parents', 'students', 'classes', 'student_parents', 'class_students') then
+            raise exception 'Table % is not replicated', target;
+        end if;
+        table_name := target;
+        execute format('select count(*), md5(coalesce(string_agg(t::text, '','' order by t::text), '''')) from public.%I t',
+                       target)
+            into row_count, checksum;
+        return next;
+    end loop;
+end;
+$$;
+
+grant execute on function public.replica_fingerprints(text[]) to authenticated, service_role;
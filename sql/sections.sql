@@ -0,0 +1,10 @@
+-- Section codes for multi-section courses, used by sections.plan_sections (app: /admin/sections).
+-- VLA class names carry the course code in brackets, e.g. '1-2 History (M) [1-2His]' and
+-- '1-2 History (W) [1-2His]'; import_classes strips it from the name and keeps it here, so the
+-- section balancer can tell which classes are interchangeable sections of one course.
+-- Install: paste into the Supabase SQL editor, or psql "$DATABASE_URL" -f sql/sections.sql
+-- Without the column the balancer groups sections by name instead ('1-2 History (M)' and
+-- '1-2 History (W)' -> '1-2 History'), which is also what happens for classes imported before it.
+
+alter table public.classes add column if not exists section_code text;
+create index if not exists classes_section_code on public.classes (section_code) where section_code is not null;
@@ -0,0 +1,70 @@
+-- Per-student tuition ledger computed in the database, used by /tuition and /api/tuition.
+-- Same rules as pricing.compute_tuition_ledger (and pricing.TUITION_LEDGER_SQLITE):
+--   * each enrollment costs the daily price for the student's grade and program_type times the
+--     number of class days; grades outside K-12 are priced as grade 12
+--   * a student with any priced academic enrollment pays the academic fee once
+--   * students are grouped by their first parent (lowest parent_id); within a family the lowest
+--     student_id pays full price and the others get the sibling discount
+-- Prices come from the pricing workbook, so the app passes them in: PricingTable.to_dict()['prices'],
+-- i.e. {"K": {"morning": 20.0, ...}, "1": {...}, ...}.
+-- Install: paste into the Supabase SQL editor, or psql "$DATABASE_URL" -f sql/tuition_ledger.sql
+
+-- Rows are limited to for_parent's students unless all_students is true (admins); a null
+-- for_parent without all_students returns nothing, so an orphaned parent login sees no one.
+
+-- Earlier versions returned every student when for_parent was null
+drop function if exists public.tuition_ledger(jsonb, numeric, numeric, uuid);
+
+create or replace function public.tuition_ledger(prices jsonb, academic_fee numeric, sibling_rate numeric,
+                                                 for_parent uuid default null, all_students boolean default false)
+returns table (student_id uuid, student_name text, grade text, parent_id uuid,
+               base_amount numeric, amount numeric)
+language sql
+stable
+as $$
+    with lines as (
+        select cs.student_id,
+               (prices -> (case when s.grade_level in ('K', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12')
+                                then s.grade_level else '12' end)
+                       ->> lower(cs.program_type))::numeric as daily,
+               coalesce(cardinality(c.days), 0) as num_days,
+               lower(cs.program_type) as program_type
+        from public.class_students cs
+        join public.classes c on c.class_id = cs.class_id
+        join public.students s on s.student_id = cs.student_id
+    ),
+    per_student as (
+        select l.student_id,
+               sum(case when l.daily is not null and l.num_days > 0 then l.daily * l.num_days else 0 end) as line_total,
+               bool_or(l.daily is not null and l.num_days > 0 and l.program_type = 'academic') as has_academic
+        from lines l
+        group by l.student_id
+    ),
+    first_parent as (
+        select sp.student_id, min(sp.parent_id::text)::uuid as parent_id
+        from public.student_parents sp
+        group by sp.student_id
+    ),
+    ledger as (
+        select s.student_id,
+               coalesce(s.last_name, '') || ', ' || coalesce(s.first_name, '') as student_name,
+               s.grade_level as grade,
+               fp.parent_id,
+               coalesce(p.line_total, 0) + case when p.has_academic then academic_fee else 0 end as base_amount
+        from public.students s
+        left join per_student p on p.student_id = s.student_id
+        left join first_parent fp on fp.student_id = s.student_id
+    ),
+    ranked as (
+        select l.*, row_number() over (partition by l.parent_id order by l.student_id) as sibling_rank
+        from ledger l
+    )
+    select r.student_id, r.student_name, r.grade, r.parent_id, r.base_amount,
+           case when r.sibling_rank > 1 then r.base_amount * (1 - sibling_rate) else r.base_amount end as amount
+    from ranked r
+    where all_students
+       or r.student_id in (select sp.student_id from public.student_parents sp where sp.parent_id = for_parent)
+    order by r.student_id;
+$$;
+
+grant execute on function public.tuition_ledger(jsonb, numeric, numeric, uuid, boolean) to authenticated, service_role;
@@ -0,0 +1,53 @@
+"""Per-row cost of each normalizer: the baseline copy (tests/test_normalize.py), the memoized scalar
+cold and warm, and the column variant, on the repo's CSVs repeated 50 times.
+
+    python tests/bench_normalize.py
+"""
+import sys
+import timeit
+from pathlib import Path
+
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import normalize  # noqa: E402
+from test_normalize import PAIRS, csv_column  # noqa: E402
+
+CASES = [
+    ('clean_string', csv_column('VLA_classes.csv', 'Class Name'), normalize.clean_string_series),
+    ('format_phone', csv_column('parents.csv', 'Phone'), normalize.format_phone_series),
+    ('normalize_grade', csv_column('VLA_students_bak.csv', 'Grade'), normalize.normalize_grade_series),
+    ('normalize_grade_level', csv_column('VLA_classes.csv', 'Grade Level'), normalize.normalize_grade_level_series),
+    ('normalize_term', csv_column('VLA_classes.csv', 'Term'), normalize.normalize_term_series),
+    ('parse_schedule', csv_column('VLA_classes.csv', 'Schedule'), normalize.parse_schedule_series),
+    ('parse_teacher_name', csv_column('VLA_classes.csv', 'Teacher'), normalize.parse_teacher_name_series),
+    ('parse_student_count_max', csv_column('VLA_classes.csv', 'Student Count/Max'),
+     normalize.parse_student_count_max_series),
+    ('parse_student_name', csv_column('VLA_students_bak.csv', 'StudentName'), normalize.parse_student_name_series),
+]
+
+
+def clear_caches():
+    for name in dir(normalize):
+        cached = getattr(normalize, name)
+        if hasattr(cached, 'cache_clear'):
+            cached.cache_clear()
+
+
+if __name__ == '__main__':
+    for name, values, vectorized in CASES:
+        column = pd.Series(values * 50, dtype=object)
+        scalar = getattr(normalize, name)
+        per_row = 1e6 / len(column)
+        baseline = PAIRS.get(name, (None,))[0]
+        base = timeit.timeit(lambda: [baseline(v) for v in column], number=1) if baseline else None
+        clear_caches()
+        cold = timeit.timeit(lambda: [scalar(v) for v in column], number=1)
+        warm = timeit.timeit(lambda: [scalar(v) for v in column], number=5) / 5
+        clear_caches()
+        column_time = timeit.timeit(lambda: vectorized(column), number=5) / 5
+        base_text = f"{base * per_row:6.2f}us" if base is not None else '    n/a '
+        print(f"{name:25} rows={len(column):6} baseline={base_text} scalar cold={cold * per_row:6.2f}us "
+              f"warm={warm * per_row:6.2f}us column={column_time * per_row:6.2f}us per row")
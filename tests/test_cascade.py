@@ -0,0 +1,190 @@
+"""cascade.bulk_delete's client-side path (bulk_delete database function not installed) against an
+in-memory database that enforces the foreign keys the real schema has and runs the waitlist promote
+trigger from sql/enrollment.sql."""
+from typing import Dict, List
+
+import pytest
+
+from cascade import CASCADE_DELETES, bulk_delete
+from db_functions import MISSING_FUNCTION_CODE
+
+# (child table, column) -> parent table; ON DELETE NO ACTION, as in Supabase
+FOREIGN_KEYS = {
+    ('student_parents', 'student_id'): 'students',
+    ('student_parents', 'parent_id'): 'parents',
+    ('class_students', 'student_id'): 'students',
+    ('class_students', 'class_id'): 'classes',
+    ('users', 'parent_id'): 'parents',
+}
+# ON DELETE CASCADE (class_waitlist in sql/enrollment.sql)
+CASCADING_KEYS = {
+    ('class_waitlist', 'student_id'): 'students',
+    ('class_waitlist', 'class_id'): 'classes',
+}
+PRIMARY_KEYS = {'students': 'student_id', 'parents': 'parent_id', 'classes': 'class_id'}
+
+
+class ForeignKeyViolation(Exception):
+    code = '23503'
+
+
+class MissingFunction(Exception):
+    code = MISSING_FUNCTION_CODE
+
+
+class MissingTable(Exception):
+    code = 'PGRST205'
+
+
+def promote_waitlist(db, class_id):
+    """public.promote_waitlist without the schedule check: seat waitlisted students in line order."""
+    capacity = next(row['max_size'] for row in db['classes'] if row['class_id'] == class_id)
+    waiting = sorted((row for row in db['class_waitlist'] if row['class_id'] == class_id), key=lambda row: row['position'])
+    for row in waiting:
+        if sum(seat['class_id'] == class_id for seat in db['class_students']) >= capacity:
+            return
+        db['class_students'].append({'class_id': class_id, 'student_id': row['student_id']})
+        db['class_waitlist'].remove(row)
+
+
+class Query:
+    def __init__(self, db: Dict[str, List[dict]], table: str):
+        self.db, self.table, self.filters = db, table, []
+        self.op, self.values = None, None
+
+    def delete(self):
+        self.op = 'delete'
+        return self
+
+    def update(self, values):
+        self.op, self.values = 'update', values
+        return self
+
+    def in_(self, column, values):
+        values = set(values)
+        self.filters.append(lambda row: row.get(column) in values)
+        return self
+
+    def execute(self):
+        if self.table not in self.db:
+            raise MissingTable(self.table)
+        rows = self.db[self.table]
+        matched = [row for row in rows if all(f(row) for f in self.filters)]
+        if self.op == 'update':
+            for row in matched:
+                row.update(self.values)
+            return self
+        key = PRIMARY_KEYS.get(self.table)
+        gone = {row[key] for row in matched} if key else set()
+        for (child, column), parent in FOREIGN_KEYS.items():
+            if parent == self.table and any(row.get(column) in gone for row in self.db[child]):
+                raise ForeignKeyViolation(f"{child}.{column} still references {self.table}")
+        self.db[self.table] = [row for row in rows if row not in matched]
+        for (child, column), parent in CASCADING_KEYS.items():
+            if parent == self.table and child in self.db:
+                self.db[child] = [row for row in self.db[child] if row[column] not in gone]
+        if self.table == 'class_students' and 'class_waitlist' in self.db:
+            # class_students_promote: after delete, for each statement
+            for class_id in sorted({row['class_id'] for row in matched}):
+                promote_waitlist(self.db, class_id)
+        return self
+
+
+class FakeClient:
+    def __init__(self, db):
+        self.db = db
+
+    def table(self, name):
+        return Query(self.db, name)
+
+    def rpc(self, name, params):
+        raise MissingFunction(name)
+
+
+@pytest.fixture
+def db():
+    return {
+        'students': [{'student_id': s} for s in ('s1', 's2', 's3')],
+        'parents': [{'parent_id': p} for p in ('p1', 'p2')],
+        'classes': [{'class_id': 'c1', 'max_size': 2}, {'class_id': 'c2', 'max_size': 1}],
+        'student_parents': [
+            {'student_id': 's1', 'parent_id': 'p1'},
+            {'student_id': 's2', 'parent_id': 'p1'},
+            {'student_id': 's3', 'parent_id': 'p2'},
+        ],
+        'class_students': [
+            {'class_id': 'c1', 'student_id': 's1'},
+            {'class_id': 'c2', 'student_id': 's1'},
+            {'class_id': 'c1', 'student_id': 's3'},
+        ],
+        # c1 and c2 are full; s2 waits for c1, then s3 for c2
+        'class_waitlist': [
+            {'class_id': 'c1', 'student_id': 's2', 'position': 1},
+            {'class_id': 'c2', 'student_id': 's3', 'position': 2},
+        ],
+        'users': [
+            {'user_id': 'u1', 'role': 'parent', 'parent_id': 'p1'},
+            {'user_id': 'u2', 'role': 'parent', 'parent_id': 'p2'},
+            {'user_id': 'u3', 'role': 'admin', 'parent_id': None},
+        ],
+    }
+
+
+def test_students_take_their_link_rows(db):
+    assert bulk_delete(FakeClient(db), 'students', ['s1', 's1', '', 's2']) == ['s1', 's2']
+    assert [row['student_id'] for row in db['students']] == ['s3']
+    assert db['student_parents'] == [{'student_id': 's3', 'parent_id': 'p2'}]
+
+
+def test_classes_take_their_rosters(db):
+    bulk_delete(FakeClient(db), 'classes', ['c1'])
+    assert [row['class_id'] for row in db['classes']] == ['c2']
+    assert db['class_students'] == [{'class_id': 'c2', 'student_id': 's1'}]
+
+
+def test_waitlisted_class_is_not_refilled_while_deleted(db):
+    # Roster first would let the trigger promote s2 into c1 and the classes delete hit the FK
+    bulk_delete(FakeClient(db), 'classes', ['c1', 'c2'])
+    assert db['classes'] == [] and db['class_students'] == [] and db['class_waitlist'] == []
+
+
+def test_waitlisted_student_is_not_seated_while_deleted(db):
+    # Deleting s1 frees seats in c1 and c2 that s2 and s3 wait for; s2 is deleted too, s3 is not
+    bulk_delete(FakeClient(db), 'students', ['s1', 's2'])
+    assert [row['student_id'] for row in db['students']] == ['s3']
+    assert db['class_waitlist'] == []
+    assert sorted((row['class_id'], row['student_id']) for row in db['class_students']) == [('c1', 's3'), ('c2', 's3')]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2])
+def test_waitlisted_student_in_a_later_chunk(db, chunk_size):
+    bulk_delete(FakeClient(db), 'students', ['s1', 's2', 's3'], chunk_size=chunk_size)
+    assert db['students'] == [] and db['class_students'] == [] and db['class_waitlist'] == []
+
+
+def test_without_the_waitlist_table(db):
+    del db['class_waitlist']
+    bulk_delete(FakeClient(db), 'classes', ['c1'])
+    bulk_delete(FakeClient(db), 'students', ['s1'])
+    assert db['class_students'] == []
+    assert [row['class_id'] for row in db['classes']] == ['c2']
+
+
+def test_parents_detach_their_logins(db):
+    bulk_delete(FakeClient(db), 'parents', ['p1'])
+    assert [row['parent_id'] for row in db['parents']] == ['p2']
+    assert all(row['parent_id'] != 'p1' for row in db['student_parents'])
+    assert [(row['user_id'], row['parent_id']) for row in db['users']] == [('u1', None), ('u2', 'p2'), ('u3', None)]
+    assert len(db['students']) == 3
+
+
+def test_foreign_keys_are_enforced(db):
+    # The fixture would catch a cascade that leaves references behind
+    with pytest.raises(ForeignKeyViolation):
+        Query(db, 'parents').delete().in_('parent_id', ['p2']).execute()
+
+
+def test_unsupported_table(db):
+    assert 'users' not in CASCADE_DELETES
+    with pytest.raises(ValueError):
+        bulk_delete(FakeClient(db), 'users', ['u1'])
@@ -0,0 +1,306 @@
+"""normalize.py against verbatim copies of the normalizers it replaced (app.py / import_class.py
+before the shared module), on the repo's CSVs and on edge cases, scalar and column (_series) variants.
+Both sides must return the same value, or raise the same exception type."""
+import re
+from pathlib import Path
+from typing import List, Optional
+
+import pandas as pd
+import pytest
+
+import normalize
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+# Baseline copies: the code as it was, minus logging and comments. Do not "fix" these
+
+def baseline_format_phone(phone):
+    if not phone:
+        return ""
+    digits = ''.join(filter(str.isdigit, phone))
+    if len(digits) != 10:
+        return phone
+    return f"({digits[:3]}){digits[3:6]}-{digits[6:]}"
+
+
+def baseline_parse_student_name(name):
+    if not name or not isinstance(name, str):
+        return None, None
+    name = name.strip().strip('"')
+    match = re.match(r"([^,]+),\s*([^\(]+)(?:\s*\((.+)\))?", name)
+    if not match:
+        return None, None
+    last_name = match.group(1).strip()
+    first_name = match.group(2).strip()
+    first_name = match.group(3).strip() if match.group(3) else first_name
+    return first_name, last_name
+
+
+def baseline_normalize_grade(grade):
+    if not grade or not isinstance(grade, str):
+        return None
+    grade = grade.strip().lower()
+    if 'kindergarten' in grade:
+        return 'K'
+    match = re.match(r"(\d+)(?:st|nd|rd|th)\s*grade", grade)
+    if match:
+        return match.group(1)
+    if grade.isdigit():
+        return grade
+    return None
+
+
+def baseline_clean_string(s: str) -> str:
+    if not s:
+        return s
+    s = s.replace('\xa0', ' ')
+    s = re.sub(r'\s+', ' ', s)
+    s = s.replace('–', '-').replace('—', '-')
+    return s.strip()
+
+
+def baseline_normalize_grade_level(grade: str) -> List[str]:
+    grade = baseline_clean_string(grade).replace('"', '')
+    if not grade:
+        return []
+    valid_grades = ['K', '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12']
+
+    def grade_to_str(g: str) -> Optional[str]:
+        g = g.strip().lower()
+        if g == 'k':
+            return 'K'
+        match = re.search(r'\d+', g)
+        if match:
+            num = match.group()
+            if num in valid_grades:
+                return num
+        return None
+
+    if '-' in grade:
+        try:
+            start, end = grade.split('-')
+            start_num = grade_to_str(start)
+            end_num = grade_to_str(end)
+            if start_num is None or end_num is None:
+                return []
+            start_idx = valid_grades.index(start_num)
+            end_idx = valid_grades.index(end_num)
+            if start_idx > end_idx:
+                return [start_num] if start_num in valid_grades else []
+            return valid_grades[start_idx:end_idx + 1]
+        except Exception:
+            return []
+    if ',' in grade:
+        try:
+            grades = [grade_to_str(g) for g in grade.split(',')]
+            grades = [g for g in grades if g in valid_grades]
+            if not grades:
+                return []
+            return sorted(set(grades))
+        except Exception:
+            return []
+    grade_str = grade_to_str(grade)
+    if grade_str in valid_grades:
+        return [grade_str]
+    return []
+
+
+def baseline_parse_teacher_name(teacher: str):
+    teacher = baseline_clean_string(teacher).strip()
+    if not teacher or teacher == '':
+        return None, None
+    match = re.match(r'([^,]+),\s*([^\(]+)(?:\s*\((.+)\))?', teacher.strip())
+    if not match:
+        return None, None
+    last_name, first_name, _ = match.groups()
+    return first_name.strip(), last_name.strip()
+
+
+def baseline_normalize_term(term: str) -> str:
+    term = baseline_clean_string(term).strip()
+    if term == 'S1,S2':
+        return 'Both'
+    elif term == 'S1':
+        return 'Semester 1'
+    elif term == 'S2':
+        return 'Semester 2'
+    return term
+
+
+def baseline_parse_schedule(schedule: str):
+    schedule = baseline_clean_string(schedule)
+    if not schedule or schedule in ['* not scheduled', 'MM', '- MM']:
+        return None, None
+    days = []
+    blocks = []
+    entries = [s.strip() for s in schedule.split(',')]
+    for entry in entries:
+        dash_count = entry.count('-')
+        day = None
+        if dash_count == 0 and re.match(r'B\d', entry):
+            day = 1
+        elif dash_count == 1 and re.match(r'-\s*B\d', entry):
+            day = 2
+        elif dash_count == 2 and re.match(r'--\s*B\d', entry):
+            day = 3
+        elif dash_count == 3 and re.match(r'---\s*B\d', entry):
+            day = 4
+        if day and day not in days:
+            days.append(day)
+        block_match = re.search(r'B(\d)', entry)
+        if block_match:
+            block = int(block_match.group(1))
+            if block not in blocks:
+                blocks.append(block)
+    return sorted(days) if days else None, blocks
+
+
+def baseline_parse_student_count_max(count_max: str):
+    count_max = baseline_clean_string(count_max).strip()
+    if count_max == '* no students':
+        return 0, None
+    match = re.match(r'(\d+)\s*/\s*(\d+)', count_max)
+    if match:
+        return int(match.group(1)), int(match.group(2))
+    return None, None
+
+
+PAIRS = {
+    'format_phone': (baseline_format_phone, normalize.format_phone),
+    'parse_student_name': (baseline_parse_student_name, normalize.parse_student_name),
+    'parse_teacher_name': (baseline_parse_teacher_name, normalize.parse_teacher_name),
+    'normalize_grade': (baseline_normalize_grade, normalize.normalize_grade),
+    'normalize_grade_level': (baseline_normalize_grade_level, normalize.normalize_grade_level),
+    'clean_string': (baseline_clean_string, normalize.clean_string),
+    'normalize_term': (baseline_normalize_term, normalize.normalize_term),
+    'parse_schedule': (baseline_parse_schedule, normalize.parse_schedule),
+    'parse_student_count_max': (baseline_parse_student_count_max, normalize.parse_student_count_max),
+}
+# Column variants of the class import normalizers, and what they parse a missing cell (None/NaN) as;
+# every row must match the baseline scalar
+SERIES_PAIRS = {
+    'clean_string': (normalize.clean_string_series, None),
+    'normalize_term': (normalize.normalize_term_series, ''),
+    'parse_schedule': (normalize.parse_schedule_series, ''),
+    'parse_teacher_name': (normalize.parse_teacher_name_series, ''),
+    'parse_student_count_max': (normalize.parse_student_count_max_series, ''),
+}
+
+
+def outcome(func, value):
+    try:
+        return 'ok', func(value)
+    except Exception as e:
+        return 'raises', type(e)
+
+
+def csv_column(name: str, column: str, **kwargs) -> List:
+    frame = pd.read_csv(ROOT / name, dtype=str, encoding='utf-8-sig', keep_default_na=False, **kwargs)
+    frame.columns = frame.columns.str.strip()
+    return frame[column].tolist()
+
+
+def corpus(name: str) -> List:
+    """Every value the repo's CSVs hold for one normalizer."""
+    if name == 'format_phone':
+        return (csv_column('backups/parents_rows.csv', 'phone') + csv_column('backups/students_rows.csv', 'phone')
+                + csv_column('backups/teachers_rows.csv', 'phone') + csv_column('parents.csv', 'Phone'))
+    if name == 'parse_student_name':
+        rows = pd.read_csv(ROOT / 'backups/students_rows.csv', dtype=str, keep_default_na=False)
+        return (csv_column('VLA_students_bak.csv', 'StudentName')
+                + pd.read_csv(ROOT / 'VLA_students.csv', dtype=str, header=None, encoding='utf-8-sig')[0].tolist()
+                + [f"{last}, {first}" for first, last in zip(rows['first_name'], rows['last_name'])])
+    if name == 'parse_teacher_name':
+        return csv_column('VLA_classes.csv', 'Teacher') + csv_column('VLA_classes_bak.csv', 'Teacher')
+    if name == 'normalize_grade':
+        return (csv_column('VLA_students_bak.csv', 'Grade') + csv_column('students.csv', 'Grade')
+                + pd.read_csv(ROOT / 'VLA_students.csv', dtype=str, header=None, encoding='utf-8-sig')[1].tolist())
+    if name == 'normalize_grade_level':
+        return csv_column('VLA_classes.csv', 'Grade Level') + csv_column('VLA_classes_bak.csv', 'Grade Level')
+    if name == 'normalize_term':
+        return csv_column('VLA_classes.csv', 'Term') + csv_column('VLA_classes_bak.csv', 'Term')
+    if name == 'parse_schedule':
+        return csv_column('VLA_classes.csv', 'Schedule') + csv_column('VLA_classes_bak.csv', 'Schedule')
+    if name == 'parse_student_count_max':
+        return (csv_column('VLA_classes.csv', 'Student Count/Max')
+                + csv_column('VLA_classes_bak.csv', 'Student Count/Max'))
+    return csv_column('VLA_classes.csv', 'Class Name') + csv_column('VLA_classes_bak.csv', 'Class Name')
+
+
+EDGE_CASES = [
+    None, '', ' ', float('nan'), '\xa0', 'N/A',
+    # phones: formatted, padded, extensions, country code, too short, letters
+    '2567141891', ' (256) 714-1891', '256.714.1891', '(256)714-1891 x12', '256-714-1891 ext. 3',
+    '+1 256 714 1891', '714-1891', 'CALL ME',
+    # names: nickname, quotes, extra commas, no comma, mixed case, non-breaking space
+    'Avery, Davissa (Dee)', '" Avery, Davissa"', 'de la Cruz, Ana Maria', 'Smith,John', 'Smith, John, Jr',
+    'McDONALD, jAMES', 'Madonna', 'Pfeil,\xa0Teandra', 'Smith, (Bo)',
+    # grades: words, ordinals, mixed case, ranges, lists, out of range, dashes
+    'Kindergarten', 'KINDERGARTEN', 'Pre-Kindergarten', '3rd Grade', '3RD GRADE', '3rd grade ', '11th  Grade',
+    '7', '07', '13', 'K', 'k', 'K-12', 'k-5', '1st-2nd', '12-K', '1-2-3', '1st – 3rd', '1st—3rd',
+    '1st, 2nd', '2nd,1st,2nd', '10, 9', 'K, 1', 'x, y', '"K-2"',
+    # terms: both semesters spelled every way, case, padding, non-breaking space, other labels
+    'S1,S2', 'S1, S2', 'S1 ,S2', ' S1,S2 ', 'S1,\xa0S2', 'S1', 's1', 'S1\xa0', 'S2', 'S2,S1', 'Both', 'Fall 2025',
+    # schedules: one block per day, dash counts, mixed days and blocks, repeats, unscheduled markers
+    'B1', '- B1', '-- B2', '--- B3', '---- B4', '-B1', '--B2', 'B1, B2', '- B5, B6', 'B1, - B2, -- B3, --- B4',
+    '- B1, B1', 'B1,B1', '-- B2, - B2', 'B12', 'b1', 'B', ' - B1 ', 'B1 - B2', 'M/W B1', '\xa0- B1',
+    '* not scheduled', 'MM', '- MM', '-- MM', 'TBD',
+    # counts: spacing, no students, non-numeric, partial, extra parts, signs, decimals, other digits
+    '10 / 15', '10/15', ' 3 /  20 ', '0 / 0', '* no students', '*  no students', '* No Students', 'ten / 15',
+    '10 /', '/ 15', '10 / 15 / 20', '-1 / 5', '1.5 / 3', '10 / 15 (waitlist 2)', '\uff11 / \uff15',
+]
+
+
+@pytest.mark.parametrize('name', sorted(PAIRS))
+def test_matches_baseline_on_repo_csvs(name):
+    baseline, current = PAIRS[name]
+    values = corpus(name)
+    assert values, f"no {name} values found in the repo CSVs"
+    mismatches = [(value, outcome(baseline, value), outcome(current, value)) for value in values
+                  if outcome(baseline, value) != outcome(current, value)]
+    assert not mismatches, mismatches[:10]
+
+
+@pytest.mark.parametrize('name', sorted(PAIRS))
+@pytest.mark.parametrize('value', EDGE_CASES, ids=repr)
+def test_matches_baseline_on_edge_cases(name, value):
+    baseline, current = PAIRS[name]
+    # Twice: the second call is served from the memo cache
+    assert outcome(current, value) == outcome(baseline, value)
+    assert outcome(current, value) == outcome(baseline, value)
+
+
+def frame_rows(parsed) -> List:
+    """A column variant's result as one plain value (Series) or tuple (DataFrame) per row, NA as None."""
+    def plain(value):
+        return None if not isinstance(value, list) and pd.isna(value) else value
+
+    if isinstance(parsed, pd.Series):
+        return [plain(value) for value in parsed]
+    return [tuple(plain(value) for value in row) for row in parsed.itertuples(index=False)]
+
+
+@pytest.mark.parametrize('name', sorted(SERIES_PAIRS))
+def test_series_variants_match_baseline(name):
+    baseline, _ = PAIRS[name]
+    vectorized, missing = SERIES_PAIRS[name]
+    # Repo values plus the edge cases that are strings, then missing values in both spellings
+    values = corpus(name) + [value for value in EDGE_CASES if isinstance(value, str)] + ['', None, float('nan')]
+    series = pd.Series(values, dtype=object)
+    expected = [baseline(missing if pd.isna(value) else value) for value in series]
+    assert frame_rows(vectorized(series)) == expected
+    # Repeated values are parsed once and broadcast; a shuffled index must come back aligned
+    shuffled = series.sample(frac=1, random_state=0)
+    assert frame_rows(vectorized(shuffled)) == [expected[i] for i in shuffled.index]
+
+
+@pytest.mark.parametrize('column, scalar, vectorized', [
+    (csv_column('parents.csv', 'Phone'), normalize.format_phone, normalize.format_phone_series),
+    (csv_column('VLA_students_bak.csv', 'Grade'), normalize.normalize_grade, normalize.normalize_grade_series),
+    (csv_column('VLA_classes.csv', 'Grade Level'), normalize.normalize_grade_level,
+     normalize.normalize_grade_level_series),
+])
+def test_column_variants_match_scalars(column, scalar, vectorized):
+    series = pd.Series(column + [None], dtype=object).fillna('')
+    assert vectorized(series).tolist() == [scalar(value) for value in series]
@@ -0,0 +1,83 @@
+"""Who a tuition ledger covers, on the SQLite, pandas and database function paths: the whole school
+only with all_students, otherwise one parent's students, and nobody for a parent login whose parent
+record is gone (parent_id NULL)."""
+import json
+import sqlite3
+
+import pytest
+
+from pricing import (PricingTable, compute_tuition_ledger, ledger_function_params, scope_ledger,
+                     sqlite_tuition_ledger)
+
+STUDENTS = [
+    {'student_id': 's1', 'first_name': 'Ann', 'last_name': 'Lee', 'grade_level': '3'},
+    {'student_id': 's2', 'first_name': 'Bo', 'last_name': 'Lee', 'grade_level': '5'},
+    {'student_id': 's3', 'first_name': 'Cy', 'last_name': 'Ray', 'grade_level': 'K'},
+]
+STUDENT_PARENTS = [
+    {'student_id': 's1', 'parent_id': 'p1'},
+    {'student_id': 's2', 'parent_id': 'p1'},
+    {'student_id': 's3', 'parent_id': 'p2'},
+]
+CLASS_STUDENTS = [
+    {'class_id': 'c1', 'student_id': 's1', 'program_type': 'enrichment'},
+    {'class_id': 'c1', 'student_id': 's2', 'program_type': 'enrichment'},
+    {'class_id': 'c1', 'student_id': 's3', 'program_type': 'enrichment'},
+]
+CLASSES = [{'class_id': 'c1', 'days': [1, 3]}]
+
+# (parent_id, all_students) -> students on the ledger
+SCOPES = [
+    ((None, True), ['s1', 's2', 's3']),
+    (('p1', False), ['s1', 's2']),
+    (('p2', False), ['s3']),
+    (('gone', False), []),
+    ((None, False), []),
+]
+
+
+@pytest.fixture
+def table():
+    band = {'enrichment': 10.0}
+    return PricingTable.from_bands({'K': band, '1-2': band, '3-8': band, '9-12': band},
+                                   academic_fee=100.0, sibling_rate=0.1, school_year='2025-2026', version='test')
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE students (student_id, first_name, last_name, grade_level)')
+    conn.execute('CREATE TABLE student_parents (student_id, parent_id)')
+    conn.execute('CREATE TABLE class_students (class_id, student_id, program_type)')
+    conn.execute('CREATE TABLE classes (class_id, days)')
+    conn.executemany('INSERT INTO students VALUES (:student_id, :first_name, :last_name, :grade_level)', STUDENTS)
+    conn.executemany('INSERT INTO student_parents VALUES (:student_id, :parent_id)', STUDENT_PARENTS)
+    conn.executemany('INSERT INTO class_students VALUES (:class_id, :student_id, :program_type)', CLASS_STUDENTS)
+    conn.executemany('INSERT INTO classes VALUES (?, ?)', [(c['class_id'], json.dumps(c['days'])) for c in CLASSES])
+    yield conn
+    conn.close()
+
+
+@pytest.mark.parametrize('scope, expected', SCOPES)
+def test_sqlite_ledger_scope(conn, table, scope, expected):
+    assert [row['student_id'] for row in sqlite_tuition_ledger(conn, table, *scope)] == expected
+
+
+@pytest.mark.parametrize('scope, expected', SCOPES)
+def test_computed_ledger_scope(table, scope, expected):
+    ledger = compute_tuition_ledger(table, STUDENTS, STUDENT_PARENTS, CLASS_STUDENTS, CLASSES)
+    assert sorted(scope_ledger(ledger, STUDENT_PARENTS, *scope)['student_id']) == expected
+
+
+def test_paths_agree_on_amounts(conn, table):
+    ledger = compute_tuition_ledger(table, STUDENTS, STUDENT_PARENTS, CLASS_STUDENTS, CLASSES)
+    computed = {row['student_id']: row['amount'] for row in ledger.to_dict('records')}
+    in_sqlite = {row['student_id']: row['amount'] for row in sqlite_tuition_ledger(conn, table, all_students=True)}
+    assert in_sqlite == pytest.approx(computed)
+
+
+def test_function_params_default_to_no_one(table):
+    # An orphaned parent login passes for_parent=None; without all_students that must not mean everyone
+    params = ledger_function_params(table)
+    assert params['for_parent'] is None and params['all_students'] is False
+    assert ledger_function_params(table, all_students=True)['all_students'] is True
@@ -0,0 +1,56 @@
+"""versions.SharedCounters under gunicorn --preload conditions: the counter file is opened before the
+workers fork, and every worker bumps from several threads. No bump may be lost."""
+import os
+import threading
+
+import pytest
+
+import versions
+
+pytestmark = pytest.mark.skipif(versions.fcntl is None or not hasattr(os, 'fork'), reason='needs flock and fork')
+
+WORKERS = 4
+THREADS = 4
+BUMPS = 2000
+
+
+def bump_from_threads(counters):
+    def run():
+        for _ in range(BUMPS):
+            counters.bump('students')
+
+    threads = [threading.Thread(target=run) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_forked_workers_do_not_lose_bumps(tmp_path):
+    counters = versions.SharedCounters(str(tmp_path / 'versions'), ('students', 'classes'))
+    counters.bump('classes')  # the parent has used its own descriptor before forking
+    children = []
+    for _ in range(WORKERS):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                bump_from_threads(counters)
+            finally:
+                os._exit(0)
+        children.append(pid)
+    bump_from_threads(counters)
+    for pid in children:
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+    assert counters.get('students') == (WORKERS + 1) * THREADS * BUMPS
+    assert counters.get('classes') == 1
+
+
+def test_reopened_file_keeps_generation(tmp_path):
+    path = str(tmp_path / 'versions')
+    first = versions.SharedCounters(path, ('students',))
+    first.bump('students')
+    # A later process (or a restart) with more tables grows the file and keeps existing counts
+    second = versions.SharedCounters(path, ('students', 'class_waitlist'))
+    assert second.generation == first.generation
+    assert second.get('students') == 1 and second.get('class_waitlist') == 0
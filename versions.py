@@ -0,0 +1,166 @@
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no flock, counters stay per process
+    fcntl = None
+
+from snapshot import SNAPSHOT_TABLES
+
+logger = logging.getLogger(__name__)
+
+# Per-table data versions. Write routes bump the tables they touch; readers fold the
+# versions into ETags and cache keys so a write invalidates everything derived from it.
+#
+# Counters live in a small memory-mapped file shared by every worker on the host, so a write
+# served by one worker invalidates the caches of all of them and reading a version is a plain
+# memory read. Only changes made outside the app (another host, the Supabase dashboard) still
+# wait for the TTL epoch to roll over. Without the shared file (no flock, unwritable path) the
+# counters fall back to this process only and the TTL is the only cross-worker signal.
+DATA_VERSION_FILE = os.getenv('DATA_VERSION_FILE', os.path.join(tempfile.gettempdir(), 'school-admin-versions'))
+VERSION_TABLES = tuple(SNAPSHOT_TABLES)
+
+_SLOT = struct.Struct('<Q')
+
+
+class SharedSlots:
+    """uint64 slots in a memory-mapped file shared by every process that opens the same path.
+
+    The file starts with one more slot holding a random generation, written when the file is
+    created, so counters restarting from zero (file deleted, host rebooted) never reproduce an old
+    version tuple. Reads are plain memory reads; read-modify-writes go through locked().
+
+    flock only excludes other open file descriptions, so each process locks through a descriptor it
+    opened itself (one inherited across fork, e.g. gunicorn --preload, would be shared with the
+    parent and every sibling), and a thread lock orders the threads of one process.
+    """
+
+    def __init__(self, path: str, count: int):
+        size = _SLOT.size * (count + 1)
+        self._path = path
+        self._owner = (os.getpid(), os.open(path, os.O_RDWR | os.O_CREAT, 0o600), threading.Lock())
+        with self.locked():
+            fd = self._owner[1]
+            current = os.fstat(fd).st_size
+            if current == 0:
+                os.write(fd, _SLOT.pack(uuid.uuid4().int & (2 ** 64 - 1)))
+            if current < size:
+                os.ftruncate(fd, size)
+            # MAP_SHARED: a forked child keeps seeing (and writing) the same pages
+            self._map = mmap.mmap(fd, size)
+        self.generation = format(_SLOT.unpack_from(self._map, 0)[0], '016x')[:8]
+
+    def _process_lock(self) -> Tuple[int, threading.Lock]:
+        """(descriptor, thread lock) belonging to this process, reopened after a fork."""
+        pid, fd, lock = self._owner
+        if pid != os.getpid():
+            with _reopen_lock:
+                pid, fd, lock = self._owner
+                if pid != os.getpid():
+                    os.close(fd)  # the parent's description; its locks are unaffected
+                    fd, lock = os.open(self._path, os.O_RDWR), threading.Lock()
+                    self._owner = (os.getpid(), fd, lock)
+        return fd, lock
+
+    @contextmanager
+    def locked(self):
+        fd, lock = self._process_lock()
+        with lock:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+
+    def get(self, index: int) -> int:
+        return _SLOT.unpack_from(self._map, (index + 1) * _SLOT.size)[0]
+
+    def set(self, index: int, value: int) -> None:
+        """Unlocked write; wrap read-modify-write sequences in locked()."""
+        _SLOT.pack_into(self._map, (index + 1) * _SLOT.size, value)
+
+
+def _reset_reopen_lock() -> None:
+    # A child starts with one thread; a copy of the lock held by another parent thread would never be released
+    global _reopen_lock
+    _reopen_lock = threading.Lock()
+
+
+_reopen_lock = threading.Lock()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_reopen_lock)
+
+
+class SharedCounters:
+    """Named counters over SharedSlots, one slot per name."""
+
+    def __init__(self, path: str, names: Tuple[str, ...]):
+        self.slots = {name: index for index, name in enumerate(names)}
+        self._store = SharedSlots(path, len(names))
+        self.generation = self._store.generation
+
+    def bump(self, name: str) -> None:
+        index = self.slots[name]
+        with self._store.locked():
+            self._store.set(index, self._store.get(index) + 1)
+
+    def get(self, name: str) -> int:
+        return self._store.get(self.slots[name])
+
+
+def _open_shared():
+    if fcntl is None:
+        return None
+    try:
+        return SharedCounters(DATA_VERSION_FILE, VERSION_TABLES)
+    except OSError as e:
+        logger.warning(f"Data versions not shared across workers ({DATA_VERSION_FILE}): {str(e)}")
+        return None
+
+
+_shared = _open_shared()
+# Coherent counters make a long TTL safe; per-process ones need a short one
+DATA_VERSION_TTL = int(os.getenv('DATA_VERSION_TTL', '900' if _shared else '60'))
+
+_boot_id = _shared.generation if _shared else uuid.uuid4().hex[:8]
+_versions: Dict[str, int] = {}
+_lock = threading.Lock()
+_listeners: List[Callable[..., None]] = []
+
+
+def bump_version(*tables: str) -> None:
+    """Record that rows in these tables changed."""
+    with _lock:
+        for table in tables:
+            if _shared and table in _shared.slots:
+                _shared.bump(table)
+            else:
+                _versions[table] = _versions.get(table, 0) + 1
+    for listener in _listeners:
+        listener(*tables)
+
+
+def on_bump(listener: Callable[..., None]) -> None:
+    """Also call listener(*tables) on every bump, e.g. to mark a local replica's copies stale."""
+    _listeners.append(listener)
+
+
+def _version(table: str) -> int:
+    if _shared and table in _shared.slots:
+        return _shared.get(table)
+    return _versions.get(table, 0)
+
+
+def data_version(*tables: str) -> Tuple:
+    """Opaque, hashable version of the given tables; changes whenever any of them is written."""
+    epoch = int(time.time() // DATA_VERSION_TTL) if DATA_VERSION_TTL > 0 else 0
+    return (_boot_id, epoch) + tuple(_version(table) for table in tables)